@@ -0,0 +1,4 @@
+"""Benchmark harness: synthetic mailboxes and fake IMAP, SMTP and OpenAI-compatible servers.
+
+Run ``python -m benchmarks.run --help`` for the available scenarios.
+"""
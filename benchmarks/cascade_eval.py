@@ -0,0 +1,131 @@
+"""Evaluate the model cascade against a labelled sample and sweep its thresholds.
+
+    python -m benchmarks.cascade_eval labelled.jsonl --task importance --results cascade_results.json
+    python -m benchmarks.cascade_eval labelled.jsonl --task categorize --thresholds 0.6,0.7,0.8,0.9
+
+Each line of the sample is an email record (subject, from, body, ...) with a
+``label`` holding the expected fields, e.g. {"needs_response": true} for
+importance or {"category": "sponsorship"} for categorize. Both tiers classify
+every email once and the answers are cached in ``--results``, so thresholds
+can be tuned again offline without calling the models.
+"""
+import argparse
+import json
+import os
+import sys
+
+DEFAULT_THRESHOLDS = (0.5, 0.6, 0.7, 0.75, 0.8, 0.9)
+
+
+def load_samples(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _analyzers(task):
+    """(analyze function, result model, uncertain function) for a classification task"""
+    from email_agents import cascade
+    from email_agents.models import EmailAnalysis, EmailImportance
+
+    if task == "importance":
+        import important_email2
+
+        return important_email2.analyze_email_importance, EmailImportance, cascade.importance_uncertain
+    import send_mail2
+
+    return send_mail2.analyze_email, EmailAnalysis, cascade.category_uncertain
+
+
+def collect(llm, task, samples):
+    """Classify every sample on both tiers; return per-sample answers and per-tier cost and latency"""
+    from email_agents import metrics
+    from email_agents.llm_backend import FAST_TIER, FULL_TIER
+
+    analyze = _analyzers(task)[0]
+    run = metrics.start_run(f"cascade_eval_{task}")
+
+    def both(email):
+        answers = {}
+        for tier in (FAST_TIER, FULL_TIER):
+            result = analyze(llm, email, tier)
+            answers[tier] = result.model_dump() if result is not None else None
+        return answers
+
+    answers = llm.map(task, both, samples)
+    tiers = {tier: {"cost_usd": values["cost_usd"], "latency_p50": values["latency_seconds"]["p50"],
+                    "calls": values["calls"]}
+             for tier, values in run.to_dict()["llm"]["by_tier"].items()}
+    return {"task": task, "answers": answers, "tiers": tiers}
+
+
+def _correct(label, analysis):
+    return analysis is not None and all(analysis.get(key) == value for key, value in label.items())
+
+
+def sweep(task, samples, results, thresholds=DEFAULT_THRESHOLDS):
+    """Escalation rate, accuracy and estimated cost of the cascade at each threshold"""
+    _, model, uncertain = _analyzers(task)
+    tiers = results["tiers"]
+    count = max(len(samples), 1)
+    fast_cost = tiers.get("fast", {}).get("cost_usd", 0.0) / count
+    full_cost = tiers.get("full", {}).get("cost_usd", 0.0) / count
+    options = [{}] if task != "importance" else [{"escalate_medium": True}, {"escalate_medium": False}]
+
+    rows = []
+    for threshold in thresholds:
+        for option in options:
+            escalated = correct = 0
+            for sample, answers in zip(samples, results["answers"]):
+                fast = model(**answers["fast"]) if answers["fast"] else None
+                reason = uncertain(sample, fast, min_confidence=threshold, **option)
+                final = answers["full"] if reason else answers["fast"]
+                escalated += bool(reason)
+                correct += _correct(sample["label"], final)
+            rows.append({
+                "min_confidence": threshold,
+                **option,
+                "escalation_rate": round(escalated / count, 4),
+                "accuracy": round(correct / count, 4),
+                "cost_per_email": round(fast_cost + full_cost * escalated / count, 8),
+            })
+    baselines = {
+        tier: round(sum(_correct(s["label"], a[tier]) for s, a in zip(samples, results["answers"])) / count, 4)
+        for tier in ("fast", "full")
+    }
+    return {"fast_only_accuracy": baselines["fast"], "full_only_accuracy": baselines["full"],
+            "full_only_cost_per_email": round(full_cost, 8), "thresholds": rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("samples", help="labelled JSONL sample")
+    parser.add_argument("--task", choices=("importance", "categorize"), default="importance")
+    parser.add_argument("--thresholds", default=",".join(str(t) for t in DEFAULT_THRESHOLDS))
+    parser.add_argument("--results", default="cascade_results.json",
+                        help="cached answers of both tiers; reused when it exists")
+    args = parser.parse_args(argv)
+
+    samples = load_samples(args.samples)
+    if os.path.exists(args.results):
+        with open(args.results, encoding="utf-8") as f:
+            results = json.load(f)
+    else:
+        from email_agents.llm_backend import LLMRouter
+
+        llm = LLMRouter.from_env()
+        if not llm.has_cascade(args.task):
+            parser.error(f"set LLM_{args.task.upper()}_FAST_MODEL or LLM_{args.task.upper()}_FAST_BACKEND")
+        results = collect(llm, args.task, samples)
+        with open(args.results, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if results["task"] != args.task or len(results["answers"]) != len(samples):
+        parser.error(f"{args.results} does not match this sample and task; delete it to classify again")
+
+    report = sweep(args.task, samples, results, [float(t) for t in args.thresholds.split(",") if t])
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,421 @@
+"""A small in-process IMAP4rev1 server for benchmarks and tests.
+
+It implements the subset of the protocol the email agents use (LOGIN, SELECT,
+SEARCH, FETCH, UID, LOGOUT) over plain TCP, with an injectable per-command
+latency and counters for the traffic it served.
+"""
+import re
+import socketserver
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email import message_from_bytes
+from email.utils import parseaddr
+
+_BODY_RE = re.compile(r"^BODY(\.PEEK)?\[([A-Z0-9.]*)\](?:<(\d+)\.(\d+)>)?$")
+_TOKEN_RE = re.compile(r'\s*(?:"((?:[^"\\]|\\.)*)"|(\()|(\))|([^\s()"]+))')
+
+
+def parse_args(text):
+    """Tokenize IMAP command arguments into nested lists of strings"""
+    stack = [[]]
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match:
+            break
+        pos = match.end()
+        quoted, opening, closing, atom = match.groups()
+        if opening:
+            stack.append([])
+        elif closing:
+            group = stack.pop()
+            stack[-1].append(group)
+        elif quoted is not None:
+            stack[-1].append(quoted.replace('\\"', '"'))
+        elif atom is not None:
+            stack[-1].append(atom)
+    while len(stack) > 1:
+        group = stack.pop()
+        stack[-1].append(group)
+    return stack[0]
+
+
+def parse_sequence_set(text, maximum):
+    """Expand an IMAP sequence set such as ``1:3,7,9:*``"""
+    numbers = []
+    for part in text.split(","):
+        if ":" in part:
+            low, high = part.split(":", 1)
+            low = maximum if low == "*" else int(low)
+            high = maximum if high == "*" else int(high)
+            low, high = min(low, high), max(low, high)
+            numbers.extend(range(low, high + 1))
+        else:
+            numbers.append(maximum if part == "*" else int(part))
+    return numbers
+
+
+def imap_date(value):
+    return datetime.strptime(value, "%d-%b-%Y").date()
+
+
+def format_internaldate(value):
+    return value.strftime("%d-%b-%Y %H:%M:%S %z")
+
+
+class FakeMessage:
+    """A stored message with its UID, flags and internal date"""
+
+    def __init__(self, uid, data, internaldate, flags=()):
+        self.uid = uid
+        self.data = data
+        self.internaldate = internaldate
+        self.flags = set(flags)
+        self._headers = None
+
+    @property
+    def headers(self):
+        if self._headers is None:
+            end = self.data.find(b"\r\n\r\n")
+            if end < 0:
+                end = self.data.find(b"\n\n")
+            header_bytes = self.data if end < 0 else self.data[:end]
+            self._headers = message_from_bytes(header_bytes)
+        return self._headers
+
+    @property
+    def header_bytes(self):
+        end = self.data.find(b"\r\n\r\n")
+        if end >= 0:
+            return self.data[:end + 4]
+        end = self.data.find(b"\n\n")
+        return self.data if end < 0 else self.data[:end + 2]
+
+
+class FakeMailStore:
+    """Mailboxes shared by all connections to a fake IMAP server"""
+
+    def __init__(self, mailboxes=None):
+        self.mailboxes = {}
+        self.uidnext = {}
+        for name, messages in (mailboxes or {}).items():
+            for item in messages:
+                self.append(name, item["data"], item.get("internaldate"), item.get("flags", ()))
+
+    def append(self, mailbox, data, internaldate=None, flags=()):
+        messages = self.mailboxes.setdefault(mailbox, [])
+        uid = self.uidnext.get(mailbox, 1)
+        self.uidnext[mailbox] = uid + 1
+        internaldate = internaldate or datetime.now(timezone.utc)
+        messages.append(FakeMessage(uid, data, internaldate, flags))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.selected = None
+
+    @property
+    def server_state(self):
+        return self.server.fake
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.wfile.write(data)
+        self.server_state.count("bytes_sent", len(data))
+
+    def handle(self):
+        self.send("* OK [CAPABILITY IMAP4rev1] Fake IMAP ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.decode("utf-8", errors="replace").rstrip("\r\n")
+            if not line:
+                continue
+            tag, _, rest = line.partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+            self.server_state.count("commands")
+            self.server_state.count(f"command_{command.lower()}")
+            if self.server_state.latency:
+                time.sleep(self.server_state.latency)
+            if command == "UID":
+                command, _, args = args.partition(" ")
+                command = "UID " + command.upper()
+            handler = getattr(self, "cmd_" + command.lower().replace(" ", "_"), None)
+            if handler is None:
+                self.send(f"{tag} BAD Unknown command {command}\r\n")
+                continue
+            try:
+                if handler(tag, args) is False:
+                    return
+            except Exception as e:  # Report protocol errors to the client like a real server
+                self.send(f"{tag} BAD {e}\r\n")
+
+    def cmd_capability(self, tag, args):
+        extra = " X-GM-EXT-1" if self.server_state.gmail else ""
+        self.send(f"* CAPABILITY IMAP4rev1 AUTH=PLAIN{extra}\r\n{tag} OK CAPABILITY completed\r\n")
+
+    def cmd_noop(self, tag, args):
+        self.send(f"{tag} OK NOOP completed\r\n")
+
+    def cmd_login(self, tag, args):
+        self.server_state.count("logins")
+        self.send(f"{tag} OK LOGIN completed\r\n")
+
+    def cmd_logout(self, tag, args):
+        self.send(f"* BYE Logging out\r\n{tag} OK LOGOUT completed\r\n")
+        return False
+
+    def cmd_select(self, tag, args):
+        name = " ".join(str(token) for token in parse_args(args)) or args.strip()
+        if name not in self.server_state.store.mailboxes:
+            self.selected = None
+            self.send(f"{tag} NO Mailbox does not exist\r\n")
+            return
+        self.selected = name
+        messages = self.server_state.store.mailboxes[name]
+        uidnext = self.server_state.store.uidnext.get(name, 1)
+        self.send(
+            f"* {len(messages)} EXISTS\r\n* 0 RECENT\r\n"
+            f"* OK [UIDVALIDITY 1] UIDs valid\r\n* OK [UIDNEXT {uidnext}] Predicted next UID\r\n"
+            f"{tag} OK [READ-WRITE] SELECT completed\r\n"
+        )
+
+    cmd_examine = cmd_select
+
+    def _messages(self):
+        if self.selected is None:
+            raise ValueError("No mailbox selected")
+        return self.server_state.store.mailboxes[self.selected]
+
+    # -- SEARCH --------------------------------------------------------------
+
+    def _match(self, message, seq, criteria):
+        """Consume criteria tokens, returning (matched, remaining tokens)"""
+        key = criteria[0]
+        rest = criteria[1:]
+        if isinstance(key, list):
+            matched = True
+            inner = key
+            while inner:
+                result, inner = self._match(message, seq, inner)
+                matched = matched and result
+            return matched, rest
+        upper = key.upper()
+        if upper == "ALL":
+            return True, rest
+        if upper == "NOT":
+            result, rest = self._match(message, seq, rest)
+            return not result, rest
+        if upper == "OR":
+            first, rest = self._match(message, seq, rest)
+            second, rest = self._match(message, seq, rest)
+            return first or second, rest
+        if upper in ("SINCE", "BEFORE", "ON"):
+            day = imap_date(rest[0])
+            internal = message.internaldate.date()
+            result = {"SINCE": internal >= day, "BEFORE": internal < day, "ON": internal == day}[upper]
+            return result, rest[1:]
+        if upper in ("SENTSINCE", "SENTBEFORE"):
+            day = imap_date(rest[0])
+            internal = message.internaldate.date()
+            return (internal >= day if upper == "SENTSINCE" else internal < day), rest[1:]
+        if upper == "UNSEEN":
+            return "\\Seen" not in message.flags, rest
+        if upper == "SEEN":
+            return "\\Seen" in message.flags, rest
+        if upper in ("FROM", "TO", "SUBJECT"):
+            value = str(message.headers.get(upper.title(), "")).lower()
+            return rest[0].lower() in value, rest[1:]
+        if upper == "UID":
+            uids = parse_sequence_set(rest[0], self._messages()[-1].uid if self._messages() else 0)
+            return message.uid in uids, rest[1:]
+        if upper == "X-GM-RAW":
+            return self._match_gmail_raw(message, rest[0]), rest[1:]
+        if key[0].isdigit() or key[0] == "*":
+            return seq in parse_sequence_set(key, len(self._messages())), rest
+        raise ValueError(f"Unsupported search key {key}")
+
+    def _match_gmail_raw(self, message, query):
+        """Support the ``newer_than:Nh/d`` and ``-from:x`` parts of Gmail search"""
+        for term in query.split():
+            negate = term.startswith("-")
+            term = term.lstrip("-")
+            if term.startswith("newer_than:"):
+                amount = term.split(":", 1)[1]
+                unit = {"h": "hours", "d": "days"}[amount[-1]]
+                cutoff = datetime.now(timezone.utc) - timedelta(**{unit: int(amount[:-1])})
+                result = message.internaldate >= cutoff
+            elif term.startswith("from:"):
+                result = term.split(":", 1)[1].lower() in parseaddr(str(message.headers.get("From", "")))[1].lower()
+            elif term == "is:unread":
+                result = "\\Seen" not in message.flags
+            else:
+                continue
+            if result == negate:
+                return False
+        return True
+
+    def _search(self, args):
+        tokens = parse_args(args)
+        if tokens and isinstance(tokens[0], str) and tokens[0].upper() == "CHARSET":
+            tokens = tokens[2:]
+        self.server_state.count("searches")
+        found = []
+        for seq, message in enumerate(self._messages(), 1):
+            remaining = tokens
+            matched = True
+            while remaining:
+                result, remaining = self._match(message, seq, remaining)
+                matched = matched and result
+            if matched:
+                found.append((seq, message))
+        return found
+
+    def cmd_search(self, tag, args):
+        found = self._search(args)
+        self.send(f"* SEARCH {' '.join(str(seq) for seq, _ in found)}\r\n{tag} OK SEARCH completed\r\n".replace("SEARCH \r", "SEARCH\r"))
+
+    def cmd_uid_search(self, tag, args):
+        found = self._search(args)
+        self.send(f"* SEARCH {' '.join(str(m.uid) for _, m in found)}\r\n{tag} OK SEARCH completed\r\n".replace("SEARCH \r", "SEARCH\r"))
+
+    # -- FETCH ---------------------------------------------------------------
+
+    def _fetch_items(self, message, seq, items, uid_command):
+        parts = []
+        literal_chunks = []
+        names = [item.upper() for item in items]
+        if uid_command and "UID" not in names:
+            names.insert(0, "UID")
+        for name in names:
+            if name == "UID":
+                parts.append(f"UID {message.uid}")
+            elif name == "FLAGS":
+                parts.append(f"FLAGS ({' '.join(sorted(message.flags))})")
+            elif name == "INTERNALDATE":
+                parts.append(f'INTERNALDATE "{format_internaldate(message.internaldate)}"')
+            elif name == "RFC822.SIZE":
+                parts.append(f"RFC822.SIZE {len(message.data)}")
+            elif name == "X-GM-THRID":
+                parts.append(f"X-GM-THRID {self.server_state.thread_id(message)}")
+            elif name == "RFC822":
+                literal_chunks.append(("RFC822", message.data))
+                message.flags.add("\\Seen")
+            elif name == "RFC822.HEADER":
+                literal_chunks.append(("RFC822.HEADER", message.header_bytes))
+            elif _BODY_RE.match(name):
+                peek, section, origin, length = _BODY_RE.match(name).groups()
+                if section == "":
+                    data = message.data
+                elif section == "HEADER":
+                    data = message.header_bytes
+                else:
+                    raise ValueError(f"Unsupported body section {section}")
+                label = f"BODY[{section}]"
+                if origin is not None:
+                    data = data[int(origin):int(origin) + int(length)]
+                    label += f"<{origin}>"
+                literal_chunks.append((label, data))
+                if not peek:
+                    message.flags.add("\\Seen")
+            else:
+                raise ValueError(f"Unsupported fetch item {name}")
+
+        self.server_state.count("messages_fetched")
+        out = f"* {seq} FETCH (" + " ".join(parts)
+        if not literal_chunks:
+            self.send(out + ")\r\n")
+            return
+        chunks = [out.encode()]
+        for index, (label, data) in enumerate(literal_chunks):
+            prefix = " " if (parts or index) else ""
+            chunks.append(f"{prefix}{label} {{{len(data)}}}\r\n".encode())
+            chunks.append(data)
+            self.server_state.count("body_bytes", len(data))
+        chunks.append(b")\r\n")
+        self.send(b"".join(chunks))
+
+    def _fetch(self, tag, args, uid_command):
+        tokens = parse_args(args)
+        sequence = tokens[0]
+        items = tokens[1] if len(tokens) > 1 else []
+        if isinstance(items, str):
+            items = [items]
+        # Re-join bracketed items such as BODY.PEEK[HEADER] that contain spaces
+        items = [item if isinstance(item, str) else " ".join(item) for item in items]
+        messages = self._messages()
+        if uid_command:
+            maximum = messages[-1].uid if messages else 0
+            wanted = set(parse_sequence_set(sequence, maximum))
+            selected = [(seq, m) for seq, m in enumerate(messages, 1) if m.uid in wanted]
+        else:
+            wanted = parse_sequence_set(sequence, len(messages))
+            selected = [(seq, messages[seq - 1]) for seq in wanted if 0 < seq <= len(messages)]
+        for seq, message in selected:
+            self._fetch_items(message, seq, items, uid_command)
+        self.send(f"{tag} OK FETCH completed\r\n")
+
+    def cmd_fetch(self, tag, args):
+        self._fetch(tag, args, uid_command=False)
+
+    def cmd_uid_fetch(self, tag, args):
+        self._fetch(tag, args, uid_command=True)
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeIMAPServer:
+    """Run a fake IMAP server on localhost in a background thread.
+
+    Use as a context manager; ``port`` holds the bound port and ``stats``
+    the per-command counters.
+    """
+
+    def __init__(self, mailboxes=None, latency=0.0, gmail=False, host="127.0.0.1", port=0):
+        self.store = FakeMailStore(mailboxes)
+        self.latency = latency
+        self.gmail = gmail
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._server = _ThreadingServer((host, port), _Handler)
+        self._server.fake = self
+        self.host, self.port = self._server.server_address
+        self._thread = None
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+    def thread_id(self, message):
+        """Gmail-style thread id derived from the first Message-ID in References"""
+        references = str(message.headers.get("References", "")).split()
+        root = references[0] if references else str(message.headers.get("Message-ID", message.uid))
+        with self._lock:
+            return self._threads.setdefault(root, 1000 + len(self._threads))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
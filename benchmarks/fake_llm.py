@@ -0,0 +1,304 @@
+"""A fake OpenAI-compatible chat completions endpoint with latency and rate limits.
+
+Replies are deterministic and derived from simple keywords in the email being
+analyzed, so the classifiers produce a realistic mix of results.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PERSONAL_MARKERS = ("could you", "are you free", "had a question", "any update", "contract")
+SPONSOR_MARKERS = ("sponsor",)
+BUSINESS_MARKERS = ("partnership", "collaboration", "proposal")
+AUTOMATED_MARKERS = ("no-reply", "unsubscribe", "automated notification", "digest", "news@")
+
+
+def estimate_tokens(text):
+    """Roughly four characters per token, like the OpenAI tokenizers on English text"""
+    return max(1, len(text) // 4)
+
+
+def _email_section(prompt):
+    """Return the part of a classifier prompt that holds the email itself"""
+    match = re.search(r"Email to analyze:(.*?)(?:\n\s*(?:Classify|Categorize)\b|$)", prompt, re.DOTALL)
+    return (match.group(1) if match else prompt).lower()
+
+
+def classify_importance(section):
+    if any(marker in section for marker in AUTOMATED_MARKERS):
+        return {"importance": "low", "reason": "The message was sent by an automated system or mailing list and asks nothing of the recipient personally, so it can safely be ignored.", "needs_response": False,
+                "time_sensitive": False, "topics": ["notification", "newsletter", "automated update", "marketing"], "confidence": 0.95}
+    if any(marker in section for marker in PERSONAL_MARKERS):
+        return {"importance": "high", "reason": "A real person is asking the recipient directly for an answer or a decision, and the conversation cannot move forward without a reply.", "needs_response": True,
+                "time_sensitive": "tomorrow" in section or "friday" in section, "topics": ["request", "scheduling", "follow-up"],
+                "confidence": 0.9}
+    if any(marker in section for marker in SPONSOR_MARKERS + BUSINESS_MARKERS):
+        return {"importance": "medium", "reason": "A real sender proposes a business opportunity that could be valuable, although it is not urgent and could wait a few days for a reply.",
+                "needs_response": True, "time_sensitive": False, "topics": ["business", "partnership", "opportunity", "proposal"], "confidence": 0.7}
+    return {"importance": "low", "reason": "The email does not contain anything the recipient needs to act on or reply to, and it does not appear to be time-sensitive.", "needs_response": False,
+            "time_sensitive": False, "topics": ["general", "information", "other"], "confidence": 0.6}
+
+
+def classify_category(section):
+    company = None
+    match = re.search(r"@([a-z0-9-]+)\.", section)
+    if match:
+        company = match.group(1).title()
+    if any(marker in section for marker in SPONSOR_MARKERS):
+        return {"category": "sponsorship", "confidence": 0.92, "reason": "The sender represents a company and explicitly offers to sponsor content, naming a product they would like to see promoted.",
+                "company_name": company, "topic": "sponsored video"}
+    if any(marker in section for marker in BUSINESS_MARKERS):
+        return {"category": "business_inquiry", "confidence": 0.86, "reason": "The sender proposes a partnership or collaboration between their company and the recipient, which is a business inquiry.",
+                "company_name": company, "topic": "partnership"}
+    return {"category": "other", "confidence": 0.7, "reason": "The email is neither a sponsorship offer nor a business inquiry; it is a personal, automated or otherwise unrelated message.",
+            "company_name": None, "topic": None}
+
+
+def _follow_limits(reply, prompt, skip_reason):
+    """Keep to the reason length and topic count the prompt asks for, like an obedient model"""
+    limit = re.search(r"at most (\d+) characters", prompt)
+    if skip_reason and "null when" in prompt:
+        reply["reason"] = None
+    elif limit and len(reply["reason"]) > int(limit.group(1)):
+        reply["reason"] = reply["reason"][:int(limit.group(1))].rsplit(" ", 1)[0].rstrip(",;") + "."
+    topics = re.search(r"1-(\d+) key topics", prompt)
+    if topics and "topics" in reply:
+        reply["topics"] = reply["topics"][:int(topics.group(1))]
+    return reply
+
+
+def _off_schema(reply, rng):
+    """Mistakes models make in plain JSON mode, which strict structured outputs rule out"""
+    mistake = rng.randrange(3)
+    if mistake == 0:
+        return "```json\n" + json.dumps(reply, indent=2) + "\n```"
+    label = "importance" if "importance" in reply else "category"
+    if mistake == 1:
+        reply = dict(reply, **{label: reply[label].upper()})
+    else:
+        reply = {key: value for key, value in reply.items() if key != label}
+    return json.dumps(reply, indent=2)
+
+
+def fake_reply(messages, response_format=None, rng=None, off_schema_rate=0.0):
+    """Build a plausible reply for the email agents' prompts.
+
+    Without a strict ``json_schema`` response format, ``off_schema_rate`` of
+    the classifier replies do not match the schema.
+    """
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system").lower()
+    prompt = "\n".join(m.get("content", "") for m in messages if m.get("role") == "user")
+    if "prioritize" in system or "categorizer" in system:
+        if "prioritize" in system:
+            reply = classify_importance(_email_section(prompt))
+            reply = _follow_limits(reply, prompt, reply["importance"] == "low")
+        else:
+            reply = classify_category(_email_section(prompt))
+            reply = _follow_limits(reply, prompt, reply["category"] == "other")
+        strict = (response_format or {}).get("type") == "json_schema"
+        if not strict and off_schema_rate and (rng or random).random() < off_schema_rate:
+            return _off_schema(reply, rng or random)
+        # Plain JSON mode replies tend to be pretty-printed; structured outputs are compact
+        return json.dumps(reply, separators=(",", ":")) if strict else json.dumps(reply, indent=2)
+    if "opportunities" in system:
+        return "HIGH VALUE\n1. Partnership proposal - personalized and specific.\n\nMASS MARKETING/GENERIC\n- Remaining emails."
+    last = messages[-1].get("content", "") if messages else ""
+    drafts = [m.get("content", "") for m in messages if m.get("role") == "assistant"]
+    edit = re.match(r"Edit your draft above: (.+)", last)
+    if edit and drafts:
+        # A small edit: the previous draft with one sentence added before the sign-off
+        body, sign_off, rest = drafts[-1].rpartition("\n\nBest regards")
+        return f"{body}\n\n(Edited: {edit.group(1).strip()}){sign_off}{rest}" if sign_off else drafts[-1]
+    subject = re.search(r"Subject: (.+)", prompt)
+    subject = subject.group(1).strip() if subject else "your email"
+    return f"Subject: Re: {subject}\n\nThanks for reaching out, I'll get back to you shortly.\n\nBest regards,\nKris"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+
+        prompt_text = "".join(m.get("content", "") or "" for m in request.get("messages", []))
+        prompt_tokens = estimate_tokens(prompt_text)
+        cached_tokens = fake.cached_tokens(request.get("prompt_cache_key"), prompt_text, prompt_tokens)
+        allowed, headers = fake.admit(prompt_tokens)
+        if not allowed:
+            fake.count("rate_limited")
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}, headers)
+            return
+        if fake.should_fail():
+            fake.count("server_errors")
+            self._send_json(500, {"error": {"message": "Internal error", "type": "server_error"}}, headers)
+            return
+
+        content = fake.reply(request)
+        completion_tokens = estimate_tokens(content)
+        fake.wait(completion_tokens)
+        fake.count("requests")
+        fake.count("prompt_tokens", prompt_tokens)
+        fake.count("completion_tokens", completion_tokens)
+        fake.count("cached_tokens", cached_tokens)
+        self._send_json(200, {
+            "id": f"chatcmpl-fake-{fake.stats.get('requests', 0)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }, headers)
+
+
+class FakeLLMServer:
+    """Run a fake OpenAI-compatible server on localhost.
+
+    ``latency`` (plus up to ``jitter``) seconds are spent on every successful
+    completion, and ``token_latency`` more per completion token generated.
+    ``rpm``/``tpm`` enforce per-minute request and token limits with 429
+    responses carrying ``Retry-After`` and ``x-ratelimit-*`` headers,
+    ``error_rate`` injects random 500 errors and ``off_schema_rate`` makes
+    that share of plain JSON mode classifier replies miss the schema.
+    Prompt caching follows OpenAI's rules: prompts of ``cache_min_tokens`` or
+    more reuse the longest prefix seen before under the same
+    ``prompt_cache_key``, in blocks of 128 tokens.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, rpm=None, tpm=None, error_rate=0.0, seed=0,
+                 host="127.0.0.1", port=0, token_latency=0.0, off_schema_rate=0.0, cache_min_tokens=1024):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_latency = token_latency
+        self.off_schema_rate = off_schema_rate
+        self.cache_min_tokens = cache_min_tokens
+        self._prompts = {}
+        self.rpm = rpm
+        self.tpm = tpm
+        self.error_rate = error_rate
+        self.stats = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._requests = float(rpm or 0)
+        self._tokens = float(tpm or 0)
+        self._refilled = time.monotonic()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self.host, self.port = self._server.server_address
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+    def should_fail(self):
+        with self._lock:
+            return self.error_rate > 0 and self._rng.random() < self.error_rate
+
+    def cached_tokens(self, key, prompt_text, prompt_tokens):
+        """Tokens of this prompt served from the cache of earlier prompts with the same key"""
+        with self._lock:
+            seen = self._prompts.setdefault(key, [])
+            prefix = max((len(os.path.commonprefix([prompt_text, earlier])) for earlier in seen), default=0)
+            seen.append(prompt_text)
+            del seen[:-32]
+        if prompt_tokens < self.cache_min_tokens:
+            return 0
+        return estimate_tokens(prompt_text[:prefix]) // 128 * 128 if prefix else 0
+
+    def reply(self, request):
+        with self._lock:
+            draw = self._rng.random()
+            rng = random.Random(draw)
+        return fake_reply(request.get("messages", []), request.get("response_format"), rng, self.off_schema_rate)
+
+    def wait(self, completion_tokens=0):
+        if self.latency or self.jitter or self.token_latency:
+            with self._lock:
+                extra = self._rng.random() * self.jitter
+            time.sleep(self.latency + extra + completion_tokens * self.token_latency)
+
+    def admit(self, tokens):
+        """Token-bucket admission control, returning (allowed, rate limit headers)"""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._refilled
+            self._refilled = now
+            headers = {}
+            allowed = True
+            retry_after = 0.0
+            if self.rpm:
+                self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+                if self._requests < 1:
+                    allowed = False
+                    retry_after = max(retry_after, (1 - self._requests) * 60 / self.rpm)
+            if self.tpm:
+                self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+                if self._tokens < tokens:
+                    allowed = False
+                    retry_after = max(retry_after, (tokens - self._tokens) * 60 / self.tpm)
+            if allowed:
+                if self.rpm:
+                    self._requests -= 1
+                if self.tpm:
+                    self._tokens -= tokens
+            if self.rpm:
+                headers["x-ratelimit-limit-requests"] = str(self.rpm)
+                headers["x-ratelimit-remaining-requests"] = str(int(self._requests))
+                headers["x-ratelimit-reset-requests"] = f"{max(0.0, (self.rpm - self._requests) * 60 / self.rpm):.3f}s"
+            if self.tpm:
+                headers["x-ratelimit-limit-tokens"] = str(self.tpm)
+                headers["x-ratelimit-remaining-tokens"] = str(int(self._tokens))
+                headers["x-ratelimit-reset-tokens"] = f"{max(0.0, (self.tpm - self._tokens) * 60 / self.tpm):.3f}s"
+            if not allowed:
+                headers["Retry-After"] = f"{retry_after:.3f}"
+            return allowed, headers
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,94 @@
+"""A minimal in-process SMTP server that records delivered messages"""
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def send(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        fake = self.server.fake
+        self.send("220 fake-smtp ESMTP ready")
+        envelope = {"from": None, "to": []}
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            fake.count("commands")
+            if fake.latency:
+                time.sleep(fake.latency)
+            if verb in ("EHLO", "HELO"):
+                self.send("250-fake-smtp\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME")
+            elif verb == "AUTH":
+                fake.count("logins")
+                self.send("235 Authentication successful")
+            elif verb == "MAIL":
+                envelope = {"from": command.split(":", 1)[1].strip(), "to": []}
+                self.send("250 OK")
+            elif verb == "RCPT":
+                envelope["to"].append(command.split(":", 1)[1].strip())
+                self.send("250 OK")
+            elif verb == "DATA":
+                self.send("354 End data with <CR><LF>.<CR><LF>")
+                chunks = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    chunks.append(data[1:] if data.startswith(b"..") else data)
+                fake.record(envelope, b"".join(chunks))
+                self.send("250 OK queued")
+            elif verb in ("RSET", "NOOP"):
+                self.send("250 OK")
+            elif verb == "QUIT":
+                self.send("221 Bye")
+                return
+            else:
+                self.send("502 Command not implemented")
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeSMTPServer:
+    """Run a fake SMTP server on localhost; delivered mail is kept in ``messages``"""
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.messages = []
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._server = _ThreadingServer((host, port), _Handler)
+        self._server.fake = self
+        self.host, self.port = self._server.server_address
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+    def record(self, envelope, data):
+        with self._lock:
+            self.messages.append({"from": envelope["from"], "to": list(envelope["to"]), "data": data})
+        self.count("messages")
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,103 @@
+"""Measure reading a local mbox file and Maildir directory.
+
+    python -m benchmarks.local_ingest --messages 50000 --mailbox-hours 720 --window 72
+
+A synthetic mailbox spread over ``--mailbox-hours`` is written once as an
+mbox file and as a Maildir. For each, the scan alone (finding messages and
+their dates, skipping those outside the window) and the full ingestion into
+records (scan, parse and write, as the scripts do) are timed. The Python
+memory peak of a scan shows that the mbox is not loaded into memory; the
+mapped file pages are not counted in it.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.synthetic_mailbox import generate_mailbox, write_maildir, write_mbox
+from email_agents import local_mail, metrics
+
+
+def measure_scan(source, since):
+    """(seconds, messages in the window, bytes copied) for one scan"""
+    start = time.perf_counter()
+    count = size = 0
+    for _, raw in local_mail.scan(source, since):
+        count += 1
+        size += len(raw)
+    return time.perf_counter() - start, count, size
+
+
+def scan_peak(source, since):
+    """Peak Python memory of a scan in MB"""
+    tracemalloc.start()
+    for _ in local_mail.scan(source, since):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def measure_ingest(source, hours, path):
+    """(seconds, records, total body length) for a full read into records"""
+    start = time.perf_counter()
+    emails = local_mail.read_inbox(source, hours, path)
+    seconds = time.perf_counter() - start
+    # The mbox was written with LF line endings, the Maildir keeps CRLF
+    return seconds, len(emails), sum(len(email["body"].replace("\r\n", "\n")) for email in emails)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--mailbox-hours", type=float, default=720, help="hours the mailbox is spread over")
+    parser.add_argument("--window", type=float, default=72, help="hours of mail to ingest")
+    parser.add_argument("--attachment-ratio", type=float, default=0.1)
+    parser.add_argument("--attachment-size", type=int, default=50_000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Writing {args.messages} messages...", file=sys.stderr)
+        messages = generate_mailbox(args.messages, hours=args.mailbox_hours, attachment_ratio=args.attachment_ratio,
+                                    attachment_size=args.attachment_size)
+        sources = {"mbox": os.path.join(tmp, "inbox.mbox"), "maildir": os.path.join(tmp, "Maildir")}
+        write_mbox(messages, sources["mbox"])
+        write_maildir(messages, sources["maildir"])
+        total_mb = sum(len(message["data"]) for message in messages) / 2**20
+        del messages
+
+        since = datetime.now(timezone.utc) - timedelta(hours=args.window)
+        results = []
+        checksums = set()
+        for kind, source in sources.items():
+            metrics.start_run(kind)
+            scan_seconds, in_window, copied = measure_scan(source, since)
+            ingest_seconds, records, checksum = measure_ingest(source, args.window, os.path.join(tmp, "out.txt"))
+            checksums.add((records, checksum))
+            result = {"source": kind, "scan_seconds": round(scan_seconds, 3),
+                      "scan_messages_per_second": round(args.messages / scan_seconds),
+                      "scan_mb_per_second": round(total_mb / scan_seconds, 1),
+                      "in_window": in_window, "copied_mb": round(copied / 2**20, 1),
+                      "scan_peak_python_mb": round(scan_peak(source, since), 1),
+                      "ingest_seconds": round(ingest_seconds, 3),
+                      "ingest_messages_per_second": round(records / ingest_seconds)}
+            print(f"  {kind}: scan {result['scan_seconds']:.2f}s ({result['scan_messages_per_second']} msg/s, "
+                  f"{result['scan_mb_per_second']} MB/s, peak {result['scan_peak_python_mb']} MB), "
+                  f"{records} in window ingested in {result['ingest_seconds']:.2f}s "
+                  f"({result['ingest_messages_per_second']} msg/s)", file=sys.stderr)
+            results.append(result)
+        if len(checksums) > 1:
+            raise SystemExit("mbox and Maildir ingestion returned different messages")
+
+    json.dump({"messages": args.messages, "mailbox_hours": args.mailbox_hours, "window_hours": args.window,
+               "total_mb": round(total_mb, 1), "results": results}, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
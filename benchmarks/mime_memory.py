@@ -0,0 +1,123 @@
+"""Compare peak memory and time of full-tree MIME parsing against mime_parse.parse_message.
+
+    python -m benchmarks.mime_memory --messages 200 --attachment-size 5000000
+
+Peak Python heap is measured with tracemalloc per message; the raw message
+bytes themselves are excluded, as they exist before either parser runs.
+Peak RSS is measured too, with each parser in its own child process. The
+mailbox is written to a file and the child reads and parses one message at a
+time, as a fetch would, so its peak RSS is the interpreter plus the largest
+raw message plus what the parser builds from it.
+"""
+import argparse
+import email
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic_mailbox import generate_mailbox
+from email_agents.mime_parse import MAX_MESSAGE_BYTES, parse_message
+
+
+def legacy_parse(raw):
+    """The original fetch_recent_inbox_emails parsing: full message tree, eager decoding"""
+    msg = email.message_from_bytes(raw)
+    body = ""
+    if msg.is_multipart():
+        for part in msg.walk():
+            if part.get_content_type() == "text/plain" and not part.get("Content-Disposition"):
+                charset = part.get_content_charset() or "utf-8"
+                body = part.get_payload(decode=True).decode(charset, errors="replace")
+                break
+    else:
+        charset = msg.get_content_charset() or "utf-8"
+        body = msg.get_payload(decode=True).decode(charset, errors="replace")
+    return {"subject": msg.get("Subject", ""), "from": msg.get("From", ""),
+            "received": msg.get("Date", ""), "body": body.strip()}
+
+
+def measure(parse, messages):
+    peak = 0
+    start = time.perf_counter()
+    for item in messages:
+        tracemalloc.start()
+        parse(item["data"])
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {"seconds": round(time.perf_counter() - start, 4), "peak_heap_mb": round(peak / 2**20, 2)}
+
+
+def _peak_rss_kb():
+    # ru_maxrss survives fork and exec on Linux, so a spawned child would report the parent's
+    # peak; VmHWM belongs to the child's own address space
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _rss_child(name, path, sizes, max_bytes, queue):
+    """Child process body: peak RSS before and after parsing every message in ``path`` with one parser"""
+    parse = legacy_parse if name == "legacy" else lambda raw: parse_message(raw, max_bytes=max_bytes)
+    before = _peak_rss_kb()
+    with open(path, "rb") as f:
+        for size in sizes:
+            parse(f.read(size))
+    after = _peak_rss_kb()
+    queue.put({"peak_rss_mb": round(after / 1024, 1), "rss_growth_mb": round((after - before) / 1024, 1)})
+
+
+def measure_rss(name, path, sizes, max_bytes):
+    """Peak RSS of a fresh process parsing the messages in ``path`` with the ``legacy`` or ``streaming`` parser"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_rss_child, args=(name, path, sizes, max_bytes, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--attachment-ratio", type=float, default=0.8)
+    parser.add_argument("--attachment-size", type=int, default=5_000_000)
+    parser.add_argument("--max-bytes", type=int, default=MAX_MESSAGE_BYTES,
+                        help="per-message cap for the streaming parser (0 = no cap)")
+    args = parser.parse_args(argv)
+
+    messages = generate_mailbox(args.messages, attachment_ratio=args.attachment_ratio,
+                                attachment_size=args.attachment_size)
+    result = {
+        "messages": args.messages,
+        "mailbox_mb": round(sum(len(m["data"]) for m in messages) / 2**20, 1),
+        "legacy": measure(legacy_parse, messages),
+        "streaming": measure(lambda raw: parse_message(raw, max_bytes=args.max_bytes), messages),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "mailbox.bin")
+        with open(path, "wb") as f:
+            for item in messages:
+                f.write(item["data"])
+        sizes = [len(item["data"]) for item in messages]
+        del messages
+        for name in ("legacy", "streaming"):
+            result[name].update(measure_rss(name, path, sizes, args.max_bytes))
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
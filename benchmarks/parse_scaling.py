@@ -0,0 +1,72 @@
+"""Measure how MIME parsing scales with the number of worker processes.
+
+    python -m benchmarks.parse_scaling --messages 50000 --workers 0,2,4,8
+
+A synthetic corpus is parsed with parse_pool.parse_stream, once in this
+process (0 workers) and once per pool size, and the throughput and speedup
+over in-process parsing are reported. Pool timings include starting the
+workers. The corpus is generated once and reused, so only parsing is timed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from benchmarks.synthetic_mailbox import generate_mailbox
+from email_agents.parse_pool import PARSE_BATCH, parse_stream
+
+
+def measure(raws, workers, batch):
+    """Parse every message, reading each body, and return (seconds, checksum)"""
+    start = time.perf_counter()
+    checksum = 0
+    for _, record in parse_stream(enumerate(raws), workers=workers, batch=batch):
+        checksum += len(record.body)
+    return time.perf_counter() - start, checksum
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50_000)
+    parser.add_argument("--workers", default=None,
+                        help="comma-separated pool sizes (default: 0, 2, 4, ... up to the CPU count)")
+    parser.add_argument("--batch", type=int, default=PARSE_BATCH, help="messages per worker task")
+    parser.add_argument("--attachment-ratio", type=float, default=0.1)
+    parser.add_argument("--attachment-size", type=int, default=20_000)
+    args = parser.parse_args(argv)
+
+    cpus = os.cpu_count() or 1
+    if args.workers:
+        sizes = [int(size) for size in args.workers.split(",") if size]
+    else:
+        sizes = [0] + [size for size in (2, 4, 8, 16, 32, 64) if size <= cpus] + ([cpus] if cpus > 2 else [])
+    sizes = sorted(set(sizes))
+
+    print(f"Generating {args.messages} messages...", file=sys.stderr)
+    raws = [message["data"] for message in generate_mailbox(
+        args.messages, attachment_ratio=args.attachment_ratio, attachment_size=args.attachment_size)]
+    results = []
+    baseline = None
+    expected = None
+    for workers in sizes:
+        seconds, checksum = measure(raws, workers, args.batch)
+        if expected is None:
+            expected = checksum
+        elif checksum != expected:
+            raise SystemExit(f"{workers} workers parsed different bodies than {sizes[0]} workers")
+        baseline = baseline or seconds
+        result = {"workers": workers, "seconds": round(seconds, 3),
+                  "messages_per_second": round(args.messages / seconds), "speedup": round(baseline / seconds, 2)}
+        print(f"  {workers:>3} workers: {result['seconds']:.2f}s, {result['messages_per_second']} msg/s, "
+              f"x{result['speedup']}", file=sys.stderr)
+        results.append(result)
+
+    json.dump({"messages": args.messages, "batch": args.batch, "cpu_count": cpus,
+               "total_mb": round(sum(map(len, raws)) / 2**20, 1), "results": results}, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Compare the memory held by parsed emails as dicts and as EmailRecords.
+
+    python -m benchmarks.record_memory --messages 10000
+
+Every message of a synthetic mailbox is parsed and kept, the way a run holds
+its inbox. Retained heap and allocated blocks are measured with tracemalloc
+and sys.getallocatedblocks; the raw message bytes are excluded, as they exist
+before either representation is built.
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks.synthetic_mailbox import generate_mailbox
+from email_agents.mime_parse import parse_message
+
+
+def measure(build, messages):
+    """Build one item per message and report what the list of them retains"""
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    start = time.perf_counter()
+    items = [build(message["data"]) for message in messages]
+    seconds = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()
+    result = {
+        "seconds": round(seconds, 4),
+        "retained_mb": round(retained / 2**20, 2),
+        "peak_mb": round(peak / 2**20, 2),
+        "bytes_per_message": round(retained / len(messages)),
+        "blocks_per_message": round((sys.getallocatedblocks() - blocks) / len(messages), 1),
+    }
+    del items
+    return result
+
+
+def _decoded(raw):
+    record = parse_message(raw)
+    record.body
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--attachment-ratio", type=float, default=0.1)
+    parser.add_argument("--attachment-size", type=int, default=50_000)
+    args = parser.parse_args(argv)
+
+    messages = generate_mailbox(args.messages, attachment_ratio=args.attachment_ratio,
+                                attachment_size=args.attachment_size)
+    result = {
+        "messages": args.messages,
+        # The dicts every stage passed around before: body decoded while parsing
+        "dicts": measure(lambda raw: parse_message(raw).to_dict(), messages),
+        # Records whose body nobody has read yet, e.g. older messages of a thread
+        "records_undecoded": measure(parse_message, messages),
+        "records_decoded": measure(_decoded, messages),
+    }
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
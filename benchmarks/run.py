@@ -0,0 +1,328 @@
+"""End-to-end benchmarks for the email agents.
+
+Every scenario runs the real entry points against a synthetic mailbox served
+by the fake IMAP/SMTP/LLM servers. The workload runs in a fresh child process
+so wall time and peak RSS belong to the agent alone, while the servers (and
+their traffic counters) live in this process.
+
+    python -m benchmarks.run run --sizes 100,1000 --output bench_results.json
+    python -m benchmarks.run run --scenarios daily_scripts,pipeline --mailbox-hours 72
+    python -m benchmarks.run run --scenarios find_important_emails --cascade-model gpt-4.1-nano
+    python -m benchmarks.run run --llm-token-latency 0.01 --llm-off-schema-rate 0.03 --env LLM_STRICT_SCHEMA=0
+    python -m benchmarks.run run --cassette bench_cassette.jsonl --cassette-mode record   # then: replay
+    python -m benchmarks.run compare base.json bench_results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.fake_imap import FakeIMAPServer
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.fake_smtp import FakeSMTPServer
+from benchmarks.synthetic_mailbox import generate_mailbox, generate_sent_mailbox
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = (100, 1000, 10000)
+SENT_FOLDER = "Sent"
+
+
+def _prepare_report_input(workdir, size):
+    """Write a categorized_emails.json with ``size`` business/sponsorship emails"""
+    filler = "We would love to work with you on an upcoming campaign. " * 12
+    emails = []
+    for index in range(size):
+        category = "sponsorship" if index % 2 else "business_inquiry"
+        emails.append({
+            "subject": f"Opportunity #{index}",
+            "from": f"Partner {index} <partner{index}@company{index % 50}.com>",
+            "received": datetime.now(timezone.utc).isoformat(),
+            "body": filler,
+            "analysis": {"category": category, "confidence": 0.9, "reason": "Synthetic.",
+                         "company_name": f"Company{index % 50}", "topic": "campaign"},
+        })
+    data = {
+        "last_updated": datetime.now().isoformat(),
+        "sponsorship_emails": [e for e in emails if e["analysis"]["category"] == "sponsorship"],
+        "business_emails": [e for e in emails if e["analysis"]["category"] == "business_inquiry"],
+        "other_emails": [],
+    }
+    with open(os.path.join(workdir, "categorized_emails.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+@contextlib.contextmanager
+def patched_transports():
+    """Connect the scripts' IMAP4_SSL/SMTP_SSL calls to the plain-text fake servers"""
+    import imaplib
+    import smtplib
+
+    original_imap, original_smtp = imaplib.IMAP4_SSL, smtplib.SMTP_SSL
+    imaplib.IMAP4_SSL = lambda host, port, *args, **kwargs: imaplib.IMAP4(host, port)
+    smtplib.SMTP_SSL = lambda host, port, *args, **kwargs: smtplib.SMTP(host, port)
+    try:
+        yield
+    finally:
+        imaplib.IMAP4_SSL, smtplib.SMTP_SSL = original_imap, original_smtp
+
+
+def _combine(runs, name):
+    """One run record covering several script runs made back to back"""
+    from email_agents import metrics
+
+    combined = metrics.RunMetrics(name)
+    for run in runs:
+        for stage, totals in run.stages.items():
+            combined.add_stage_time(stage, totals["seconds"], totals["calls"])
+        for counter, amount in run.counters.items():
+            combined.count(counter, amount)
+        for name, values in run.timings.items():
+            for seconds in values:
+                combined.observe(name, seconds)
+        combined.llm_calls.extend(run.llm_calls)
+    return combined
+
+
+def _workload(scenario, env, workdir, queue):
+    """Child process body: run one scenario and report wall time and peak RSS"""
+    import resource
+
+    sys.path.insert(0, ROOT)
+    import important_email2
+    import pipeline
+    import send_mail2
+    from email_agents import metrics
+
+    # The scripts load .env on import; the benchmark environment must win
+    os.environ.update(env)
+    os.chdir(workdir)
+    runs = []
+
+    def daily_scripts():
+        """The documented workflow: each script fetches and classifies on its own"""
+        for entry_point in (important_email2.find_important_emails, send_mail2.sort_emails,
+                            send_mail2.generate_opportunity_report):
+            entry_point()
+            runs.append(metrics.current())
+
+    entry_points = {
+        "find_important_emails": important_email2.find_important_emails,
+        "sort_emails": send_mail2.sort_emails,
+        "generate_opportunity_report": send_mail2.generate_opportunity_report,
+        "daily_scripts": daily_scripts,
+        "pipeline": lambda: pipeline.run_pipeline(respond=False),
+    }
+    with patched_transports(), contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        entry_points[scenario]()
+        elapsed = time.perf_counter() - start
+    run = _combine(runs, scenario) if runs else metrics.current()
+    record = run.to_dict()
+    queue.put({
+        "wall_seconds": elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "stages": record["stages"],
+        "llm_usage": {key: value for key, value in record["llm"].items() if key not in ("by_task", "by_model")},
+        "counters": record["counters"],
+    })
+
+
+def run_scenario(scenario, size, imap_latency=0.0, llm_latency=0.0, llm_rpm=None, llm_tpm=None,
+                 attachment_ratio=0.1, attachment_size=50_000, seed=0, mailbox_hours=20, cascade_model=None,
+                 llm_token_latency=0.0, llm_off_schema_rate=0.0, env=None, cassette=None, cassette_mode="replay"):
+    """Run one scenario at one mailbox size and return its result record.
+
+    ``cascade_model`` classifies every email with that model first and
+    escalates only uncertain results to the main model. ``env`` adds
+    settings for the agent, e.g. ``{"LLM_STRICT_SCHEMA": "0"}``. With a
+    ``cassette`` path the model calls are recorded to it or replayed from it
+    (``cassette_mode``), so replayed runs never reach the fake LLM server.
+    """
+    inbox = generate_mailbox(size, hours=mailbox_hours, seed=seed, attachment_ratio=attachment_ratio,
+                             attachment_size=attachment_size)
+    sent = generate_sent_mailbox(inbox, seed=seed)
+    mailboxes = {"INBOX": inbox, SENT_FOLDER: sent}
+    with tempfile.TemporaryDirectory() as workdir, \
+            FakeIMAPServer(mailboxes, latency=imap_latency) as imap, \
+            FakeSMTPServer() as smtp, \
+            FakeLLMServer(latency=llm_latency, rpm=llm_rpm, tpm=llm_tpm, seed=seed, token_latency=llm_token_latency,
+                          off_schema_rate=llm_off_schema_rate) as llm:
+        if scenario == "generate_opportunity_report":
+            _prepare_report_input(workdir, size)
+        agent_env = {
+            "EMAIL_USER": "me@example.com",
+            "EMAIL_PASSWORD": "benchmark",
+            "IMAP_SERVER": imap.host,
+            "IMAP_PORT": str(imap.port),
+            "IMAP_SENT_FOLDER": SENT_FOLDER,
+            "SMTP_SERVER": smtp.host,
+            "SMTP_PORT": str(smtp.port),
+            "OPENAI_API_KEY": "benchmark",
+            "OPENAI_BASE_URL": llm.base_url,
+            "LOCAL_LLM_BASE_URL": "",
+        }
+        if cascade_model:
+            agent_env["LLM_IMPORTANCE_FAST_MODEL"] = agent_env["LLM_CATEGORIZE_FAST_MODEL"] = cascade_model
+        if cassette:
+            agent_env["LLM_CASSETTE"] = os.path.abspath(cassette)
+            agent_env["LLM_CASSETTE_MODE"] = cassette_mode
+            # The synthetic mailbox is dated relative to now; everything else in the prompts is seeded
+            agent_env["LLM_CASSETTE_IGNORE"] = r"^\s*Received: .*$"
+        agent_env.update(env or {})
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        process = context.Process(target=_workload, args=(scenario, agent_env, workdir, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f"Scenario {scenario} ({size} messages) failed with exit code {process.exitcode}")
+        timings = queue.get()
+        return {
+            "scenario": scenario,
+            "messages": size,
+            "wall_seconds": round(timings["wall_seconds"], 4),
+            "messages_per_second": round(size / timings["wall_seconds"], 2) if timings["wall_seconds"] else None,
+            "peak_rss_mb": round(timings["peak_rss_mb"], 1),
+            "stages": timings["stages"],
+            "llm_usage": timings["llm_usage"],
+            "counters": timings["counters"],
+            "imap": dict(imap.stats),
+            "smtp": dict(smtp.stats),
+            "llm": dict(llm.stats),
+        }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+SCENARIOS = ("find_important_emails", "sort_emails", "generate_opportunity_report")
+
+# A full daily run: the three scripts one after another, or pipeline.py fetching once
+DAILY_SCENARIOS = ("daily_scripts", "pipeline")
+
+
+def run_benchmarks(scenarios=SCENARIOS, sizes=DEFAULT_SIZES, **options):
+    """Run every scenario at every size and return the machine-readable result document"""
+    if options.get("cassette") and options.get("cassette_mode") == "record":
+        # Every scenario runs in its own process: start the cassette once and let each one add to it
+        open(options["cassette"], "w", encoding="utf-8").close()
+        options = dict(options, cassette_mode="auto")
+    results = []
+    for scenario in scenarios:
+        for size in sizes:
+            print(f"Running {scenario} with {size} messages...", file=sys.stderr)
+            result = run_scenario(scenario, size, **options)
+            print(f"  {result['wall_seconds']:.2f}s, {result['messages_per_second']} msg/s", file=sys.stderr)
+            results.append(result)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "options": options,
+        },
+        "results": results,
+    }
+
+
+def compare(base, new, threshold=1.1):
+    """Print wall-time ratios between two result documents; return True if nothing regressed"""
+    base_index = {(r["scenario"], r["messages"]): r for r in base["results"]}
+    ok = True
+    print(f"{'scenario':32} {'messages':>8} {'base s':>9} {'new s':>9} {'ratio':>7}")
+    for result in new["results"]:
+        key = (result["scenario"], result["messages"])
+        previous = base_index.get(key)
+        if previous is None:
+            continue
+        ratio = result["wall_seconds"] / previous["wall_seconds"] if previous["wall_seconds"] else float("inf")
+        flag = "  REGRESSION" if ratio > threshold else ""
+        ok = ok and ratio <= threshold
+        print(f"{key[0]:32} {key[1]:>8} {previous['wall_seconds']:>9.3f} {result['wall_seconds']:>9.3f} {ratio:>7.2f}{flag}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run benchmark scenarios")
+    run_parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                            help=f"comma-separated; full daily runs: {', '.join(DAILY_SCENARIOS)}")
+    run_parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES))
+    run_parser.add_argument("--imap-latency", type=float, default=0.0, help="seconds added to every IMAP command")
+    run_parser.add_argument("--llm-latency", type=float, default=0.005, help="seconds spent per completion")
+    run_parser.add_argument("--llm-rpm", type=int, default=None, help="requests per minute before 429s")
+    run_parser.add_argument("--llm-tpm", type=int, default=None, help="tokens per minute before 429s")
+    run_parser.add_argument("--attachment-ratio", type=float, default=0.1)
+    run_parser.add_argument("--attachment-size", type=int, default=50_000, help="bytes per attachment")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--mailbox-hours", type=float, default=20,
+                            help="hours the synthetic inbox is spread over (72 covers every window)")
+    run_parser.add_argument("--cascade-model", default=None,
+                            help="classify with this model first and escalate uncertain emails")
+    run_parser.add_argument("--llm-token-latency", type=float, default=0.0,
+                            help="seconds per completion token generated")
+    run_parser.add_argument("--llm-off-schema-rate", type=float, default=0.0,
+                            help="share of plain JSON mode classifier replies that miss the schema")
+    run_parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                            help="setting for the agent, e.g. LLM_STRICT_SCHEMA=0 (repeatable)")
+    run_parser.add_argument("--cassette", default=None, help="record model calls to or replay them from this file")
+    run_parser.add_argument("--cassette-mode", default="replay", choices=("record", "replay", "auto"))
+    run_parser.add_argument("--output", default="bench_results.json")
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=1.1,
+                                help="wall-time ratio above which a scenario counts as a regression")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        return 0 if compare(base, new, args.threshold) else 1
+
+    document = run_benchmarks(
+        scenarios=[s for s in args.scenarios.split(",") if s],
+        sizes=[int(s) for s in args.sizes.split(",") if s],
+        imap_latency=args.imap_latency,
+        llm_latency=args.llm_latency,
+        llm_rpm=args.llm_rpm,
+        llm_tpm=args.llm_tpm,
+        attachment_ratio=args.attachment_ratio,
+        attachment_size=args.attachment_size,
+        seed=args.seed,
+        mailbox_hours=args.mailbox_hours,
+        cascade_model=args.cascade_model,
+        llm_token_latency=args.llm_token_latency,
+        llm_off_schema_rate=args.llm_off_schema_rate,
+        env=dict(item.split("=", 1) for item in args.env),
+        cassette=args.cassette,
+        cassette_mode=args.cassette_mode,
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
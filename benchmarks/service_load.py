@@ -0,0 +1,160 @@
+"""Load test the HTTP service and report p50/p99 latency per endpoint.
+
+    python -m benchmarks.service_load --clients 16 --duration 20 --llm-latency 0.2
+
+The service runs in a child process against the fake IMAP, SMTP and LLM
+servers, as ``pipeline.py serve`` would, and is synced once before the test.
+Client threads then keep one keep-alive connection each and send a mix of
+requests: mostly listing and reading needs-response emails, with drafts,
+edits, sends and the occasional sync. Latencies are measured by the clients;
+the service's own /stats are included for comparison.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.fake_imap import FakeIMAPServer
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.fake_smtp import FakeSMTPServer
+from benchmarks.run import ROOT, SENT_FOLDER, patched_transports
+from benchmarks.synthetic_mailbox import generate_mailbox, generate_sent_mailbox
+
+# (weight, method, path template, body); {id} is a random needs-response email
+MIX = [
+    (40, "GET", "/needs-response", None),
+    (20, "GET", "/needs-response/{id}", None),
+    (15, "GET", "/needs-response/{id}/draft", None),
+    (12, "POST", "/needs-response/{id}/draft", {}),
+    (8, "POST", "/needs-response/{id}/draft", {"instructions": "Make it shorter and mention Friday"}),
+    (4, "POST", "/needs-response/{id}/send", None),
+    (1, "POST", "/sync", None),
+]
+
+
+def _serve(env, workdir, workers, max_queued, queue):
+    """Child process body: run the service until terminated"""
+    sys.path.insert(0, ROOT)
+    import service
+
+    # The scripts load .env on import; the benchmark environment must win
+    os.environ.update(env)
+    os.chdir(workdir)
+    with patched_transports():
+        triage = service.TriageService.from_env(workers, max_queued)
+        server = service.make_server(triage, port=0)
+        queue.put(server.server_address[1])
+        server.serve_forever()
+
+
+def _request(connection, method, path, body=None):
+    payload = json.dumps(body).encode() if body is not None else None
+    connection.request(method, path, body=payload, headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read() or b"null")
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def run_load(port, clients, duration, seed=0):
+    """Drive the service from ``clients`` threads for ``duration`` seconds; returns samples per endpoint"""
+    setup = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+    status, job = _request(setup, "POST", "/sync")
+    while job["status"] in ("queued", "running"):
+        time.sleep(0.1)
+        job = _request(setup, "GET", f"/jobs/{job['id']}")[1]
+    if job["status"] != "done":
+        raise RuntimeError(f"Initial sync failed: {job.get('error')}")
+    ids = [item["id"] for item in _request(setup, "GET", "/needs-response")[1]["items"]]
+    if not ids:
+        raise RuntimeError("The synced mailbox has no emails needing a response")
+
+    samples = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    weights = [weight for weight, *_ in MIX]
+
+    def client(index):
+        rng = random.Random(seed + index)
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+        while time.perf_counter() < deadline:
+            _, method, template, body = rng.choices(MIX, weights)[0]
+            start = time.perf_counter()
+            status, _ = _request(connection, method, template.replace("{id}", rng.choice(ids)), body)
+            elapsed = time.perf_counter() - start
+            route = f"{method} {template}" + (" (edit)" if body and body.get("instructions") else "")
+            with lock:
+                entry = samples.setdefault(route, {"latencies": [], "status": {}})
+                entry["latencies"].append(elapsed)
+                entry["status"][status] = entry["status"].get(status, 0) + 1
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, _request(setup, "GET", "/stats")[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--workers", type=int, default=4, help="service worker pool size")
+    parser.add_argument("--max-queued", type=int, default=32, help="jobs the service queues before answering 503")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds spent per completion")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    inbox = generate_mailbox(args.messages, seed=args.seed)
+    mailboxes = {"INBOX": inbox, SENT_FOLDER: generate_sent_mailbox(inbox, seed=args.seed)}
+    with tempfile.TemporaryDirectory() as workdir, FakeIMAPServer(mailboxes) as imap, FakeSMTPServer() as smtp, \
+            FakeLLMServer(latency=args.llm_latency, seed=args.seed) as llm:
+        env = {"EMAIL_USER": "me@example.com", "EMAIL_PASSWORD": "benchmark", "IMAP_SERVER": imap.host,
+               "IMAP_PORT": str(imap.port), "IMAP_SENT_FOLDER": SENT_FOLDER, "SMTP_SERVER": smtp.host,
+               "SMTP_PORT": str(smtp.port), "OPENAI_API_KEY": "benchmark", "OPENAI_BASE_URL": llm.base_url,
+               "LOCAL_LLM_BASE_URL": ""}
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        process = context.Process(target=_serve, args=(env, workdir, args.workers, args.max_queued, queue))
+        process.start()
+        try:
+            port = queue.get(timeout=60)
+            print(f"Load testing with {args.clients} clients for {args.duration:g}s...", file=sys.stderr)
+            samples, server_stats = run_load(port, args.clients, args.duration, args.seed)
+        finally:
+            process.terminate()
+            process.join()
+        connections = {"imap_logins": imap.stats.get("logins", 0), "smtp_logins": smtp.stats.get("logins", 0),
+                       "emails_sent": smtp.stats.get("messages", 0), "llm_requests": llm.stats.get("requests", 0)}
+
+    endpoints = {}
+    for route, entry in sorted(samples.items()):
+        latencies = entry["latencies"]
+        endpoints[route] = {"requests": len(latencies),
+                            "status": {str(status): count for status, count in sorted(entry["status"].items())},
+                            "p50_ms": round(_percentile(latencies, 0.5) * 1000, 2),
+                            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2)}
+        print(f"  {route:<42} {len(latencies):>6} requests  p50 {endpoints[route]['p50_ms']:>8.2f} ms  "
+              f"p99 {endpoints[route]['p99_ms']:>8.2f} ms  {endpoints[route]['status']}", file=sys.stderr)
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    json.dump({"clients": args.clients, "duration_seconds": args.duration, "workers": args.workers,
+               "llm_latency": args.llm_latency, "requests_per_second": round(total / args.duration, 1),
+               "connections": connections, "endpoints": endpoints, "server_stats": server_stats},
+              sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""Measure cold-start import time of each entry point with ``python -X importtime``.
+
+    python -m benchmarks.startup --repeat 5 --budget-ms 150
+
+Each entry point is imported in a fresh interpreter; the best of ``--repeat``
+runs is compared with the budget and the command exits non-zero if any entry
+point is over it or imports one of the HEAVY_MODULES at startup.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ("pipeline", "important_email2", "send_mail2", "email_responder2", "service")
+
+# Dependencies that must only be imported once a command actually needs them
+HEAVY_MODULES = ("openai", "httpx", "pydantic", "imaplib", "smtplib")
+
+STARTUP_BUDGET_MS = 150
+
+
+def measure_import(module):
+    """Import ``module`` in a fresh interpreter and return (total ms, {module: cumulative ms})"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            modules[name.strip()] = int(cumulative) / 1000
+        except ValueError:
+            continue  # header line
+    return modules.get(module, 0.0), modules
+
+
+def check(entry_points=ENTRY_POINTS, repeat=3, budget_ms=STARTUP_BUDGET_MS):
+    """Best-of-``repeat`` startup time and eagerly imported heavy modules per entry point"""
+    report = {}
+    for module in entry_points:
+        runs = [measure_import(module) for _ in range(repeat)]
+        best, modules = min(runs, key=lambda run: run[0])
+        heavy = sorted(name for name in modules if name.split(".")[0] in HEAVY_MODULES)
+        report[module] = {
+            "import_ms": round(best, 1),
+            "heavy_modules": sorted({name.split(".")[0] for name in heavy}),
+            "over_budget": best > budget_ms,
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    report = check(repeat=args.repeat, budget_ms=args.budget_ms)
+    json.dump({"budget_ms": args.budget_ms, "entry_points": report}, sys.stdout, indent=2)
+    print()
+    failed = any(entry["over_budget"] or entry["heavy_modules"] for entry in report.values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
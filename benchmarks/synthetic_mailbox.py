@@ -0,0 +1,202 @@
+"""Generate realistic synthetic mailboxes for benchmarks and tests"""
+import os
+import random
+import re
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import format_datetime
+
+FIRST_NAMES = ["Anna", "Ben", "Chloe", "David", "Elena", "Farid", "Grace", "Hiro", "Isla", "Jonas"]
+LAST_NAMES = ["Smith", "Berg", "Okafor", "Tanaka", "Novak", "Silva", "Meyer", "Khan", "Rossi", "Lee"]
+COMPANIES = ["acme", "globex", "initech", "umbrella", "hooli", "vandelay", "stark", "wayne"]
+NEWSLETTERS = ["Weekly Digest", "Product Updates", "Tech Roundup", "Deals of the Day"]
+
+# Kind of message and its relative frequency in a typical inbox
+KINDS = [
+    ("newsletter", 0.35),
+    ("notification", 0.25),
+    ("personal", 0.15),
+    ("business", 0.15),
+    ("sponsorship", 0.10),
+]
+
+PERSONAL_BODIES = [
+    "Hi,\n\nCould you send me the slides from Tuesday before Friday? I need them for the board meeting.\n\nThanks,\n{name}",
+    "Hey,\n\nAre you free for a quick call tomorrow at 10? I want to go over the contract changes.\n\n{name}",
+    "Hello,\n\nI watched your latest video and had a question about the setup you used. Would you mind sharing it?\n\nBest,\n{name}",
+]
+BUSINESS_BODIES = [
+    "Hello,\n\nI'm {name} from {company}. We'd love to explore a partnership on our new analytics platform. "
+    "Would you be open to a 20 minute call next week?\n\nRegards,\n{name}",
+    "Hi there,\n\n{company} is expanding and we think a business collaboration could benefit both audiences. "
+    "Let me know if you want our proposal deck.\n\n{name}",
+]
+SPONSORSHIP_BODIES = [
+    "Hi,\n\n{company} would like to sponsor an upcoming video. Our budget is flexible and we can share product "
+    "samples ahead of time.\n\nCheers,\n{name}",
+    "Hello!\n\nWe're looking for creators to sponsor for our Q3 campaign at {company}. Are you accepting sponsorships?\n\n{name}",
+]
+FILLER = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit. Sed do eiusmod tempor incididunt ut labore et "
+    "dolore magna aliqua. Ut enim ad minim veniam, quis nostrud exercitation ullamco laboris. "
+)
+
+
+def _message_id(rng, domain):
+    """Seeded Message-ID so the same seed always yields the same mailbox"""
+    return f"<{rng.getrandbits(64):016x}@{domain}>"
+
+
+def _to_bytes(rng, msg):
+    """Serialize with seeded MIME boundaries and CRLF line endings, as an IMAP server sends it"""
+    for part in msg.walk():
+        if part.is_multipart():
+            part.set_boundary(f"=============={rng.getrandbits(64):016x}==")
+    return msg.as_bytes(policy=msg.policy.clone(linesep="\r\n"))
+
+
+def _person(rng, domain=None):
+    first = rng.choice(FIRST_NAMES)
+    last = rng.choice(LAST_NAMES)
+    domain = domain or f"{rng.choice(COMPANIES)}.com"
+    return f"{first} {last}", f"{first.lower()}.{last.lower()}@{domain}"
+
+
+def _build_message(rng, kind, date, owner, attachment_size):
+    msg = EmailMessage()
+    company = rng.choice(COMPANIES)
+    if kind == "newsletter":
+        name, address = rng.choice(NEWSLETTERS), f"news@{company}.com"
+        subject = f"{name} #{rng.randint(1, 500)}"
+        text = "\n\n".join(FILLER * rng.randint(1, 3) for _ in range(rng.randint(3, 8)))
+        msg.set_content(text)
+        msg.add_alternative(
+            "<html><body>" + "".join(f"<p>{FILLER}</p>" for _ in range(rng.randint(5, 20)))
+            + f'<a href="https://{company}.com/unsubscribe">Unsubscribe</a></body></html>',
+            subtype="html",
+        )
+        msg["List-Unsubscribe"] = f"<https://{company}.com/unsubscribe>"
+    elif kind == "notification":
+        name, address = f"{company.title()} Alerts", f"no-reply@{company}.com"
+        subject = f"Your {rng.choice(['invoice', 'order', 'login', 'report'])} #{rng.randint(1000, 9999)}"
+        msg.set_content(f"This is an automated notification.\n\n{FILLER}\n\nDo not reply to this email.")
+    else:
+        name, address = _person(rng, f"{company}.com")
+        template = {
+            "personal": PERSONAL_BODIES,
+            "business": BUSINESS_BODIES,
+            "sponsorship": SPONSORSHIP_BODIES,
+        }[kind]
+        subject = {
+            "personal": rng.choice(["Quick question", "Slides for Friday", "Call tomorrow?", "Contract changes"]),
+            "business": rng.choice(["Partnership opportunity", "Business proposal", "Collaboration idea"]),
+            "sponsorship": rng.choice(["Sponsorship inquiry", "Sponsor your next video", "Q3 campaign"]),
+        }[kind]
+        msg.set_content(rng.choice(template).format(name=name.split()[0], company=company.title()))
+
+    msg["Subject"] = subject
+    msg["From"] = f"{name} <{address}>"
+    msg["To"] = owner
+    msg["Date"] = format_datetime(date)
+    msg["Message-ID"] = _message_id(rng, address.rsplit("@", 1)[-1])
+
+    if attachment_size and kind in ("business", "sponsorship", "notification", "personal"):
+        payload = rng.getrandbits(8 * attachment_size).to_bytes(attachment_size, "little")
+        msg.add_attachment(payload, maintype="application", subtype="pdf", filename=f"{kind}-{rng.randint(1, 99)}.pdf")
+    return msg, address
+
+
+def _reply(rng, parent, parent_from, date, owner):
+    """Build a reply in an existing thread, quoting the previous message"""
+    msg = EmailMessage()
+    subject = parent["Subject"]
+    msg["Subject"] = subject if subject.lower().startswith("re:") else f"Re: {subject}"
+    msg["From"] = parent["From"]
+    msg["To"] = owner
+    msg["Date"] = format_datetime(date)
+    msg["Message-ID"] = _message_id(rng, parent_from.rsplit("@", 1)[-1])
+    msg["In-Reply-To"] = parent["Message-ID"]
+    references = parent.get("References", "")
+    msg["References"] = f"{references} {parent['Message-ID']}".strip()
+    quoted = "\n".join("> " + line for line in parent.get_body(("plain",)).get_content().splitlines())
+    msg.set_content(f"Following up on this, any update?\n\nOn {parent['Date']} you wrote:\n{quoted}")
+    return msg
+
+
+def generate_mailbox(size, hours=20, seed=0, owner="me@example.com", attachment_ratio=0.1,
+                     attachment_size=50_000, thread_ratio=0.2, now=None):
+    """Generate ``size`` inbox messages spread evenly over the last ``hours`` hours.
+
+    Returns a list of dicts with ``internaldate`` (aware datetime), ``flags`` and raw ``data`` bytes,
+    oldest first, ready to be loaded into the fake IMAP server.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    start = now - timedelta(hours=hours)
+    step = timedelta(hours=hours) / max(size, 1)
+    kinds, weights = zip(*KINDS)
+
+    messages = []
+    conversations = []
+    for index in range(size):
+        date = (start + step * index).replace(microsecond=0)
+        if conversations and rng.random() < thread_ratio:
+            parent, parent_from = rng.choice(conversations)
+            msg = _reply(rng, parent, parent_from, date, owner)
+            conversations.append((msg, parent_from))
+        else:
+            kind = rng.choices(kinds, weights)[0]
+            with_attachment = rng.random() < attachment_ratio
+            msg, address = _build_message(rng, kind, date, owner, attachment_size if with_attachment else 0)
+            if kind in ("personal", "business", "sponsorship"):
+                conversations.append((msg, address))
+        flags = {"\\Seen"} if rng.random() < 0.5 else set()
+        messages.append({"internaldate": date, "flags": flags, "data": _to_bytes(rng, msg)})
+    return messages
+
+
+def generate_sent_mailbox(inbox, ratio=0.1, seed=0, owner="me@example.com"):
+    """Generate replies we have already sent to a fraction of the inbox"""
+    import email
+
+    rng = random.Random(seed)
+    sent = []
+    for item in inbox:
+        if rng.random() >= ratio:
+            continue
+        original = email.message_from_bytes(item["data"])
+        msg = EmailMessage()
+        msg["Subject"] = f"Re: {original.get('Subject', '')}"
+        msg["From"] = owner
+        msg["To"] = original.get("From", "")
+        date = item["internaldate"] + timedelta(minutes=30)
+        msg["Date"] = format_datetime(date)
+        msg.set_content("Thanks, will get back to you shortly.")
+        sent.append({"internaldate": date, "flags": {"\\Seen"}, "data": _to_bytes(rng, msg)})
+    return sent
+
+
+_FROM_LINE_START_RE = re.compile(rb"^From ", re.MULTILINE)
+
+
+def write_mbox(messages, path):
+    """Write generated messages to an mbox file with LF line endings, as mail exports do"""
+    with open(path, "wb") as f:
+        for item in messages:
+            date = item["internaldate"].astimezone(timezone.utc).strftime("%a %b %d %H:%M:%S %Y")
+            data = item["data"].replace(b"\r\n", b"\n")
+            # Body lines that would read as a message separator are quoted
+            f.write(b"From MAILER-DAEMON " + date.encode() + b"\n"
+                    + _FROM_LINE_START_RE.sub(b">From ", data).rstrip(b"\n") + b"\n\n")
+
+
+def write_maildir(messages, path):
+    """Write generated messages to a Maildir: read ones in cur, unread ones in new"""
+    for directory in ("cur", "new", "tmp"):
+        os.makedirs(os.path.join(path, directory), exist_ok=True)
+    for index, item in enumerate(messages):
+        name = f"{int(item['internaldate'].timestamp())}.M{index}P{os.getpid()}.synthetic"
+        seen = "\\Seen" in item["flags"]
+        file_path = os.path.join(path, "cur", name + ":2,S") if seen else os.path.join(path, "new", name)
+        with open(file_path, "wb") as f:
+            f.write(item["data"])
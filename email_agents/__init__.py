@@ -0,0 +1,9 @@
+"""Mail I/O, message parsing and LLM calls shared by the email agent scripts.
+
+Heavy dependencies (openai, pydantic, imaplib, smtplib) are imported inside
+the functions that need them, so commands only pay for what they use.
+"""
+from dotenv import load_dotenv
+
+# Module settings are read from the environment on import, so load .env first
+load_dotenv(override=True)
@@ -0,0 +1,69 @@
+"""Classify with a fast model first and escalate uncertain results to the main model"""
+import os
+import re
+
+from email_agents import metrics
+from email_agents.llm_backend import FAST_TIER, FULL_TIER
+
+# First-pass results below this confidence go to the main model
+CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.75"))
+# Send "medium" importance results to the main model too
+CASCADE_ESCALATE_MEDIUM = os.getenv("CASCADE_ESCALATE_MEDIUM", "1").lower() in ("1", "true", "yes")
+
+_AUTOMATED_SENDER_RE = re.compile(r"(no-?reply|do-?not-?reply|notifications?|mailer-daemon|newsletter|news)@",
+                                  re.IGNORECASE)
+_AUTOMATED_BODY_MARKERS = ("unsubscribe", "automated notification", "manage your preferences")
+
+
+def looks_automated(email):
+    """Sender or body says the message came from a machine"""
+    body = (email.get("body") or "").lower()
+    return bool(_AUTOMATED_SENDER_RE.search(email.get("from", ""))) or any(
+        marker in body for marker in _AUTOMATED_BODY_MARKERS)
+
+
+def expects_response(email):
+    """Heuristic guess at needs_response: a person asking something"""
+    return not looks_automated(email) and "?" in (email.get("body") or "")
+
+
+def importance_uncertain(email, analysis, min_confidence=None, escalate_medium=None):
+    """Why a first-pass importance result should be escalated, or None to keep it"""
+    min_confidence = CASCADE_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    escalate_medium = CASCADE_ESCALATE_MEDIUM if escalate_medium is None else escalate_medium
+    if analysis is None:
+        return "failed"
+    if analysis.confidence is not None and analysis.confidence < min_confidence:
+        return "low_confidence"
+    if escalate_medium and analysis.importance == "medium":
+        return "medium"
+    if analysis.needs_response != expects_response(email):
+        return "heuristic_disagrees"
+    return None
+
+
+def category_uncertain(email, analysis, min_confidence=None):
+    """Why a first-pass category should be escalated, or None to keep it"""
+    min_confidence = CASCADE_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    if analysis is None:
+        return "failed"
+    if analysis.confidence < min_confidence:
+        return "low_confidence"
+    if analysis.category != "other" and looks_automated(email):
+        return "heuristic_disagrees"
+    return None
+
+
+def classify(llm, task, email, analyze, uncertain):
+    """Run ``analyze(llm, email, tier)`` on the fast tier and again on the full tier when ``uncertain`` says so"""
+    if not llm.has_cascade(task):
+        return analyze(llm, email)
+    first = analyze(llm, email, FAST_TIER)
+    # Emails pinned to the local model have nowhere better to go
+    if llm.route(task, email, FAST_TIER) == llm.route(task, email, FULL_TIER):
+        return first
+    reason = uncertain(email, first)
+    if reason is None:
+        return first
+    metrics.count(f"escalated_{reason}")
+    return analyze(llm, email, FULL_TIER)
@@ -0,0 +1,141 @@
+"""Record model calls to a cassette file and replay them offline.
+
+Every chat completion the router makes is fingerprinted from its model,
+messages and options. In ``record`` mode the live response, its usage and
+latency are appended to a JSONL cassette; in ``replay`` mode calls are
+answered from the cassette only, without network access or cost, and a
+call with no recording raises CassetteMiss. ``auto`` replays what it can
+and records the rest. ``record`` starts the cassette afresh, once per
+process, so the stages of one run all end up in the same file.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+MODES = ("off", "record", "replay", "auto")
+# Transport hints that do not change the answer
+_UNMATCHED_OPTIONS = ("prompt_cache_key",)
+
+# Cassettes opened by from_env, shared by every router in the process
+_open = {}
+
+
+class CassetteMiss(LookupError):
+    """A replayed call has no recording in the cassette"""
+
+
+def fingerprint(model, messages, options=None, ignore=None):
+    """Stable hash of a chat completion request; text matching ``ignore`` is left out"""
+    if isinstance(ignore, str):
+        ignore = re.compile(ignore, re.MULTILINE) if ignore else None
+    if ignore is not None:
+        messages = [dict(message, content=ignore.sub("", message.get("content") or "")) for message in messages]
+    options = {key: value for key, value in (options or {}).items() if key not in _UNMATCHED_OPTIONS}
+    request = json.dumps({"model": model, "messages": messages, "options": options},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(request.encode("utf-8")).hexdigest()[:32]
+
+
+def _dump(response):
+    if hasattr(response, "model_dump"):
+        return response.model_dump(mode="json", exclude_none=True)
+    return response
+
+
+def _load(data):
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate(data)
+
+
+class Cassette:
+    """Recorded chat completions keyed by request fingerprint"""
+
+    def __init__(self, path, mode="replay", latency="recorded", ignore=None):
+        if mode not in MODES:
+            raise ValueError(f"LLM_CASSETTE_MODE must be one of {', '.join(MODES)}, not '{mode}'")
+        self.path = path
+        self.mode = mode
+        # "recorded" sleeps for each call's original latency on replay, a number for a fixed delay
+        self.latency = latency
+        # Regex of prompt text left out of the fingerprint; use the same one when recording and replaying
+        self.ignore = re.compile(ignore, re.MULTILINE) if ignore else None
+        self._lock = threading.Lock()
+        self._entries = {}
+        # How often each fingerprint was replayed, so repeated identical calls replay in recorded order
+        self._replayed = {}
+        if mode == "record":
+            open(self.path, "w", encoding="utf-8").close()
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["fingerprint"], []).append(entry)
+        except FileNotFoundError:
+            if mode == "replay":
+                raise CassetteMiss(f"No cassette at {self.path}; record one with LLM_CASSETTE_MODE=record")
+
+    @classmethod
+    def from_env(cls):
+        """The cassette configured by LLM_CASSETTE_MODE (off, record, replay or auto), or None when it is off.
+
+        The file is LLM_CASSETTE, the replay delay LLM_CASSETTE_LATENCY and
+        the text left out of fingerprints LLM_CASSETTE_IGNORE, e.g.
+        ``^\\s*Received: .*$`` for timestamps that change every run.
+        """
+        mode = os.getenv("LLM_CASSETTE_MODE", "off")
+        if mode == "off":
+            return None
+        path = os.getenv("LLM_CASSETTE", "llm_cassette.jsonl")
+        key = (os.path.abspath(path), mode)
+        if key not in _open:
+            _open[key] = cls(path, mode, latency=os.getenv("LLM_CASSETTE_LATENCY", "recorded"),
+                             ignore=os.getenv("LLM_CASSETTE_IGNORE", ""))
+        return _open[key]
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    def _replay(self, key):
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            count = self._replayed.get(key, 0)
+            self._replayed[key] = count + 1
+        entry = entries[min(count, len(entries) - 1)]
+        delay = entry.get("latency", 0.0) if self.latency == "recorded" else float(self.latency)
+        if delay:
+            time.sleep(delay)
+        return _load(entry["response"])
+
+    def call(self, task, model, messages, options, live):
+        """Answer one chat completion from the cassette or from ``live()``, per the mode.
+
+        Returns (response, replayed).
+        """
+        key = fingerprint(model, messages, options, self.ignore)
+        if self.mode in ("replay", "auto"):
+            response = self._replay(key)
+            if response is not None:
+                return response, True
+            if self.mode == "replay":
+                recorded = sum(1 for entries in self._entries.values() for entry in entries if entry["task"] == task)
+                raise CassetteMiss(
+                    f"No recorded {task} call for model {model} (fingerprint {key}) in {self.path}, which holds "
+                    f"{recorded} {task} calls; the prompt or input changed since it was recorded. "
+                    f"Record it again with LLM_CASSETTE_MODE=record or auto.")
+        start = time.perf_counter()
+        response = live()
+        entry = {"fingerprint": key, "task": task, "model": model, "latency": round(time.perf_counter() - start, 4),
+                 "response": _dump(response)}
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return response, False
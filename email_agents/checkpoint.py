@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Partial outputs are rewritten at most this often while a run is going (seconds)
+PARTIAL_WRITE_INTERVAL = float(os.getenv("PARTIAL_WRITE_INTERVAL", "5"))
+
+
+def email_key(email):
+    """Stable identifier for an email across runs"""
+    raw = "\0".join((email.get("subject", ""), email.get("from", ""), email.get("received", "")))
+    return hashlib.sha1(raw.encode("utf-8", errors="replace")).hexdigest()[:16]
+
+
+def atomic_write(path, text):
+    """Write a file so readers only ever see the old or the new content"""
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def atomic_write_json(path, data):
+    atomic_write(path, json.dumps(data, indent=2))
+
+
+class Throttle:
+    """True at most once per ``interval`` seconds"""
+
+    def __init__(self, interval=PARTIAL_WRITE_INTERVAL):
+        self.interval = interval
+        self._last = time.monotonic()
+
+    def ready(self):
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            return True
+        return False
+
+
+class Checkpoint:
+    """Append-only journal of per-email results so an interrupted run can resume.
+
+    Every record is flushed and fsynced before the next email is counted as
+    done; a torn final line from a crash is discarded when the journal is loaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fetched = False
+        self.results = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        if data and not data.endswith(b"\n"):
+            data = data[:data.rfind(b"\n") + 1]
+            with open(self.path, "r+b") as f:
+                f.truncate(len(data))
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("type") == "fetched":
+                self.fetched = True
+            elif "key" in record:
+                self.results[record["key"]] = record["result"]
+
+    def _append(self, record):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def reset(self):
+        """Forget any previous run and start a new journal"""
+        self.clear()
+        self.fetched = False
+        self.results = {}
+
+    def mark_fetched(self):
+        """Record that the emails for this run were fetched completely"""
+        self.fetched = True
+        self._append({"type": "fetched"})
+
+    def record(self, key, result):
+        self.results[key] = result
+        self._append({"key": key, "result": result})
+
+    def clear(self):
+        """Remove the journal once a run has finished"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,109 @@
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+from email_agents import metrics
+
+# Message numbers per INTERNALDATE FETCH command
+DATE_FETCH_BATCH = 500
+
+_INTERNALDATE_RE = re.compile(rb'^(\d+) \(.*INTERNALDATE "([^"]+)"')
+
+
+def _split_list(value):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def _quote(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def search_criteria(cutoff, unseen=False, exclude_from=(), gmail_raw=None):
+    """IMAP SEARCH criteria for messages received since the cutoff datetime.
+
+    SINCE only compares dates in the server's timezone, so it starts a day
+    early; the exact cutoff is applied afterwards from INTERNALDATE.
+    """
+    since = (cutoff - timedelta(days=1)).strftime("%d-%b-%Y")
+    parts = [f'SINCE "{since}"']
+    if unseen:
+        parts.append("UNSEEN")
+    parts.extend(f"NOT FROM {_quote(sender)}" for sender in exclude_from)
+    if gmail_raw:
+        parts.append(f"X-GM-RAW {_quote(gmail_raw)}")
+    return "(" + " ".join(parts) + ")"
+
+
+def sequence_set(numbers):
+    """Compress message numbers into an IMAP sequence set such as ``1:4,9``"""
+    ranges = []
+    for number in sorted(set(numbers)):
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ",".join(str(low) if low == high else f"{low}:{high}" for low, high in ranges)
+
+
+def parse_internaldate(value):
+    """Parse an IMAP date-time such as ``" 1-Jan-2026 09:15:00 +0000"``"""
+    try:
+        return datetime.strptime(value.strip(), "%d-%b-%Y %H:%M:%S %z")
+    except ValueError:
+        return None
+
+
+def parse_internaldates(fetch_data):
+    """Map message numbers to INTERNALDATE from a FETCH (INTERNALDATE) response"""
+    dates = {}
+    for item in fetch_data or []:
+        if isinstance(item, tuple):
+            item = item[0]
+        if not isinstance(item, bytes):
+            continue
+        match = _INTERNALDATE_RE.match(item)
+        if match:
+            dates[int(match.group(1))] = parse_internaldate(match.group(2).decode("ascii", errors="replace"))
+    return dates
+
+
+def search_window(imap, hours, now=None):
+    """(message number, INTERNALDATE) of messages received within the last ``hours``.
+
+    The server narrows the candidates (optionally to unread mail, minus
+    IMAP_EXCLUDE_FROM senders, plus IMAP_GMAIL_RAW on Gmail), then only the
+    INTERNALDATE of each candidate is fetched to cut to the exact window
+    before any message body is downloaded. The date is None if the server's date
+    could not be parsed. Returns None if the search fails.
+    """
+    now = now or datetime.now(timezone.utc)
+    cutoff = now - timedelta(hours=hours)
+    gmail_raw = os.getenv("IMAP_GMAIL_RAW")
+    if gmail_raw and "X-GM-EXT-1" not in getattr(imap, "capabilities", ()):
+        gmail_raw = None
+    criteria = search_criteria(
+        cutoff,
+        unseen=os.getenv("IMAP_UNSEEN_ONLY", "").lower() in ("1", "true", "yes"),
+        exclude_from=_split_list(os.getenv("IMAP_EXCLUDE_FROM")),
+        gmail_raw=gmail_raw,
+    )
+    with metrics.span("search"):
+        status, data = imap.search(None, criteria)
+    if status != "OK":
+        return None
+    candidates = [int(num) for num in data[0].split()]
+    metrics.count("search_candidates", len(candidates))
+
+    in_window = []
+    with metrics.span("window"):
+        for start in range(0, len(candidates), DATE_FETCH_BATCH):
+            batch = candidates[start:start + DATE_FETCH_BATCH]
+            status, fetch_data = imap.fetch(sequence_set(batch), "(INTERNALDATE)")
+            dates = parse_internaldates(fetch_data) if status == "OK" else {}
+            for num in batch:
+                received = dates.get(num)
+                # Keep messages without a usable date rather than silently dropping them
+                if received is None or received >= cutoff:
+                    in_window.append((str(num).encode(), received))
+    metrics.count("outside_window", len(candidates) - len(in_window))
+    return in_window
@@ -0,0 +1,248 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from email_agents import metrics
+from email_agents.cassette import Cassette
+from email_agents.llm_retry import CircuitBreaker, RateLimiter, RetryPolicy, call_with_retry, estimate_tokens
+
+# Tasks that talk to a language model and the model each one uses by default
+DEFAULT_TASK_MODELS = {
+    "importance": "gpt-4.1",
+    "categorize": "gpt-4.1",
+    "report": "gpt-4",
+    "respond": "gpt-4.1",
+}
+
+DEFAULT_BACKEND = "openai"
+LOCAL_BACKEND = "local"
+
+# Cascade tiers: a cheap first pass (LLM_<TASK>_FAST_MODEL/_FAST_BACKEND) and the task's main model
+FAST_TIER = "fast"
+FULL_TIER = "full"
+
+
+def _split_list(value):
+    """Split a comma separated environment value into a lowercase list"""
+    return [item.strip().lower() for item in (value or "").split(",") if item.strip()]
+
+
+def sender_address(email):
+    """Return the lowercase sender address of an email dict"""
+    from email.utils import parseaddr
+
+    address = email.get("email_address") or parseaddr(email.get("from", ""))[1]
+    return (address or "").lower()
+
+
+class Backend:
+    """An OpenAI-compatible chat endpoint with its own concurrency limit, rate limiter and circuit breaker"""
+
+    def __init__(self, name, base_url=None, api_key=None, model=None, max_concurrency=4,
+                 retry_policy=None, rate_limiter=None, circuit_breaker=None):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        # A fixed model overrides the per-task model (local servers usually serve one model)
+        self.model = model
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Create the OpenAI client on first use"""
+        with self._client_lock:
+            if self._client is None:
+                from openai import OpenAI
+
+                # Retries are handled by call_with_retry so every attempt is rate limited
+                kwargs = {"max_retries": 0}
+                if self.base_url:
+                    kwargs["base_url"] = self.base_url
+                if self.api_key:
+                    kwargs["api_key"] = self.api_key
+                self._client = OpenAI(**kwargs)
+        return self._client
+
+    def chat(self, model, messages, **kwargs):
+        """Run a chat completion with rate limiting, retries and one of this backend's slots"""
+        tokens = estimate_tokens(messages)
+
+        def attempt():
+            self.rate_limiter.acquire(tokens)
+            with self._slots:
+                raw = self.client.chat.completions.with_raw_response.create(model=model, messages=messages, **kwargs)
+            self.rate_limiter.update(raw.headers)
+            return raw.parse()
+
+        return call_with_retry(attempt, self.retry_policy, self.rate_limiter, self.circuit_breaker)
+
+
+class LLMRouter:
+    """Pick a backend and model for each task, routing sensitive senders to the local model"""
+
+    def __init__(self, backends, task_models=None, task_backends=None,
+                 local_senders=(), local_domains=(), fast_models=None, fast_backends=None, cassette=None):
+        self.backends = dict(backends)
+        # Optional Cassette that records or replays every call
+        self.cassette = cassette
+        self.task_models = dict(DEFAULT_TASK_MODELS)
+        self.task_models.update(task_models or {})
+        self.task_backends = dict(task_backends or {})
+        self.fast_models = dict(fast_models or {})
+        self.fast_backends = dict(fast_backends or {})
+        self.local_senders = set(local_senders)
+        self.local_domains = set(local_domains)
+
+    @classmethod
+    def from_env(cls):
+        """Build a router from the LLM_* and LOCAL_LLM_* environment variables"""
+        retry_policy = RetryPolicy.from_env()
+        threshold = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+        cooldown = float(os.getenv("LLM_BREAKER_COOLDOWN", "60"))
+        rpm = os.getenv("OPENAI_RPM")
+        tpm = os.getenv("OPENAI_TPM")
+        backends = {
+            DEFAULT_BACKEND: Backend(
+                DEFAULT_BACKEND,
+                base_url=os.getenv("OPENAI_BASE_URL") or None,
+                max_concurrency=os.getenv("OPENAI_CONCURRENCY", "4"),
+                retry_policy=retry_policy,
+                rate_limiter=RateLimiter(rpm=int(rpm) if rpm else None, tpm=int(tpm) if tpm else None),
+                circuit_breaker=CircuitBreaker(threshold, cooldown),
+            )
+        }
+        local_url = os.getenv("LOCAL_LLM_BASE_URL")
+        if local_url:
+            backends[LOCAL_BACKEND] = Backend(
+                LOCAL_BACKEND,
+                base_url=local_url,
+                api_key=os.getenv("LOCAL_LLM_API_KEY", "not-needed"),
+                model=os.getenv("LOCAL_LLM_MODEL", "local-model"),
+                max_concurrency=os.getenv("LOCAL_LLM_CONCURRENCY", "1"),
+                retry_policy=retry_policy,
+                circuit_breaker=CircuitBreaker(threshold, cooldown),
+            )
+
+        task_models = {}
+        task_backends = {}
+        fast_models = {}
+        fast_backends = {}
+        for task in DEFAULT_TASK_MODELS:
+            for models, backends_, prefix in ((task_models, task_backends, f"LLM_{task.upper()}"),
+                                              (fast_models, fast_backends, f"LLM_{task.upper()}_FAST")):
+                model = os.getenv(f"{prefix}_MODEL")
+                if model:
+                    models[task] = model
+                backend = os.getenv(f"{prefix}_BACKEND")
+                if backend:
+                    backends_[task] = backend.lower()
+
+        return cls(
+            backends,
+            task_models=task_models,
+            task_backends=task_backends,
+            local_senders=_split_list(os.getenv("LOCAL_LLM_SENDERS")),
+            local_domains=_split_list(os.getenv("LOCAL_LLM_DOMAINS")),
+            fast_models=fast_models,
+            fast_backends=fast_backends,
+            cassette=Cassette.from_env(),
+        )
+
+    def has_cascade(self, task):
+        """Whether a task runs a first pass on a fast model before its main model"""
+        return task in self.fast_models or task in self.fast_backends
+
+    def first_tier(self, task):
+        return FAST_TIER if self.has_cascade(task) else FULL_TIER
+
+    def is_sensitive(self, email):
+        """Check whether an email (or any email in a list) must stay on the local model"""
+        if email is None:
+            return False
+        if isinstance(email, (list, tuple)):
+            return any(self.is_sensitive(item) for item in email)
+        address = sender_address(email)
+        if not address:
+            return False
+        domain = address.rsplit("@", 1)[-1]
+        return address in self.local_senders or domain in self.local_domains
+
+    def route(self, task, email=None, tier=FULL_TIER):
+        """Return the (backend, model) pair to use for a task, optional email and cascade tier"""
+        fast = tier == FAST_TIER and self.has_cascade(task)
+        if self.is_sensitive(email):
+            if LOCAL_BACKEND not in self.backends:
+                raise ValueError("LOCAL_LLM_BASE_URL must be set to route sensitive emails locally")
+            name = LOCAL_BACKEND
+        elif fast:
+            name = self.fast_backends.get(task, self.task_backends.get(task, DEFAULT_BACKEND))
+        else:
+            name = self.task_backends.get(task, DEFAULT_BACKEND)
+        if name not in self.backends:
+            raise ValueError(f"Unknown LLM backend '{name}' for task '{task}'")
+        backend = self.backends[name]
+        if fast:
+            return backend, backend.model or self.fast_models.get(task, self.task_models[task])
+        return backend, backend.model or self.task_models[task]
+
+    def chat(self, task, messages, email=None, tier=FULL_TIER, cache_key=None, **kwargs):
+        """Run a chat completion for a task on the routed backend, recording latency and usage.
+
+        Calls sharing a ``cache_key`` are sent to the same OpenAI prompt cache,
+        so a conversation that only grows is re-read from the cache each turn.
+        """
+        backend, model = self.route(task, email, tier)
+        # Local servers (llama.cpp, vLLM) reuse a matching prompt prefix on their own
+        if cache_key and backend.name != LOCAL_BACKEND:
+            kwargs["prompt_cache_key"] = cache_key
+        start = time.perf_counter()
+        if self.cassette is None:
+            response = backend.chat(model, messages, **kwargs)
+        else:
+            response, replayed = self.cassette.call(task, model, messages, kwargs,
+                                                    lambda: backend.chat(model, messages, **kwargs))
+            metrics.count("llm_replayed" if replayed else "llm_recorded")
+        metrics.current().record_llm_call(task, backend.name, model, time.perf_counter() - start,
+                                          getattr(response, "usage", None), tier=tier)
+        return response
+
+    def map(self, task, fn, emails, on_result=None):
+        """Apply fn to each email concurrently and return the results in input order.
+
+        Every backend gets its own worker pool sized to its concurrency limit, so
+        emails waiting on a slow local model never hold up the cloud path.
+        ``on_result(email, result)`` is called in the calling thread as each one finishes.
+        """
+        emails = list(emails)
+        groups = {}
+        for index, email in enumerate(emails):
+            backend, _ = self.route(task, email, self.first_tier(task))
+            groups.setdefault(backend.name, []).append(index)
+
+        results = [None] * len(emails)
+        pools = []
+        futures = {}
+        try:
+            for name, indexes in groups.items():
+                pool = ThreadPoolExecutor(max_workers=self.backends[name].max_concurrency)
+                pools.append(pool)
+                for index in indexes:
+                    # In a copy of the caller's context, so calls count towards the caller's metrics run
+                    futures[pool.submit(contextvars.copy_context().run, fn, emails[index])] = index
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.result()
+                if on_result is not None:
+                    on_result(emails[index], results[index])
+        finally:
+            for pool in pools:
+                pool.shutdown(wait=True)
+        return results
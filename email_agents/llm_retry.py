@@ -0,0 +1,303 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from email_agents import metrics
+from email_agents.records import as_dict
+
+# Failed emails are kept here and analyzed again on the next run
+RETRY_QUEUE_FILE = "llm_retry_queue.json"
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend that keeps failing"""
+
+
+def parse_duration(value):
+    """Parse OpenAI reset durations such as '20ms', '1.5s' or '6m0s' into seconds"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _UNIT_SECONDS[unit] for amount, unit in parts)
+
+
+def retry_after(headers):
+    """Seconds the server asked us to wait, from retry-after-ms or Retry-After"""
+    if not headers:
+        return None
+    milliseconds = headers.get("retry-after-ms")
+    if milliseconds:
+        try:
+            return float(milliseconds) / 1000
+        except ValueError:
+            pass
+    return parse_duration(headers.get("retry-after"))
+
+
+def estimate_tokens(messages):
+    """Rough prompt size used to reserve token budget before a call"""
+    return sum(len(message.get("content") or "") for message in messages) // 4
+
+
+class _Bucket:
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.available = float(limit) if limit else None
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if self.limit:
+            self.available = min(self.limit, self.available + (now - self.updated) * self.limit / 60)
+        self.updated = now
+
+    def wait_time(self, amount):
+        if not self.limit or self.available >= amount:
+            return 0.0
+        return (min(amount, self.limit) - self.available) * 60 / self.limit
+
+
+class RateLimiter:
+    """Request and token buckets that follow the server's x-ratelimit-* headers"""
+
+    def __init__(self, rpm=None, tpm=None):
+        self._lock = threading.Lock()
+        self._requests = _Bucket(rpm)
+        self._tokens = _Bucket(tpm)
+        self._paused_until = 0.0
+
+    def acquire(self, tokens=0):
+        """Block until one request and ``tokens`` tokens are available, then take them"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._requests.refill(now)
+                self._tokens.refill(now)
+                wait = max(self._paused_until - now, self._requests.wait_time(1), self._tokens.wait_time(tokens))
+                if wait <= 0:
+                    if self._requests.limit:
+                        self._requests.available -= 1
+                    if self._tokens.limit:
+                        self._tokens.available -= min(tokens, self._tokens.limit)
+                    return
+            metrics.count("llm_rate_limit_waits")
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every caller for ``seconds`` (used for Retry-After)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def update(self, headers):
+        """Adopt the limits and remaining budget the server reported"""
+        if not headers:
+            return
+        with self._lock:
+            now = time.monotonic()
+            for bucket, kind in ((self._requests, "requests"), (self._tokens, "tokens")):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if limit is None or remaining is None:
+                    continue
+                try:
+                    limit, remaining = float(limit), float(remaining)
+                except ValueError:
+                    continue
+                if limit <= 0:
+                    continue
+                bucket.refill(now)
+                bucket.limit = limit
+                bucket.available = remaining if bucket.available is None else min(bucket.available, remaining)
+                bucket.updated = now
+
+
+class CircuitBreaker:
+    """Fail fast after ``threshold`` consecutive failures, trying again after ``cooldown`` seconds"""
+
+    def __init__(self, threshold=5, cooldown=60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "open" or (state == "half-open" and self._trial_running):
+                raise CircuitOpenError("LLM backend is failing; circuit breaker is open")
+            if state == "half-open":
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def release_trial(self):
+        """End a half-open trial call without a verdict, so the next call may probe again"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                if self._opened_at is None or self._trial_running:
+                    metrics.count("llm_circuit_opened")
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class RetryPolicy:
+    """Jittered exponential backoff settings"""
+
+    def __init__(self, max_retries=5, base_delay=0.5, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "5")),
+            base_delay=float(os.getenv("LLM_BACKOFF_BASE", "0.5")),
+            max_delay=float(os.getenv("LLM_BACKOFF_MAX", "30")),
+        )
+
+    def delay(self, attempt):
+        """Full-jitter backoff for the given retry attempt (0-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def is_retryable(error):
+    """Timeouts, connection errors, rate limits and server errors are worth retrying"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    try:
+        import openai
+    except ImportError:
+        return isinstance(error, (TimeoutError, ConnectionError))
+    return isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, TimeoutError, ConnectionError))
+
+
+def call_with_retry(call, policy=None, limiter=None, breaker=None):
+    """Run ``call`` with backoff, honoring Retry-After and the circuit breaker"""
+    policy = policy or RetryPolicy()
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        try:
+            result = call()
+        except Exception as e:
+            if not is_retryable(e):
+                # A bad request says nothing about the backend's health: neither close nor trip the breaker
+                if breaker is not None:
+                    breaker.release_trial()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            headers = getattr(getattr(e, "response", None), "headers", None)
+            if limiter is not None:
+                limiter.update(headers)
+            if attempt >= policy.max_retries:
+                metrics.count("llm_failures")
+                raise
+            wait = policy.delay(attempt)
+            server_wait = retry_after(headers)
+            if server_wait is not None:
+                wait = max(wait, server_wait)
+                if limiter is not None:
+                    limiter.pause(server_wait)
+            metrics.count("llm_retries")
+            attempt += 1
+            time.sleep(wait)
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+def _email_key(email):
+    return (email.get("subject", ""), email.get("from", ""), email.get("received", ""))
+
+
+class RetryQueue:
+    """Emails whose analysis failed, kept per task so the next run tries them again"""
+
+    def __init__(self, path=RETRY_QUEUE_FILE, max_attempts=5):
+        self.path = path
+        self.max_attempts = max_attempts
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def pending(self, task):
+        """Queued entries for a task: [{"email": ..., "attempts": n, }, ...], deferred ones with "deferred": True"""
+        return self._load().get(task, [])
+
+    def merge(self, task, emails):
+        """Return queued emails followed by the new ones, without duplicates"""
+        queued = [entry["email"] for entry in self.pending(task)]
+        seen = {_email_key(email) for email in queued}
+        return queued + [email for email in emails if _email_key(email) not in seen]
+
+    def replace(self, task, failed, deferred=()):
+        """Store this run's failures for a task, dropping emails that failed too often.
+
+        Deferred emails were never tried, so they are kept with their attempts unchanged.
+        """
+        data = self._load()
+        attempts = {_email_key(entry["email"]): entry["attempts"] for entry in data.get(task, [])}
+        entries = []
+        for email in failed:
+            count = attempts.get(_email_key(email), 0) + 1
+            if count > self.max_attempts:
+                print(f"Giving up on email after {self.max_attempts} failed runs: {email.get('subject', '')}")
+                continue
+            entries.append({"email": as_dict(email), "attempts": count})
+        for email in deferred:
+            entries.append({"email": as_dict(email), "attempts": attempts.get(_email_key(email), 0), "deferred": True})
+        if entries:
+            data[task] = entries
+        else:
+            data.pop(task, None)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(self.path + ".tmp", self.path)
+        return entries
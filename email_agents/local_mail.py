@@ -0,0 +1,184 @@
+"""Read mail from local mbox files and Maildir directories instead of IMAP.
+
+An mbox export is memory-mapped and scanned for the ``From `` lines that
+separate its messages, so a file of many gigabytes is never loaded whole:
+each message's date comes from its separator line (or its Date header),
+and only messages inside the window are copied out and parsed. A Maildir
+is walked for the files in its ``cur`` and ``new`` directories, dated by the
+delivery time at the start of each file name. Either way the messages go
+through the same parser, worker pool and files as mail fetched over IMAP.
+"""
+import mmap
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+from email_agents import metrics
+from email_agents.mime_parse import MAX_MESSAGE_BYTES
+
+# "From sender Mon Jan  5 09:00:00 2026", optionally with a zone before the year as Gmail writes it
+_FROM_LINE_RE = re.compile(rb"(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) +(\d{1,2}) "
+                           rb"(\d{2}):(\d{2}):(\d{2})(?: ([+-]\d{4}))? (\d{4})\s*$")
+_MONTHS = {month: index for index, month in enumerate(
+    (b"Jan", b"Feb", b"Mar", b"Apr", b"May", b"Jun", b"Jul", b"Aug", b"Sep", b"Oct", b"Nov", b"Dec"), 1)}
+_DATE_HEADER_RE = re.compile(rb"^Date:[ \t]*(.+?)\r?$", re.MULTILINE | re.IGNORECASE)
+# Bytes searched for the Date header when the separator line has no date
+_HEADER_SCAN_BYTES = 64 * 1024
+# Maildir delivery time at the start of a file name, e.g. 1767603600.M1P2.host:2,S
+_MAILDIR_TIME_RE = re.compile(r"^(\d+)(?:\.|$)")
+
+
+def _from_line_date(line):
+    match = _FROM_LINE_RE.search(line)
+    if not match:
+        return None
+    month, day, hour, minute, second, zone, year = match.groups()
+    try:
+        date = datetime(int(year), _MONTHS[month], int(day), int(hour), int(minute), int(second),
+                        tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    if zone:
+        offset = int(zone[1:3]) * 60 + int(zone[3:5])
+        date -= timedelta(minutes=offset if zone[:1] == b"+" else -offset)
+    return date
+
+
+def _header_date(head):
+    end = head.find(b"\n\n")
+    if end < 0:
+        end = head.find(b"\r\n\r\n")
+    match = _DATE_HEADER_RE.search(head[:end] if end >= 0 else head)
+    if not match:
+        return None
+    try:
+        date = parsedate_to_datetime(match.group(1).decode("ascii", "replace"))
+    except (TypeError, ValueError, IndexError):
+        return None
+    return date if date.tzinfo else date.replace(tzinfo=timezone.utc)
+
+
+def scan_mbox(path, since=None, max_bytes=None):
+    """Yield (date, raw bytes) for each message of an mbox file received at or after ``since``.
+
+    The file is memory-mapped and only messages in the window are copied,
+    each cut at max_bytes like an IMAP partial fetch. Messages without a
+    readable date are always yielded, with date None.
+    """
+    max_bytes = MAX_MESSAGE_BYTES if max_bytes is None else max_bytes
+    scanned = skipped = 0
+    elapsed = 0.0
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            # Anything before the first separator line is not a message
+            start = 0 if mm[:5] == b"From " else mm.find(b"\nFrom ")
+            if start < 0:
+                return
+            if start:
+                start += 1
+            while start < size:
+                began = time.perf_counter()
+                line_end = mm.find(b"\n", start)
+                body = size if line_end < 0 else line_end + 1
+                end = mm.find(b"\nFrom ", body)
+                end = size if end < 0 else end + 1
+                date = _from_line_date(mm[start:body])
+                if date is None:
+                    date = _header_date(mm[body:min(end, body + _HEADER_SCAN_BYTES)])
+                scanned += 1
+                raw = None
+                if since is None or date is None or date >= since:
+                    raw = mm[body:min(end, body + max_bytes) if max_bytes else end]
+                else:
+                    skipped += 1
+                elapsed += time.perf_counter() - began
+                if raw is not None:
+                    yield date, raw
+                start = end
+    metrics.current().add_stage_time("scan", elapsed, scanned)
+    metrics.count("search_candidates", scanned)
+    metrics.count("outside_window", skipped)
+
+
+def maildir_files(path):
+    """(delivery date, file path) for every message in a Maildir tree, oldest first"""
+    found = []
+    for directory, subdirectories, files in os.walk(path):
+        # Messages still being delivered live in tmp
+        subdirectories[:] = [name for name in subdirectories if name != "tmp"]
+        if os.path.basename(directory) not in ("cur", "new"):
+            continue
+        for name in files:
+            if name.startswith("."):
+                continue
+            file_path = os.path.join(directory, name)
+            match = _MAILDIR_TIME_RE.match(name)
+            try:
+                date = datetime.fromtimestamp(int(match.group(1)), timezone.utc) if match else None
+            except (OverflowError, OSError, ValueError):
+                # A corrupt or crafted name must not stop the scan
+                date = None
+            if date is None:
+                date = datetime.fromtimestamp(os.path.getmtime(file_path), timezone.utc)
+            found.append((date, file_path))
+    found.sort()
+    return found
+
+
+def scan_maildir(path, since=None, max_bytes=None):
+    """Yield (date, raw bytes) for each message of a Maildir delivered at or after ``since``"""
+    max_bytes = MAX_MESSAGE_BYTES if max_bytes is None else max_bytes
+    began = time.perf_counter()
+    files = maildir_files(path)
+    in_window = [(date, file_path) for date, file_path in files if since is None or date >= since]
+    metrics.current().add_stage_time("scan", time.perf_counter() - began, len(files))
+    metrics.count("search_candidates", len(files))
+    metrics.count("outside_window", len(files) - len(in_window))
+    for date, file_path in in_window:
+        with metrics.span("fetch"):
+            with open(file_path, "rb") as f:
+                raw = f.read(max_bytes or -1)
+        yield date, raw
+
+
+def scan(path, since=None, max_bytes=None):
+    """Messages of an mbox file or a Maildir directory, whichever ``path`` is"""
+    if os.path.isdir(path):
+        return scan_maildir(path, since, max_bytes)
+    return scan_mbox(path, since, max_bytes)
+
+
+def read_inbox(source, hours, path):
+    """Read messages from the last ``hours`` of a local mailbox and write them to ``path``.
+
+    Returns the same records as mail.fetch_inbox, each with its ISO ``internaldate``.
+    """
+    from email_agents import parse_pool
+    from email_agents.mail import write_email
+
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    emails = []
+    # Unlike a fetch window the count is not known up front, so the pool starts whenever it is configured
+    with open(path, "w", encoding="utf-8") as f:
+        for date, email_item in parse_pool.parse_stream(scan(source, since)):
+            write_email(f, email_item)
+            email_item["internaldate"] = date.isoformat() if date else ""
+            emails.append(email_item)
+    return emails
+
+
+def read_sent(source, days):
+    """Subject, recipients and date of messages sent in the last ``days``, from a local mailbox"""
+    from email_agents.mime_parse import parse_sent_headers
+
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    sent_emails = []
+    for _, raw in scan(source, since):
+        with metrics.span("parse"):
+            sent_emails.append(parse_sent_headers(raw))
+    return sent_emails
@@ -0,0 +1,348 @@
+"""IMAP fetching, SMTP sending and the plain-text email files the scripts share"""
+import os
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+
+from email_agents import metrics
+from email_agents.imap_search import search_window, sequence_set
+from email_agents.records import EmailRecord
+
+# Messages requested per FETCH command; one round trip instead of one per message
+FETCH_BATCH = int(os.getenv("IMAP_FETCH_BATCH", "50"))
+
+_FETCH_NUM_RE = re.compile(rb"^(\d+) ")
+_THRID_RE = re.compile(rb"X-GM-THRID (\d+)")
+
+# Optional threading lines written between Received and Body, keyed by record field
+THREAD_HEADERS = (("to", "To"), ("message_id", "Message-ID"), ("in_reply_to", "In-Reply-To"),
+                  ("references", "References"), ("thread_id", "Thread-ID"))
+
+
+def _credentials():
+    username = os.getenv("EMAIL_USER")
+    password = os.getenv("EMAIL_PASSWORD")
+    if not username or not password:
+        raise ValueError("EMAIL_USER and EMAIL_PASSWORD must be set")
+    return username, password
+
+
+def connect_imap():
+    """Open an IMAP connection from IMAP_SERVER/IMAP_PORT (not yet logged in)"""
+    import imaplib
+
+    server = os.getenv("IMAP_SERVER", "imap.gmail.com")
+    port = int(os.getenv("IMAP_PORT", "993"))
+    return imaplib.IMAP4_SSL(server, port)
+
+
+def write_email(f, email_item):
+    """Append one email record in the format read_emails understands"""
+    f.write(f"Subject: {email_item['subject']}\n")
+    f.write(f"From: {email_item['from']}\n")
+    f.write(f"Received: {email_item['received']}\n")
+    for key, label in THREAD_HEADERS:
+        if email_item.get(key):
+            f.write(f"{label}: {email_item[key]}\n")
+    f.write(f"Body: {email_item['body']}\n")
+    f.write("-" * 50 + "\n")
+
+
+def _login(imap):
+    username, password = _credentials()
+    with metrics.span("login"):
+        imap.login(username, password)
+
+
+def fetch_batched(imap, nums, spec, batch=None):
+    """Yield (message number, response line, data) for each message, fetching ``batch`` messages per command"""
+    batch = batch or FETCH_BATCH
+    nums = [int(num) for num in nums]
+    for start in range(0, len(nums), batch):
+        with metrics.span("fetch"):
+            status, msg_data = imap.fetch(sequence_set(nums[start:start + batch]), spec)
+        if status != "OK" or not msg_data:
+            continue
+        for item in msg_data:
+            if not isinstance(item, tuple):
+                continue
+            match = _FETCH_NUM_RE.match(item[0] + b" ")
+            if match:
+                yield int(match.group(1)), item[0], item[1]
+        del msg_data
+
+
+def _fetch_inbox(imap, hours, path):
+    from email_agents import parse_pool
+    from email_agents.mime_parse import fetch_spec
+
+    with metrics.span("login"):
+        imap.select("INBOX")
+    # Exact hour window from INTERNALDATE, so no body outside it is downloaded
+    window = search_window(imap, hours)
+    if window is None:
+        return []
+    internaldates = {int(num): internaldate for num, internaldate in window}
+    # Gmail hands out its own conversation ids; elsewhere threads come from the headers
+    spec = fetch_spec(thread_id="X-GM-EXT-1" in getattr(imap, "capabilities", ()))
+    # A worker pool only pays for its start-up on windows larger than one parse batch
+    workers = parse_pool.PARSE_WORKERS if len(internaldates) > parse_pool.PARSE_BATCH else 0
+    fetched = (((num, line), raw) for num, line, raw in fetch_batched(imap, internaldates, spec))
+    emails = []
+    # Write each email out as soon as it is parsed instead of holding raw messages
+    with open(path, "w", encoding="utf-8") as f:
+        for (num, line), email_item in parse_pool.parse_stream(fetched, workers):
+            thread_id = _THRID_RE.search(line)
+            if thread_id:
+                email_item["thread_id"] = thread_id.group(1).decode()
+            write_email(f, email_item)
+            internaldate = internaldates.get(num)
+            email_item["internaldate"] = internaldate.isoformat() if internaldate else ""
+            emails.append(email_item)
+    return emails
+
+
+def _fetch_sent(imap, days):
+    from email_agents.mime_parse import parse_sent_headers
+
+    sent_folder = os.getenv("IMAP_SENT_FOLDER", "[Gmail]/Sent Mail")
+    cutoff = (datetime.utcnow() - timedelta(days=days)).strftime("%d-%b-%Y")
+    with metrics.span("login"):
+        status, _ = imap.select(sent_folder)
+    if status != "OK":
+        return []
+    with metrics.span("search"):
+        status, data = imap.search(None, f'(SINCE "{cutoff}")')
+    if status != "OK":
+        return []
+    sent_emails = []
+    # Only the headers are needed to know who we replied to
+    for _, _, raw in fetch_batched(imap, data[0].split(), "(BODY.PEEK[HEADER])"):
+        with metrics.span("parse"):
+            sent_emails.append(parse_sent_headers(raw))
+    return sent_emails
+
+
+def local_mailbox():
+    """The mbox file or Maildir in LOCAL_MAILBOX that replaces IMAP, or None"""
+    return os.getenv("LOCAL_MAILBOX") or None
+
+
+def fetch_inbox(hours, path):
+    """Fetch inbox emails from the last ``hours`` and write them to ``path``.
+
+    Each returned email also carries its ISO ``internaldate`` (empty if unknown).
+    With LOCAL_MAILBOX set they are read from that mbox file or Maildir instead.
+    """
+    if local_mailbox():
+        from email_agents import local_mail
+
+        return local_mail.read_inbox(local_mailbox(), hours, path)
+    with connect_imap() as imap:
+        _login(imap)
+        return _fetch_inbox(imap, hours, path)
+
+
+def _read_local_sent(days):
+    from email_agents import local_mail
+
+    # A local inbox comes with no server to ask, so sent mail is only known from its own export
+    source = os.getenv("LOCAL_SENT_MAILBOX")
+    return local_mail.read_sent(source, days) if source else []
+
+
+def fetch_sent(days):
+    """Fetch subject, recipients and date of emails sent in the last ``days``"""
+    if local_mailbox():
+        return _read_local_sent(days)
+    with connect_imap() as imap:
+        _login(imap)
+        return _fetch_sent(imap, days)
+
+
+def fetch_mailboxes(hours, days, path):
+    """fetch_inbox and fetch_sent over a single IMAP connection: (inbox emails, sent emails)"""
+    if local_mailbox():
+        return fetch_inbox(hours, path), _read_local_sent(days)
+    with connect_imap() as imap:
+        _login(imap)
+        return _fetch_inbox(imap, hours, path), _fetch_sent(imap, days)
+
+
+def within_hours(emails, hours, now=None):
+    """Emails whose internaldate falls in the last ``hours`` (emails without one are kept)"""
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(hours=hours)
+    return [email for email in emails
+            if not email.get("internaldate") or datetime.fromisoformat(email["internaldate"]) >= cutoff]
+
+
+def _thread_header(line):
+    """(record key, value) for a threading line written by write_email, else None"""
+    for key, label in THREAD_HEADERS:
+        if line.startswith(f"{label}: "):
+            return key, line[len(label) + 2:]
+    return None
+
+
+def read_emails(path):
+    """Read emails written by fetch_inbox and return them as a list of EmailRecords"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        print(f"No {path} file found. Creating empty file.")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("")
+        return []
+
+    emails = []
+    current_email = {}
+    current_body_lines = []
+
+    for line in lines:
+        line = line.rstrip()  # Remove trailing whitespace but keep leading whitespace
+
+        if line.startswith("Subject: "):
+            if current_email:  # Save previous email
+                # Join body lines and clean up excessive whitespace
+                current_email["body"] = "\n".join(
+                    line for line in current_body_lines if line.strip()
+                )
+                emails.append(current_email)
+                current_body_lines = []
+            current_email = {"subject": line[9:], "from": "unknown"}  # Default 'from' to 'unknown'
+        elif line.startswith("From: "):
+            current_email["from"] = line[6:]
+        elif line.startswith("Received: "):
+            current_email["received"] = line[10:]
+        elif current_body_lines == [] and _thread_header(line):
+            key, value = _thread_header(line)
+            current_email[key] = value
+        elif line.startswith("Body: "):
+            current_body_lines = [line[6:]]
+        elif line.startswith("-" * 50):
+            continue
+        else:
+            # Append non-marker lines to body
+            if current_body_lines is not None:
+                current_body_lines.append(line)
+
+    # Don't forget to add the last email
+    if current_email:
+        current_email["body"] = "\n".join(
+            line for line in current_body_lines if line.strip()
+        )
+        emails.append(current_email)
+
+    return [EmailRecord.from_dict(email) for email in emails]
+
+
+def connect_smtp():
+    """Open an SMTP connection to SMTP_SERVER/SMTP_PORT and log in"""
+    import smtplib
+
+    username, password = _credentials()
+    server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+    port = int(os.getenv("SMTP_PORT", "465"))
+    smtp = smtplib.SMTP_SSL(server, port)
+    smtp.login(username, password)
+    return smtp
+
+
+def _message(subject, body, recipient_email):
+    from email.message import EmailMessage
+
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = _credentials()[0]
+    msg["To"] = recipient_email
+    msg.set_content(body)
+    return msg
+
+
+def send_email(subject: str, body: str, recipient_email: str) -> bool:
+    """Send a plain-text email through SMTP_SERVER/SMTP_PORT"""
+    with connect_smtp() as smtp:
+        smtp.send_message(_message(subject, body, recipient_email))
+
+    return True
+
+
+class MailSession:
+    """IMAP and SMTP connections kept open between uses by a long-running process.
+
+    Before each use the connection is checked with NOOP and opened again if
+    the server has dropped it, so an idle timeout costs one reconnect.
+    """
+
+    def __init__(self):
+        self._imap = None
+        self._smtp = None
+        self._imap_lock = threading.Lock()
+        self._smtp_lock = threading.Lock()
+
+    def _imap_connection(self):
+        import imaplib
+
+        if self._imap is not None:
+            try:
+                if self._imap.noop()[0] == "OK":
+                    return self._imap
+            except (imaplib.IMAP4.error, OSError):
+                pass
+            self._close_imap()
+        imap = connect_imap()
+        _login(imap)
+        metrics.count("imap_connects")
+        self._imap = imap
+        return imap
+
+    def _smtp_connection(self):
+        import smtplib
+
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close_smtp()
+        self._smtp = connect_smtp()
+        metrics.count("smtp_connects")
+        return self._smtp
+
+    def fetch_mailboxes(self, hours, days, path):
+        """Like fetch_mailboxes, over the session's IMAP connection"""
+        if local_mailbox():
+            return fetch_mailboxes(hours, days, path)
+        with self._imap_lock:
+            imap = self._imap_connection()
+            return _fetch_inbox(imap, hours, path), _fetch_sent(imap, days)
+
+    def send_email(self, subject, body, recipient_email):
+        """Like send_email, over the session's SMTP connection"""
+        with self._smtp_lock:
+            self._smtp_connection().send_message(_message(subject, body, recipient_email))
+        return True
+
+    def _close_imap(self):
+        try:
+            self._imap.logout()
+        except Exception:
+            pass
+        self._imap = None
+
+    def _close_smtp(self):
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def close(self):
+        with self._imap_lock:
+            if self._imap is not None:
+                self._close_imap()
+        with self._smtp_lock:
+            if self._smtp is not None:
+                self._close_smtp()
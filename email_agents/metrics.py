@@ -0,0 +1,361 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Where run records are written; one JSON record and one Prometheus textfile per run
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
+
+# Set EMAIL_DEBUG=1 to print every analysis result while a run is going
+DEBUG = os.getenv("EMAIL_DEBUG", "").lower() in ("1", "true", "yes")
+
+# USD per 1M tokens: (input, cached input, output). Adjust when prices change.
+MODEL_PRICES = {
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4": (30.00, 30.00, 60.00),
+}
+
+# Backends that cost nothing per token
+FREE_BACKENDS = {"local"}
+
+# Tasks whose replies are parsed into a schema; their parse failures are counted
+STRUCTURED_TASKS = ("importance", "categorize")
+
+
+def debug(message):
+    """Print a message only when EMAIL_DEBUG is enabled"""
+    if DEBUG:
+        print(message)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0, backend=None):
+    """Estimate the USD cost of one call from MODEL_PRICES (0 for unknown or local models)"""
+    if backend in FREE_BACKENDS:
+        return 0.0
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        # Dated snapshots such as gpt-4.1-2025-04-14 share the base model's price
+        matches = [name for name in MODEL_PRICES if model.startswith(name + "-")]
+        prices = MODEL_PRICES[max(matches, key=len)] if matches else None
+    if prices is None:
+        return 0.0
+    input_price, cached_price, output_price = prices
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1_000_000
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _usage_value(usage, name):
+    value = getattr(usage, name, None) if usage is not None else None
+    if value is None and isinstance(usage, dict):
+        value = usage.get(name)
+    return value or 0
+
+
+def _cascade_summary(calls):
+    """First-pass calls, escalations and escalation rate per task that ran a cascade"""
+    summary = {}
+    for task in sorted({call["task"] for call in calls if call.get("tier") == "fast"}):
+        first_pass = sum(1 for call in calls if call["task"] == task and call.get("tier") == "fast")
+        escalated = sum(1 for call in calls if call["task"] == task and call.get("tier", "full") == "full")
+        summary[task] = {"first_pass": first_pass, "escalated": escalated,
+                         "escalation_rate": round(escalated / first_pass, 4)}
+    return summary
+
+
+def _preclassifier_summary(counters):
+    """Emails seen and settled locally per task, i.e. the share of model calls avoided"""
+    summary = {}
+    for name, seen in sorted(counters.items()):
+        if name.startswith("preclassifier_seen_") and seen:
+            task = name[len("preclassifier_seen_"):]
+            settled = counters.get(f"preclassifier_settled_{task}", 0)
+            summary[task] = {"seen": seen, "settled": settled, "calls_avoided_rate": round(settled / seen, 4)}
+    return summary
+
+
+def _parse_failure_summary(calls, counters):
+    """Replies that did not match the schema per classifier task, out of its model calls"""
+    summary = {}
+    for task in STRUCTURED_TASKS:
+        replies = sum(1 for call in calls if call["task"] == task)
+        if replies:
+            failures = counters.get(f"parse_failures_{task}", 0)
+            summary[task] = {"replies": replies, "failures": failures, "failure_rate": round(failures / replies, 4)}
+    return summary
+
+
+def _responder_summary(counters):
+    """Responses sent and the edit rounds it took to get them right"""
+    sent = counters.get("responses_sent", 0)
+    if not sent and not counters.get("edit_rounds", 0):
+        return {}
+    rounds = counters.get("edit_rounds_sent", 0)
+    return {"sent": sent, "edit_rounds": counters.get("edit_rounds", 0),
+            "rounds_per_sent_email": round(rounds / sent, 4) if sent else None}
+
+
+class RunMetrics:
+    """Stage timings, LLM calls and counters collected during one run"""
+
+    def __init__(self, name="run"):
+        self.name = name
+        self.started_at = datetime.now().isoformat()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.llm_calls = []
+        self.counters = {}
+        self.timings = {}
+
+    @contextmanager
+    def span(self, stage):
+        """Time a block of work and add it to the stage totals"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(stage, time.perf_counter() - start)
+
+    def add_stage_time(self, stage, seconds, calls=1):
+        with self._lock:
+            totals = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+            totals["seconds"] += seconds
+            totals["calls"] += calls
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        """Record one duration of a repeated interactive step, e.g. an edit round"""
+        with self._lock:
+            self.timings.setdefault(name, []).append(seconds)
+
+    def record_llm_call(self, task, backend, model, latency, usage=None, tier="full"):
+        """Record one completed chat completion with its token usage and estimated cost"""
+        prompt_tokens = _usage_value(usage, "prompt_tokens")
+        completion_tokens = _usage_value(usage, "completion_tokens")
+        details = getattr(usage, "prompt_tokens_details", None) if usage is not None else None
+        if details is None and isinstance(usage, dict):
+            details = usage.get("prompt_tokens_details")
+        cached_tokens = _usage_value(details, "cached_tokens")
+        call = {
+            "task": task,
+            "tier": tier,
+            "backend": backend,
+            "model": model,
+            "latency": latency,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "cost": estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens, backend),
+        }
+        with self._lock:
+            self.llm_calls.append(call)
+        if cached_tokens:
+            self.count("prompt_cache_hits")
+
+    def _llm_summary(self, calls):
+        latencies = [call["latency"] for call in calls]
+        return {
+            "calls": len(calls),
+            "latency_seconds": {
+                "total": sum(latencies),
+                "p50": _percentile(latencies, 0.5),
+                "p95": _percentile(latencies, 0.95),
+                "max": max(latencies) if latencies else 0.0,
+            },
+            "prompt_tokens": sum(call["prompt_tokens"] for call in calls),
+            "completion_tokens": sum(call["completion_tokens"] for call in calls),
+            "cached_tokens": sum(call["cached_tokens"] for call in calls),
+            "cost_usd": round(sum(call["cost"] for call in calls), 6),
+        }
+
+    def to_dict(self):
+        """Build the JSON run record"""
+        with self._lock:
+            calls = list(self.llm_calls)
+            stages = {name: dict(values) for name, values in self.stages.items()}
+            counters = dict(self.counters)
+            timings = {name: list(values) for name, values in self.timings.items()}
+        by_task = {}
+        for call in calls:
+            by_task.setdefault(call["task"], []).append(call)
+        by_model = {}
+        for call in calls:
+            by_model.setdefault(f"{call['backend']}/{call['model']}", []).append(call)
+        by_tier = {}
+        for call in calls:
+            by_tier.setdefault(call.get("tier", "full"), []).append(call)
+        return {
+            "run": self.name,
+            "started_at": self.started_at,
+            "duration_seconds": time.perf_counter() - self._start,
+            "stages": stages,
+            "llm": {
+                **self._llm_summary(calls),
+                "by_task": {task: self._llm_summary(items) for task, items in by_task.items()},
+                "by_model": {model: self._llm_summary(items) for model, items in by_model.items()},
+                "by_tier": {tier: self._llm_summary(items) for tier, items in by_tier.items()},
+                "cascade": _cascade_summary(calls),
+                "preclassifier": _preclassifier_summary(counters),
+                "parse_failures": _parse_failure_summary(calls, counters),
+            },
+            "timings": {name: {"count": len(values), "total": sum(values), "p50": _percentile(values, 0.5),
+                               "p95": _percentile(values, 0.95), "max": max(values)}
+                        for name, values in timings.items()},
+            "responder": _responder_summary(counters),
+            "counters": counters,
+        }
+
+    def to_prometheus(self):
+        """Render the run in the Prometheus text exposition format"""
+        record = self.to_dict()
+        run = record["run"]
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP email_agents_{name} {help_text}")
+            lines.append(f"# TYPE email_agents_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{value_}"' for key, value_ in (("run", run),) + labels)
+                lines.append(f"email_agents_{name}{{{label_text}}} {value}")
+
+        metric("run_duration_seconds", "gauge", "Wall time of the last run.",
+               [((), round(record["duration_seconds"], 6))])
+        metric("run_timestamp_seconds", "gauge", "Unix time the last run finished.", [((), int(time.time()))])
+        metric("stage_seconds", "gauge", "Time spent per stage in the last run.",
+               [((("stage", stage),), round(values["seconds"], 6)) for stage, values in record["stages"].items()])
+        metric("stage_calls", "gauge", "Number of times each stage ran in the last run.",
+               [((("stage", stage),), values["calls"]) for stage, values in record["stages"].items()])
+
+        with self._lock:
+            calls = list(self.llm_calls)
+        by_model = {}
+        for call in calls:
+            key = (("task", call["task"]), ("backend", call["backend"]), ("model", call["model"]))
+            by_model.setdefault(key, []).append(call)
+        metric("llm_calls", "gauge", "LLM calls in the last run.",
+               [(key, len(calls)) for key, calls in by_model.items()])
+        metric("llm_latency_seconds_sum", "gauge", "Total LLM call latency in the last run.",
+               [(key, round(sum(c["latency"] for c in calls), 6)) for key, calls in by_model.items()])
+        metric("llm_latency_seconds_max", "gauge", "Slowest LLM call in the last run.",
+               [(key, round(max(c["latency"] for c in calls), 6)) for key, calls in by_model.items()])
+        token_samples = []
+        for key, calls in by_model.items():
+            for kind in ("prompt", "completion", "cached"):
+                token_samples.append((key + (("kind", kind),), sum(c[f"{kind}_tokens"] for c in calls)))
+        metric("llm_tokens", "gauge", "Tokens used in the last run.", token_samples)
+        metric("llm_cost_usd", "gauge", "Estimated LLM cost of the last run.",
+               [(key, round(sum(c["cost"] for c in calls), 6)) for key, calls in by_model.items()])
+        metric("llm_escalation_rate", "gauge", "Share of first-pass classifications sent on to the main model.",
+               [((("task", task),), values["escalation_rate"]) for task, values in record["llm"]["cascade"].items()])
+        metric("llm_parse_failure_rate", "gauge", "Share of classifier replies that did not match the schema.",
+               [((("task", task),), values["failure_rate"]) for task, values in record["llm"]["parse_failures"].items()])
+        metric("timing_seconds", "gauge", "Median and 95th percentile of interactive steps in the last run.",
+               [((("step", name), ("quantile", quantile)), round(values[key], 6))
+                for name, values in record["timings"].items() for quantile, key in (("0.5", "p50"), ("0.95", "p95"))])
+        if record["responder"].get("rounds_per_sent_email") is not None:
+            metric("edit_rounds_per_sent_email", "gauge", "Edit rounds per response sent in the last run.",
+                   [((), record["responder"]["rounds_per_sent_email"])])
+        metric("events", "gauge", "Retries, cache hits and other counters from the last run.",
+               [((("event", name),), value) for name, value in sorted(record["counters"].items())])
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory=None):
+        """Write <run>.json and <run>.prom, replacing the previous run's files atomically"""
+        directory = directory or METRICS_DIR
+        os.makedirs(directory, exist_ok=True)
+        record = self.to_dict()
+        paths = {}
+        for suffix, content in (("json", json.dumps(record, indent=2)), ("prom", self.to_prometheus())):
+            path = os.path.join(directory, f"{self.name}.{suffix}")
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+            paths[suffix] = path
+        return paths
+
+    def summary(self):
+        """One-line human readable summary for the end of a run"""
+        record = self.to_dict()
+        stages = ", ".join(f"{name} {values['seconds']:.2f}s" for name, values in record["stages"].items())
+        llm = record["llm"]
+        text = (f"Run {self.name}: {record['duration_seconds']:.2f}s ({stages}); "
+                f"{llm['calls']} LLM calls, {llm['prompt_tokens'] + llm['completion_tokens']} tokens, "
+                f"~${llm['cost_usd']:.4f}")
+        for task, values in llm["preclassifier"].items():
+            text += f"; {task} settled locally {values['settled']}/{values['seen']} ({values['calls_avoided_rate']:.0%})"
+        for task, values in llm["parse_failures"].items():
+            if values["failures"]:
+                text += f"; {task} unparsable replies {values['failures']}/{values['replies']}"
+        responder = record["responder"]
+        if responder:
+            text += f"; {responder['sent']} responses sent, {responder['edit_rounds']} edit rounds"
+            if responder["rounds_per_sent_email"] is not None:
+                text += f" ({responder['rounds_per_sent_email']:.1f} per sent email)"
+        if "edit_round" in record["timings"]:
+            text += f", edit p50 {record['timings']['edit_round']['p50']:.2f}s"
+        for task, values in llm["cascade"].items():
+            text += f"; {task} escalated {values['escalated']}/{values['first_pass']} ({values['escalation_rate']:.0%})"
+        for task in STRUCTURED_TASKS:
+            if record["counters"].get(f"deferred_{task}"):
+                text += f"; {task} deferred {record['counters'][f'deferred_{task}']} to the next run"
+        return text
+
+
+_current = RunMetrics()
+# A run bound to one piece of work, such as a service job, wins over the process-wide one
+_bound = contextvars.ContextVar("run", default=None)
+
+
+def start_run(name):
+    """Start collecting metrics for a new run and make it the current one"""
+    global _current
+    _current = RunMetrics(name)
+    return _current
+
+
+@contextmanager
+def bound_run(run):
+    """Collect into ``run`` in this context only, leaving other threads' current run alone.
+
+    Worker threads see it when they run in a copy of the context (contextvars.copy_context).
+    """
+    token = _bound.set(run)
+    try:
+        yield run
+    finally:
+        _bound.reset(token)
+
+
+def current():
+    """The run metrics are being collected for"""
+    return _bound.get() or _current
+
+
+def span(stage):
+    return current().span(stage)
+
+
+def count(name, amount=1):
+    current().count(name, amount)
+
+
+def observe(name, seconds):
+    current().observe(name, seconds)
@@ -0,0 +1,131 @@
+import os
+import re
+import sys
+from email.feedparser import BytesFeedParser
+from email.message import Message
+from email.parser import BytesHeaderParser
+from email.utils import getaddresses
+
+from email_agents.records import EmailRecord
+
+# Only the first MAX_MESSAGE_BYTES of each message are downloaded and parsed.
+# The text body sits at the start of nearly every message, so a large
+# attachment past the cap is never transferred at all. Set to 0 for no cap.
+MAX_MESSAGE_BYTES = int(os.getenv("MAX_MESSAGE_BYTES", str(512 * 1024)))
+
+# Bytes handed to the parser at a time
+CHUNK_SIZE = 64 * 1024
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_SCRIPT_RE = re.compile(r"<(script|style)\b.*?</\1>", re.IGNORECASE | re.DOTALL)
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+
+
+class _TextOnlyMessage(Message):
+    """Message part that keeps inline text payloads and drops everything else while parsing"""
+
+    def set_payload(self, payload, charset=None):
+        if self.get_content_maintype() == "text" and self.get_content_disposition() != "attachment":
+            super().set_payload(payload, charset)
+        else:
+            super().set_payload("", charset)
+
+
+def fetch_spec(max_bytes=None, thread_id=False):
+    """IMAP FETCH items for a message body capped at max_bytes (never marks the message as read).
+
+    With thread_id=True the Gmail X-GM-THRID is fetched as well.
+    """
+    max_bytes = MAX_MESSAGE_BYTES if max_bytes is None else max_bytes
+    body = f"BODY.PEEK[]<0.{max_bytes}>" if max_bytes else "BODY.PEEK[]"
+    return f"(X-GM-THRID {body})" if thread_id else f"({body})"
+
+
+def _decode(payload, charset):
+    try:
+        return payload.decode(charset, errors="replace")
+    except LookupError:
+        return payload.decode("utf-8", errors="replace")
+
+
+def html_to_text(html):
+    """Very small HTML to text conversion for HTML-only emails"""
+    text = _SCRIPT_RE.sub("", html)
+    text = re.sub(r"<br\s*/?>|</p>|</div>", "\n", text, flags=re.IGNORECASE)
+    text = _TAG_RE.sub("", text)
+    text = text.replace("&nbsp;", " ").replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">")
+    return _BLANK_LINES_RE.sub("\n\n", text)
+
+
+def body_part(msg):
+    """(payload bytes, charset, is_html) of the first inline text/plain part, else of text/html, else None"""
+    html = None
+    for part in msg.walk():
+        if part.is_multipart() or part.get_content_disposition() == "attachment":
+            continue
+        content_type = part.get_content_type()
+        if content_type == "text/plain":
+            return part.get_payload(decode=True) or b"", sys.intern(part.get_content_charset() or "utf-8"), False
+        if content_type == "text/html" and html is None:
+            html = part
+    if html is None:
+        return None
+    return html.get_payload(decode=True) or b"", sys.intern(html.get_content_charset() or "utf-8"), True
+
+
+def decode_body(payload, charset, is_html):
+    """Body text from the raw bytes of its part"""
+    text = _decode(payload, charset)
+    return (html_to_text(text) if is_html else text).strip()
+
+
+def extract_body(msg):
+    """Return the first inline text/plain body, falling back to text/html converted to text"""
+    part = body_part(msg)
+    return decode_body(*part) if part else ""
+
+
+def _header(msg, name):
+    """Header value with folding whitespace collapsed"""
+    return " ".join(str(msg.get(name, "")).split())
+
+
+def parse_message(raw, max_bytes=None):
+    """Parse raw message bytes into an EmailRecord {subject, from, received, body}.
+
+    The record also carries the threading headers (message_id, in_reply_to,
+    references) and the recipients in ``to``. Only the raw bytes of the text
+    part are kept; the body is decoded the first time it is read.
+
+    The message is fed to BytesFeedParser in chunks and cut at max_bytes;
+    attachments and other non-text parts are dropped without being decoded.
+    """
+    max_bytes = MAX_MESSAGE_BYTES if max_bytes is None else max_bytes
+    view = memoryview(raw)
+    if max_bytes:
+        view = view[:max_bytes]
+    parser = BytesFeedParser(_factory=_TextOnlyMessage)
+    for start in range(0, len(view), CHUNK_SIZE):
+        parser.feed(bytes(view[start:start + CHUNK_SIZE]))
+    msg = parser.close()
+    return EmailRecord(
+        subject=msg.get("Subject", ""),
+        sender=msg.get("From", ""),
+        received=msg.get("Date", ""),
+        message_id=_header(msg, "Message-ID"),
+        in_reply_to=_header(msg, "In-Reply-To"),
+        references=_header(msg, "References"),
+        # The same recipients recur in nearly every message, so one copy is shared
+        to=sys.intern(", ".join(address for _, address in getaddresses(msg.get_all("To", []) + msg.get_all("Cc", [])))),
+        part=body_part(msg),
+    )
+
+
+def parse_sent_headers(raw):
+    """Parse only the headers of a sent message into a {subject, recipients, sent_time} record"""
+    msg = BytesHeaderParser().parsebytes(raw)
+    return {
+        "subject": msg.get("Subject", ""),
+        "recipients": [address for _, address in getaddresses(msg.get_all("To", []) + msg.get_all("Cc", []))],
+        "sent_time": msg.get("Date", "")
+    }
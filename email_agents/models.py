@@ -0,0 +1,91 @@
+"""Structured results returned by the models.
+
+Importing pydantic and building these classes is the most expensive part of
+startup, so scripts import this module only when they analyze emails.
+"""
+import os
+from typing import Annotated, List, Literal, Optional
+
+from pydantic import BaseModel, BeforeValidator, Field
+
+# Send the classifiers' JSON schema as a strict json_schema response format
+# (0 falls back to plain JSON mode for servers without structured outputs)
+STRICT_SCHEMA = os.getenv("LLM_STRICT_SCHEMA", "1") == "1"
+# Longest reason a classifier may write, and most topics it may list
+REASON_MAX_CHARS = int(os.getenv("LLM_REASON_MAX_CHARS", "120"))
+MAX_TOPICS = int(os.getenv("LLM_MAX_TOPICS", "3"))
+# Let the model answer reason=null for low-importance and "other" emails, which nobody reads
+OMIT_LOW_REASONS = os.getenv("LLM_OMIT_LOW_REASONS", "0") == "1"
+
+
+def _clip_reason(value):
+    # Replies and checkpoints from before the limit are clipped instead of rejected
+    return "" if value is None else value[:REASON_MAX_CHARS] if isinstance(value, str) else value
+
+
+def _clip_topics(value):
+    return list(value)[:MAX_TOPICS] if isinstance(value, (list, tuple)) else value
+
+
+Reason = Annotated[str, Field(max_length=REASON_MAX_CHARS), BeforeValidator(_clip_reason)]
+Topics = Annotated[List[str], Field(max_length=MAX_TOPICS), BeforeValidator(_clip_topics)]
+
+
+class EmailImportance(BaseModel):
+    importance: Literal["high", "medium", "low"]
+    reason: Reason
+    needs_response: bool
+    time_sensitive: bool
+    topics: Topics
+    # Older checkpoints and some models leave it out
+    confidence: Optional[float] = None
+
+
+class EmailAnalysis(BaseModel):
+    category: Literal["sponsorship", "business_inquiry", "other"]
+    confidence: float
+    reason: Reason
+    company_name: Optional[str] = None
+    topic: Optional[str] = None
+
+
+# Keywords strict mode rejects; the prompts state these limits and validation clips to them
+_UNSUPPORTED_KEYWORDS = ("maxLength", "minLength", "default", "title")
+
+
+def _strict(schema):
+    if isinstance(schema, list):
+        return [_strict(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    schema = {key: {name: _strict(field) for name, field in value.items()} if key in ("properties", "$defs")
+              else _strict(value)
+              for key, value in schema.items() if key not in _UNSUPPORTED_KEYWORDS}
+    if schema.get("type") == "object":
+        # Strict mode needs every property listed as required and nothing else allowed
+        schema["required"] = list(schema.get("properties", {}))
+        schema["additionalProperties"] = False
+    return schema
+
+
+def strict_schema(model, nullable=()):
+    """JSON schema of ``model`` in the form strict structured outputs accept.
+
+    Fields in ``nullable`` may also be answered with null.
+    """
+    schema = _strict(model.model_json_schema())
+    for name in nullable:
+        field = schema["properties"][name]
+        if "anyOf" not in field:
+            schema["properties"][name] = {"anyOf": [field, {"type": "null"}]}
+    return schema
+
+
+def response_format(model, nullable=()):
+    """``response_format`` argument asking for replies that match ``model``"""
+    if not STRICT_SCHEMA:
+        return {"type": "json_object"}
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": model.__name__, "strict": True, "schema": strict_schema(model, nullable)},
+    }
@@ -0,0 +1,83 @@
+"""Parse fetched messages in a pool of worker processes.
+
+MIME parsing and charset decoding are CPU bound, so on a large backfill a
+single process parses on one core while the connection sits idle. With
+PARSE_WORKERS set, raw message bytes are handed to worker processes in
+batches of PARSE_BATCH while the next messages download. The workers parse,
+decode the body and send back compact tuples that become EmailRecords here.
+"""
+import os
+import sys
+from collections import deque
+
+from email_agents import metrics
+from email_agents.mime_parse import parse_message
+from email_agents.records import EmailRecord
+
+# Worker processes for parsing (0 parses in this process)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+# Messages sent to a worker at a time; larger batches mean less pickling overhead
+PARSE_BATCH = int(os.getenv("PARSE_BATCH", "200"))
+
+# Batches per worker that may wait to be parsed, bounding the raw bytes held
+_IN_FLIGHT_PER_WORKER = 2
+
+
+def parse_batch(raws, max_bytes=None):
+    """Worker side: parse raw messages into tuples in EmailRecord argument order, body decoded"""
+    parsed = []
+    for raw in raws:
+        record = parse_message(raw, max_bytes)
+        parsed.append((record.subject, record.sender, record.received, record.body, record.message_id,
+                       record.in_reply_to, record.references, record.to))
+    return parsed
+
+
+def _records(tags, future):
+    with metrics.span("parse"):
+        parsed = future.result()
+    for tag, fields in zip(tags, parsed):
+        record = EmailRecord(*fields)
+        # Interning does not survive the trip between processes
+        record.to = sys.intern(record.to)
+        yield tag, record
+
+
+def parse_stream(items, workers=None, batch=None, max_bytes=None):
+    """Yield (tag, EmailRecord) for every (tag, raw bytes) pair, in order.
+
+    With workers the messages are parsed in a process pool while ``items``
+    keeps producing the next ones; with none they are parsed here, with the
+    body decoded lazily as usual.
+    """
+    workers = PARSE_WORKERS if workers is None else workers
+    batch = batch or PARSE_BATCH
+    if workers < 1:
+        for tag, raw in items:
+            with metrics.span("parse"):
+                record = parse_message(raw, max_bytes)
+            yield tag, record
+        return
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    metrics.count("parse_workers", workers)
+    # spawn, as forking a process that holds sockets and threads is unsafe
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque()
+        tags, raws = [], []
+        for tag, raw in items:
+            tags.append(tag)
+            raws.append(raw)
+            if len(raws) >= batch:
+                pending.append((tags, pool.submit(parse_batch, raws, max_bytes)))
+                metrics.count("parse_batches")
+                tags, raws = [], []
+                while len(pending) > workers * _IN_FLIGHT_PER_WORKER:
+                    yield from _records(*pending.popleft())
+        if raws:
+            pending.append((tags, pool.submit(parse_batch, raws, max_bytes)))
+            metrics.count("parse_batches")
+        while pending:
+            yield from _records(*pending.popleft())
@@ -0,0 +1,215 @@
+"""Local naive Bayes pre-classifier learned from past model verdicts.
+
+Each task keeps hashed word and bigram counts per label, plus a table of the
+labels every sender has received. Emails whose outcome is clear-cut and needs
+nothing from the user (low importance, category "other") are settled locally;
+everything else still goes to the language model, and its verdicts are added
+to the counts at the end of every run.
+"""
+import json
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from functools import lru_cache
+
+from email_agents import metrics
+from email_agents.checkpoint import atomic_write_json
+
+PRECLASSIFIER_FILE = os.getenv("PRECLASSIFIER_FILE", "preclassifier.json")
+# Posterior probability needed to settle an email without the model
+PRECLASSIFIER_THRESHOLD = float(os.getenv("PRECLASSIFIER_THRESHOLD", "0.98"))
+# Verdicts a task needs before anything is settled locally
+PRECLASSIFIER_MIN_SAMPLES = int(os.getenv("PRECLASSIFIER_MIN_SAMPLES", "200"))
+# Verdicts, all with the same label, after which a sender's emails are settled on reputation
+# when the classifier's most likely label agrees
+SENDER_MIN_VERDICTS = int(os.getenv("PRECLASSIFIER_SENDER_MIN", "5"))
+
+HASH_BITS = 18
+_HASH_MASK = (1 << HASH_BITS) - 1
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9'_-]+")
+_ADDRESS_RE = re.compile(r"<([^<>]+)>")
+# Characters of the body used as features
+BODY_CHARS = 2000
+
+# Labels a task may settle locally: outcomes that never surface to the user
+SETTLE_LABELS = {"importance": ("low",), "categorize": ("other",)}
+
+
+def _label(task, analysis):
+    if task == "importance":
+        return "respond" if analysis.needs_response else analysis.importance
+    return analysis.category
+
+
+def _analysis(task, label, probability, reason):
+    from email_agents.models import EmailAnalysis, EmailImportance
+
+    if task == "importance":
+        return EmailImportance(importance=label, reason=reason, needs_response=False, time_sensitive=False,
+                               topics=[], confidence=probability)
+    return EmailAnalysis(category=label, confidence=probability, reason=reason)
+
+
+def _sender(email):
+    sender = email.get("from", "")
+    match = _ADDRESS_RE.search(sender)
+    return (match.group(1) if match else sender).strip().lower()
+
+
+@lru_cache(maxsize=1 << 16)
+def _bucket(token):
+    # crc32 rather than hash(), which changes between processes
+    return zlib.crc32(token.encode("utf-8")) & _HASH_MASK
+
+
+def features(email):
+    """Hashed feature counts {bucket: count} for subject, body, sender and sender domain"""
+    sender = _sender(email)
+    text = f"{email.get('subject', '')}\n{email.get('body', '')[:BODY_CHARS]}".lower()
+    words = _TOKEN_RE.findall(text)
+    tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    tokens += [f"from:{sender}", f"domain:{sender.rsplit('@', 1)[-1]}"]
+    return Counter(map(_bucket, tokens))
+
+
+class PreClassifier:
+    """Multinomial naive Bayes over hashed features with a per-sender reputation table"""
+
+    def __init__(self, task, state=None, threshold=None, min_samples=None, sender_min=None):
+        self.task = task
+        state = state or {}
+        self.label_counts = dict(state.get("label_counts", {}))
+        # JSON keeps the feature buckets as strings
+        self.feature_counts = {label: {int(bucket): count for bucket, count in counts.items()}
+                               for label, counts in state.get("feature_counts", {}).items()}
+        self.feature_totals = dict(state.get("feature_totals", {}))
+        self.senders = {sender: dict(labels) for sender, labels in state.get("senders", {}).items()}
+        self.threshold = PRECLASSIFIER_THRESHOLD if threshold is None else threshold
+        self.min_samples = PRECLASSIFIER_MIN_SAMPLES if min_samples is None else min_samples
+        self.sender_min = SENDER_MIN_VERDICTS if sender_min is None else sender_min
+
+    @classmethod
+    def load(cls, task, path=None, history=(), **options):
+        """Load a task's state; the first time, train it from earlier JSON outputs in ``history``"""
+        try:
+            with open(path or PRECLASSIFIER_FILE, "r", encoding="utf-8") as f:
+                state = json.load(f).get(task)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = None
+        model = cls(task, state, **options)
+        if state is None:
+            for history_path in history:
+                model.learn(_verdicts_from_output(history_path))
+        return model
+
+    def save(self, path=None):
+        """Write this task's state, keeping the other tasks' state in the file"""
+        path = path or PRECLASSIFIER_FILE
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        data[self.task] = {
+            "label_counts": self.label_counts,
+            "feature_counts": self.feature_counts,
+            "feature_totals": self.feature_totals,
+            "senders": self.senders,
+        }
+        atomic_write_json(path, data)
+
+    @property
+    def samples(self):
+        return sum(self.label_counts.values())
+
+    def learn(self, verdicts):
+        """Add (email, analysis) pairs from the language model to the counts"""
+        learned = 0
+        for email, analysis in verdicts:
+            label = _label(self.task, analysis)
+            self.label_counts[label] = self.label_counts.get(label, 0) + 1
+            counts = self.feature_counts.setdefault(label, {})
+            for bucket, count in features(email).items():
+                counts[bucket] = counts.get(bucket, 0) + count
+                self.feature_totals[label] = self.feature_totals.get(label, 0) + count
+            sender = _sender(email)
+            if sender:
+                labels = self.senders.setdefault(sender, {})
+                labels[label] = labels.get(label, 0) + 1
+            learned += 1
+        return learned
+
+    def probabilities(self, email):
+        """Posterior probability of each label for an email"""
+        total = self.samples
+        if not total:
+            return {}
+        vocabulary = 1 << HASH_BITS
+        email_features = features(email).items()
+        length = sum(count for _, count in email_features)
+        scores = {}
+        for label, label_count in self.label_counts.items():
+            counts = self.feature_counts.get(label, {})
+            # Laplace smoothing: unseen buckets contribute log(1) = 0 to the sum
+            score = math.log(label_count / total) - length * math.log(self.feature_totals.get(label, 0) + vocabulary)
+            for bucket, count in email_features:
+                seen = counts.get(bucket)
+                if seen:
+                    score += count * math.log(seen + 1)
+            scores[label] = score
+        best = max(scores.values())
+        exps = {label: math.exp(score - best) for label, score in scores.items()}
+        norm = sum(exps.values())
+        return {label: value / norm for label, value in exps.items()}
+
+    def predict(self, email):
+        """(label, probability, how) when the email can be settled locally, else None"""
+        settle = SETTLE_LABELS.get(self.task, ())
+        if self.samples < self.min_samples:
+            return None
+        history = self.senders.get(_sender(email), {})
+        # A sender who ever got any other verdict always goes to the model
+        if any(label not in settle for label in history):
+            return None
+        probabilities = self.probabilities(email)
+        label = max(probabilities, key=probabilities.get)
+        if label not in settle:
+            return None
+        if probabilities[label] >= self.threshold:
+            return label, probabilities[label], f"{probabilities[label]:.0%} like past {label} emails"
+        # Reputation lowers the bar but never overrides the words: the first urgent email
+        # from a usually-low sender reads unlike their past ones and goes to the model
+        count = history.get(label, 0)
+        if len(history) == 1 and count >= self.sender_min:
+            return label, probabilities[label], f"sender always rated {label} ({count} past emails)"
+        return None
+
+    def settle(self, emails):
+        """Split emails into ([(email, analysis)] settled locally, [email] for the model)"""
+        settled, remaining = [], []
+        for email in emails:
+            prediction = self.predict(email)
+            if prediction is None:
+                remaining.append(email)
+                continue
+            label, probability, how = prediction
+            settled.append((email, _analysis(self.task, label, round(probability, 4), f"Settled locally: {how}.")))
+        metrics.count(f"preclassifier_seen_{self.task}", len(emails))
+        metrics.count(f"preclassifier_settled_{self.task}", len(settled))
+        return settled, remaining
+
+
+def _verdicts_from_output(path):
+    """(email, analysis) pairs from a JSON output whose "*_emails" lists carry an "analysis" each"""
+    from types import SimpleNamespace
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+    return [(item, SimpleNamespace(**item["analysis"]))
+            for key, items in data.items() if key.endswith("_emails") and isinstance(items, list)
+            for item in items if item.get("analysis")]
@@ -0,0 +1,113 @@
+"""Compact email records shared by every stage"""
+
+# Record keys in output order; "from" is stored in the ``sender`` slot
+FIELDS = ("subject", "from", "received", "body", "message_id", "in_reply_to", "references", "to")
+# Only present once a stage has set them
+OPTIONAL_FIELDS = ("thread_id", "internaldate", "thread_size")
+
+_SLOTS = {key: "sender" if key == "from" else key for key in FIELDS + OPTIONAL_FIELDS if key != "body"}
+
+
+class EmailRecord:
+    """One email, with the text body decoded from its raw part bytes on first access.
+
+    Records also answer ``record["subject"]``/``record.get("thread_size", 1)``
+    like the dicts they replace, so code and files written for dicts keep working.
+    """
+
+    __slots__ = tuple(_SLOTS.values()) + ("_body", "_raw", "_charset", "_html")
+
+    def __init__(self, subject="", sender="", received="", body=None, message_id="", in_reply_to="",
+                 references="", to="", thread_id=None, internaldate=None, thread_size=None, part=None):
+        self.subject = subject
+        self.sender = sender
+        self.received = received
+        self.message_id = message_id
+        self.in_reply_to = in_reply_to
+        self.references = references
+        self.to = to
+        self.thread_id = thread_id
+        self.internaldate = internaldate
+        self.thread_size = thread_size
+        self._body = body
+        # Payload bytes, charset and type of the text part, until the body is decoded
+        self._raw, self._charset, self._html = part or (None, None, False)
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(body=data.get("body", ""))
+        for key, slot in _SLOTS.items():
+            if key in data:
+                setattr(record, slot, data[key])
+        return record
+
+    @property
+    def body(self):
+        if self._body is None:
+            from email_agents.mime_parse import decode_body
+
+            self._body = decode_body(self._raw, self._charset, self._html) if self._raw is not None else ""
+            self._raw = self._charset = None
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        self._body = value
+        self._raw = self._charset = None
+
+    @property
+    def body_decoded(self):
+        return self._body is not None
+
+    def replace(self, **changes):
+        """Copy of the record with some fields changed; an undecoded body stays undecoded"""
+        record = EmailRecord(body=self._body, part=(self._raw, self._charset, self._html))
+        for slot in _SLOTS.values():
+            setattr(record, slot, getattr(self, slot))
+        for key, value in changes.items():
+            record[key] = value
+        return record
+
+    def to_dict(self, fields=None):
+        """Plain dict of ``fields`` (default: every field that is set) for the JSON outputs"""
+        if fields is None:
+            fields = FIELDS + tuple(key for key in OPTIONAL_FIELDS if getattr(self, _SLOTS[key]) is not None)
+        return {key: self[key] for key in fields}
+
+    # Mapping access, so records can stand in for the email dicts
+
+    def __getitem__(self, key):
+        if key == "body":
+            return self.body
+        value = getattr(self, _SLOTS[key]) if key in _SLOTS else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key == "body":
+            self.body = value
+        elif key in _SLOTS:
+            setattr(self, _SLOTS[key], value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key == "body" or (key in _SLOTS and getattr(self, _SLOTS[key]) is not None)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [key for key in FIELDS + OPTIONAL_FIELDS if key in self]
+
+    def __repr__(self):
+        return f"EmailRecord(subject={self.subject!r}, from={self.sender!r}, received={self.received!r})"
+
+
+def as_dict(email):
+    """JSON-ready dict for an EmailRecord or an email dict"""
+    return email.to_dict() if isinstance(email, EmailRecord) else email
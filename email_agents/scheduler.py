@@ -0,0 +1,150 @@
+"""Classify the most important emails first, within a deadline and a budget.
+
+Every email gets a priority from signals that cost nothing to compute: mail
+from people we have written to, mail addressed to us alone, recent mail and
+busy threads come first; automated and bulk mail comes last. The classifiers
+take the emails in that order, and once a stage's deadline or its token or
+cost budget is used up the rest are deferred to the next run through the
+retry queue, so a partial run has always looked at the most important mail.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import getaddresses, parseaddr, parsedate_to_datetime
+
+from email_agents import metrics
+from email_agents.cascade import looks_automated
+
+# Score of each signal; the highest total is classified first
+KNOWN_CORRESPONDENT = 4.0
+DIRECT = 2.0
+ADDRESSED = 1.0
+BULK = -3.0
+RECENCY = 1.0
+THREAD_MESSAGE = 0.5
+# Hours after which the recency score halves
+RECENCY_HALF_LIFE = 12.0
+# More recipients than this count as a mailing
+MANY_RECIPIENTS = 5
+# Earlier messages in a thread that still add to its score
+MAX_THREAD_MESSAGES = 3
+
+
+def _address(value):
+    return parseaddr(value or "")[1].lower()
+
+
+def known_correspondents(sent_emails):
+    """Addresses we have sent mail to"""
+    return {address.lower() for sent in sent_emails for address in sent.get("recipients", []) if address}
+
+
+def _received(email):
+    try:
+        if email.get("internaldate"):
+            received = datetime.fromisoformat(email["internaldate"])
+        else:
+            received = parsedate_to_datetime(email.get("received", ""))
+    except (TypeError, ValueError, IndexError):
+        return None
+    return received if received.tzinfo else received.replace(tzinfo=timezone.utc)
+
+
+def priority(email, owner="", known=frozenset(), now=None):
+    """Cheap importance estimate of an email; higher is classified sooner"""
+    score = KNOWN_CORRESPONDENT if _address(email.get("from")) in known else 0.0
+    recipients = [address.lower() for _, address in getaddresses([email.get("to", "")]) if address]
+    if len(recipients) > MANY_RECIPIENTS or looks_automated(email):
+        score += BULK
+    elif owner and recipients == [owner]:
+        score += DIRECT
+    elif owner and owner in recipients:
+        score += ADDRESSED
+    received = _received(email)
+    if received is not None:
+        hours = max(0.0, ((now or datetime.now(timezone.utc)) - received).total_seconds() / 3600)
+        score += RECENCY * 0.5 ** (hours / RECENCY_HALF_LIFE)
+    score += THREAD_MESSAGE * min(email.get("thread_size", 1) - 1, MAX_THREAD_MESSAGES)
+    return score
+
+
+class Budget:
+    """Deadline, token and cost limits for one stage's model calls (0 means no limit)"""
+
+    def __init__(self, task, deadline=0.0, max_tokens=0, max_cost=0.0):
+        self.task = task
+        self.deadline = deadline
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self._started = time.monotonic()
+        self._run = metrics.current()
+        # Only calls made after the stage started count against it
+        self._first_call = len(self._run.llm_calls)
+
+    def spent(self):
+        """(tokens, cost) of this task's calls since the stage started"""
+        calls = [call for call in self._run.llm_calls[self._first_call:] if call["task"] == self.task]
+        return (sum(call["prompt_tokens"] + call["completion_tokens"] for call in calls),
+                sum(call["cost"] for call in calls))
+
+    def exhausted(self):
+        """Which limit has been reached ("deadline", "tokens" or "cost"), or None"""
+        if self.deadline and time.monotonic() - self._started >= self.deadline:
+            return "deadline"
+        if self.max_tokens or self.max_cost:
+            tokens, cost = self.spent()
+            if self.max_tokens and tokens >= self.max_tokens:
+                return "tokens"
+            if self.max_cost and cost >= self.max_cost:
+                return "cost"
+        return None
+
+
+class Scheduler:
+    """Orders a stage's emails by priority and stops classifying when its budget runs out"""
+
+    def __init__(self, task, owner="", known=(), budget=None, now=None):
+        self.task = task
+        self.owner = owner.lower()
+        self.known = frozenset(known)
+        self.budget = budget or Budget(task)
+        self.now = now
+        # The limit that stopped the stage, if any
+        self.stopped = None
+
+    @classmethod
+    def from_env(cls, task, sent_emails=()):
+        """Scheduler with the SCHEDULE_* limits; the owner is EMAIL_ADDRESS (or EMAIL_USER)"""
+        budget = Budget(task, deadline=float(os.getenv("SCHEDULE_DEADLINE", "0")),
+                        max_tokens=int(os.getenv("SCHEDULE_MAX_TOKENS", "0")),
+                        max_cost=float(os.getenv("SCHEDULE_MAX_COST", "0")))
+        owner = _address(os.getenv("EMAIL_ADDRESS") or os.getenv("EMAIL_USER") or "")
+        return cls(task, owner, known_correspondents(sent_emails), budget)
+
+    def order(self, emails):
+        """Emails sorted from highest to lowest priority, ties in their original order"""
+        now = self.now or datetime.now(timezone.utc)
+        scores = [priority(email, self.owner, self.known, now) for email in emails]
+        return [emails[index] for index in sorted(range(len(emails)), key=lambda index: -scores[index])]
+
+    def map(self, llm, fn, emails, on_result=None):
+        """Run ``llm.map`` over the emails in priority order; return the ones deferred by the budget"""
+        deferred = []
+        lock = threading.Lock()
+
+        def guarded(email):
+            reason = self.budget.exhausted()
+            if reason is None:
+                return fn(email)
+            with lock:
+                self.stopped = self.stopped or reason
+                deferred.append(email)
+            return None
+
+        # Each backend's pool takes its emails in submission order, so the order holds per backend
+        llm.map(self.task, guarded, self.order(emails), on_result=on_result)
+        if deferred:
+            metrics.count(f"deferred_{self.task}", len(deferred))
+            metrics.count(f"deferred_{self.task}_{self.stopped}")
+        return deferred
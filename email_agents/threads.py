@@ -0,0 +1,108 @@
+"""Group messages into conversations so each thread is classified once"""
+import re
+from datetime import datetime, timezone
+
+from email_agents.records import EmailRecord
+
+_SUBJECT_PREFIX_RE = re.compile(r"^\s*((re|fwd?|aw|sv|wg)\s*(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+# Where the quoted history of a reply starts
+_QUOTE_START_RE = re.compile(
+    r"^\s*(On .{0,200}wrote:|-{2,}\s*Original Message\s*-{2,}|-{2,}\s*Forwarded message\s*-{2,})\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def normalize_subject(subject):
+    """Subject without Re:/Fwd: prefixes, lowercased and with whitespace collapsed"""
+    return " ".join(_SUBJECT_PREFIX_RE.sub("", subject or "").lower().split())
+
+
+def new_content(body):
+    """The part of a reply its sender wrote, without the quoted history"""
+    match = _QUOTE_START_RE.search(body or "")
+    text = body[:match.start()] if match else (body or "")
+    text = "\n".join(line for line in text.splitlines() if not line.lstrip().startswith(">")).strip()
+    return text or (body or "")
+
+
+def _participants(email):
+    from email.utils import getaddresses
+
+    fields = [email.get("from", ""), email.get("to", "")]
+    return frozenset(address.lower() for _, address in getaddresses(fields) if address)
+
+
+def _sent_at(email):
+    """Aware datetime the message arrived, or None when it is unknown"""
+    if email.get("internaldate"):
+        try:
+            return datetime.fromisoformat(email["internaldate"])
+        except ValueError:
+            pass
+    from email.utils import parsedate_to_datetime
+
+    try:
+        sent = parsedate_to_datetime(email.get("received", ""))
+    except (TypeError, ValueError):
+        return None
+    return sent if sent.tzinfo else sent.replace(tzinfo=timezone.utc)
+
+
+def group_threads(emails):
+    """Split emails into threads, each a list ordered oldest first.
+
+    Messages are linked by X-GM-THRID when the server provides one, then by
+    Message-ID/In-Reply-To/References; a message with none of these joins the
+    thread with the same normalized subject and the same participants.
+    """
+    parent = list(range(len(emails)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    def union(a, b):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    first_seen = {}
+
+    def link(key, index):
+        if key in first_seen:
+            union(first_seen[key], index)
+        else:
+            first_seen[key] = index
+
+    for index, email in enumerate(emails):
+        if email.get("thread_id"):
+            link(("thread", email["thread_id"]), index)
+        ids = (email.get("references", "").split() + email.get("in_reply_to", "").split()
+               + email.get("message_id", "").split())
+        for message_id in ids:
+            link(("id", message_id), index)
+        subject = normalize_subject(email.get("subject", ""))
+        if subject and not any(email.get(key) for key in ("thread_id", "references", "in_reply_to")):
+            link(("subject", subject, _participants(email)), index)
+
+    groups = {}
+    for index in range(len(emails)):
+        groups.setdefault(find(index), []).append(index)
+    oldest = datetime.min.replace(tzinfo=timezone.utc)
+    threads = []
+    for indexes in groups.values():
+        indexes.sort(key=lambda i: (_sent_at(emails[i]) or oldest, i))
+        threads.append([emails[i] for i in indexes])
+    return threads
+
+
+def latest_per_thread(emails):
+    """One record per thread: its latest message, cut to what that message adds"""
+    latest = []
+    for thread in group_threads(emails):
+        email = thread[-1]
+        changes = {"body": new_content(email.get("body", "")), "thread_size": len(thread)}
+        latest.append(email.replace(**changes) if isinstance(email, EmailRecord) else dict(email, **changes))
+    return latest
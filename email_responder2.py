@@ -1,12 +1,12 @@
-import os
+import hashlib
 import json
 import re
-from openai import OpenAI
-from dotenv import load_dotenv
-from send_mail2 import send_email  # Importing the placeholder send_email function
-
-# Load environment variables
-load_dotenv(override=True)
+import time
+from datetime import datetime
+from email_agents import metrics
+from email_agents.cassette import CassetteMiss
+from email_agents.llm_backend import LLMRouter
+from email_agents.mail import send_email
 
 # File paths
 NEEDS_RESPONSE_REPORT = "needs_response_report.txt"
@@ -18,6 +18,11 @@ def extract_emails_from_report(report_path=NEEDS_RESPONSE_REPORT):
         with open(report_path, "r", encoding="utf-8") as f:
             content = f.read()
         
+        # The triage run rewrites the report as it goes; show what it has found so far
+        progress = re.search(r"^RUN IN PROGRESS: (.+)$", content, re.MULTILINE)
+        if progress:
+            print(f"Note: the report is still being generated ({progress.group(1)}).")
+        
         # Split the report by the separator
         email_sections = content.split("-" * 50)
         
@@ -79,29 +84,11 @@ def save_response_history(new_response):
         print(f"Error saving response history: {e}")
         return False
 
-def generate_response(client, email_data, edit_instructions=None):
-    """Generate a response email using OpenAI"""
-    if edit_instructions:
-        prompt = f"""
-        Rewrite the email response based on these instructions:
-        
-        Original Email:
-        Subject: {email_data['subject']}
-        From: {email_data['from']}
-        Preview: {email_data['preview'][:500]}
-        
-        Instructions for rewriting: {edit_instructions}
-        
-        Your response should maintain this format:
-        Subject: Re: [Original Subject]
-        
-        [Email body]
-        
-        Best regards,
-        Kris
-        """
-    else:
-        prompt = f"""
+SYSTEM_PROMPT = "You are a professional, concise email responder who crafts helpful, direct responses to business inquiries."
+
+def draft_prompt(email_data, instructions=None):
+    """Prompt for the first draft of a response"""
+    prompt = f"""
         Create a concise and helpful email response for the following inquiry:
         
         Subject: {email_data['subject']}
@@ -125,33 +112,100 @@ def generate_response(client, email_data, edit_instructions=None):
         Best regards,
         Kris
         """
+    if instructions:
+        prompt += f"\n        Additional instructions: {instructions}\n"
+    return prompt
+
+def edit_prompt(instructions):
+    """Turn asking for one change to the draft the model wrote last"""
+    return f"""Edit your draft above: {instructions}
+
+Change only what this asks for and keep the rest of the draft word for word.
+Reply with the complete updated email in the same format, starting with the Subject line."""
+
+def cache_key(email_data):
+    """Prompt cache key shared by the draft and every edit of one response"""
+    raw = f"{email_data['subject']}\0{email_data['from']}"
+    return "respond-" + hashlib.sha1(raw.encode("utf-8", errors="replace")).hexdigest()[:16]
+
+def generate_response(llm, email_data, edit_instructions=None, conversation=None):
+    """Generate a response email, or apply an edit to the current draft.
+
+    ``conversation`` holds the messages of this response so far. When it
+    already contains a draft, ``edit_instructions`` are sent as a new turn
+    after it, so the model edits that draft instead of writing a new one and
+    the unchanged prefix is served from the prompt cache. The reply is
+    appended to ``conversation``.
+    """
+    if conversation is None:
+        conversation = []
+    if conversation:
+        turn = [{"role": "user", "content": edit_prompt(edit_instructions)}]
+    else:
+        turn = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": draft_prompt(email_data, edit_instructions)},
+        ]
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1",  # Use appropriate OpenAI model
-            messages=[
-                {
-                    "role": "system", 
-                    "content": "You are a professional, concise email responder who crafts helpful, direct responses to business inquiries."
-                },
-                {"role": "user", "content": prompt}
-            ]
+        response = llm.chat(
+            "respond",
+            messages=conversation + turn,
+            email=email_data,
+            cache_key=cache_key(email_data)
         )
         
-        return response.choices[0].message.content
+        content = response.choices[0].message.content
+        if content:
+            conversation.extend(turn + [{"role": "assistant", "content": content}])
+        return content
     
+    except CassetteMiss:
+        raise
     except Exception as e:
         print(f"Error generating response: {e}")
         return None
 
-def process_responses():
-    """Process and send responses to important emails"""
-    # Initialize OpenAI client
-    client = OpenAI()
-    
-    # Extract emails from report
-    emails = extract_emails_from_report()
-    
+def split_draft(draft):
+    """(subject line, body) of a generated response"""
+    response_lines = draft.strip().split('\n')
+    return response_lines[0].replace('Subject:', '').strip(), '\n'.join(response_lines[1:]).strip()
+
+def send_response(email_data, subject_line, body, edit_rounds=0, send=None):
+    """Send an approved draft and record it in the response history.
+
+    ``send`` defaults to send_email; a long-running service passes its warm
+    SMTP session. Returns True when the email was sent.
+    """
+    with metrics.span("send"):
+        result = (send or send_email)(subject_line, body, email_data['email_address'])
+    if result:
+        metrics.count("responses_sent")
+        metrics.count("edit_rounds_sent", edit_rounds)
+        # Record this response in history
+        save_response_history({
+            "subject": email_data['subject'],
+            "from": email_data['from'],
+            "responded_at": datetime.now().isoformat()
+        })
+    return result
+
+def emails_from_results(needs_response_emails):
+    """Turn triage results into the records respond() works through, the way the report lists them"""
+    emails = []
+    for email in needs_response_emails:
+        email_address_match = re.search(r"<(.+?)>", email["from"])
+        emails.append({
+            "subject": email["subject"],
+            "from": email["from"],
+            "email_address": email_address_match.group(1).strip() if email_address_match else None,
+            "preview": email["body"][:300] + "...",
+            "already_responded": email["already_responded"]
+        })
+    return emails
+
+def respond(llm, emails):
+    """Walk through emails, drafting, editing and sending a response to each"""
     if not emails:
         print("No emails requiring response found in the report.")
         return
@@ -178,8 +232,10 @@ def process_responses():
         
         print("-" * 50)
         
-        # Generate a response
-        draft_response = generate_response(client, email_data)
+        # Generate a response; edits continue the same conversation
+        conversation = []
+        edit_rounds = 0
+        draft_response = generate_response(llm, email_data, conversation=conversation)
         
         if not draft_response:
             print("Failed to generate a response. Skipping to next email.")
@@ -187,9 +243,7 @@ def process_responses():
         
         while True:
             # Extract subject and body from the generated response
-            response_lines = draft_response.strip().split('\n')
-            subject_line = response_lines[0].replace('Subject:', '').strip()
-            body = '\n'.join(response_lines[1:]).strip()
+            subject_line, body = split_draft(draft_response)
             
             # Display the draft response
             print("\nDRAFT RESPONSE:")
@@ -206,15 +260,8 @@ def process_responses():
             if choice == 'y':
                 if email_data['email_address']:
                     print(f"Sending email to {email_data['email_address']}...")
-                    result = send_email(subject_line, body, email_data['email_address'])
-                    if result:
+                    if send_response(email_data, subject_line, body, edit_rounds):
                         print("Email sent successfully!")
-                        # Record this response in history
-                        save_response_history({
-                            "subject": email_data['subject'],
-                            "from": email_data['from'],
-                            "responded_at": datetime.now().isoformat() if 'datetime' in globals() else "2023-01-01T00:00:00"
-                        })
                     else:
                         print("Failed to send email.")
                 else:
@@ -228,12 +275,16 @@ def process_responses():
                 break
             elif choice == 'edit':
                 # Prompt for edit instructions
-                print("\nDescribe how you want the email rewritten:")
+                print("\nDescribe what to change in the draft:")
                 edit_instructions = input("> ")
                 
-                # Generate a new response based on the edit instructions
-                print("\nGenerating new response based on your instructions...")
-                new_draft = generate_response(client, email_data, edit_instructions)
+                # Apply the instructions to the current draft
+                print("\nEditing the draft...")
+                start = time.perf_counter()
+                new_draft = generate_response(llm, email_data, edit_instructions, conversation)
+                metrics.observe("edit_round", time.perf_counter() - start)
+                metrics.count("edit_rounds")
+                edit_rounds += 1
                 
                 if new_draft:
                     draft_response = new_draft
@@ -248,7 +299,17 @@ def process_responses():
     
     print("\nAll emails processed.")
 
+def process_responses():
+    """Process and send responses to important emails"""
+    run = metrics.start_run("process_responses")
+    
+    # Initialize the LLM backends
+    llm = LLMRouter.from_env()
+    
+    # Extract emails from report
+    respond(llm, extract_emails_from_report())
+    run.write()
+    print(run.summary())
+
 if __name__ == "__main__":
-    # Import datetime here to avoid circular imports 
-    from datetime import datetime
-    process_responses() 
+    process_responses()
@@ -1,31 +1,21 @@
-import os
-from dotenv import load_dotenv
 import json
-from datetime import datetime, timedelta
-from openai import OpenAI
-from pydantic import BaseModel
-from typing import List, Optional, Literal
+from datetime import datetime
 import re
-import imaplib
-import email
-import smtplib
-from email.message import EmailMessage
-
-# Load environment variables
-load_dotenv(override=True)
-
-class EmailImportance(BaseModel):
-    importance: Literal["high", "medium", "low"]
-    reason: str
-    needs_response: bool
-    time_sensitive: bool
-    topics: List[str]
+from email_agents import cascade, mail, metrics
+from email_agents.cassette import CassetteMiss
+from email_agents.checkpoint import Checkpoint, Throttle, atomic_write, atomic_write_json, email_key
+from email_agents.llm_backend import FULL_TIER, LLMRouter
+from email_agents.llm_retry import RetryQueue
+from email_agents.preclassifier import PreClassifier
+from email_agents.scheduler import Scheduler
+from email_agents.threads import latest_per_thread
 
 # File paths
 RECENT_EMAILS_FILE = "recent_emails.txt"
 RESPONSE_HISTORY_FILE = "response_history.json"
 NEEDS_RESPONSE_JSON = "needs_response_emails.json"
 NEEDS_RESPONSE_REPORT = "needs_response_report.txt"
+IMPORTANCE_CHECKPOINT = "checkpoint_importance.jsonl"
 
 def load_response_history():
     """Load history of emails we've already responded to"""
@@ -75,55 +65,7 @@ def is_previously_responded(email, sent_emails):
 
 def fetch_recent_inbox_emails(hours: int = 24):
     """Fetch emails from the inbox using IMAP."""
-    username = os.getenv("EMAIL_USER")
-    password = os.getenv("EMAIL_PASSWORD")
-    server = os.getenv("IMAP_SERVER", "imap.gmail.com")
-    port = int(os.getenv("IMAP_PORT", "993"))
-
-    if not username or not password:
-        raise ValueError("EMAIL_USER and EMAIL_PASSWORD must be set")
-
-    cutoff = (datetime.utcnow() - timedelta(hours=hours)).strftime("%d-%b-%Y")
-
-    emails = []
-    with imaplib.IMAP4_SSL(server, port) as imap:
-        imap.login(username, password)
-        imap.select("INBOX")
-        status, data = imap.search(None, f'(SINCE "{cutoff}")')
-        if status != "OK":
-            return []
-        for num in data[0].split():
-            status, msg_data = imap.fetch(num, "(RFC822)")
-            if status != "OK":
-                continue
-            msg = email.message_from_bytes(msg_data[0][1])
-            body = ""
-            if msg.is_multipart():
-                for part in msg.walk():
-                    if part.get_content_type() == "text/plain" and not part.get("Content-Disposition"):
-                        charset = part.get_content_charset() or "utf-8"
-                        body = part.get_payload(decode=True).decode(charset, errors="replace")
-                        break
-            else:
-                charset = msg.get_content_charset() or "utf-8"
-                body = msg.get_payload(decode=True).decode(charset, errors="replace")
-
-            emails.append({
-                "subject": msg.get("Subject", ""),
-                "from": msg.get("From", ""),
-                "received": msg.get("Date", ""),
-                "body": body.strip()
-            })
-
-    with open(RECENT_EMAILS_FILE, "w", encoding="utf-8") as f:
-        for email_item in emails:
-            f.write(f"Subject: {email_item['subject']}\n")
-            f.write(f"From: {email_item['from']}\n")
-            f.write(f"Received: {email_item['received']}\n")
-            f.write(f"Body: {email_item['body']}\n")
-            f.write("-" * 50 + "\n")
-
-    return emails
+    return mail.fetch_inbox(hours, RECENT_EMAILS_FILE)
 
 # Backwards compatibility
 def get_emails(hours: int = 24):
@@ -132,42 +74,7 @@ def get_emails(hours: int = 24):
 # Function that should be implemented by the user to get sent emails
 def fetch_recent_sent_emails(days: int = 7):
     """Fetch sent emails using IMAP."""
-    username = os.getenv("EMAIL_USER")
-    password = os.getenv("EMAIL_PASSWORD")
-    server = os.getenv("IMAP_SERVER", "imap.gmail.com")
-    port = int(os.getenv("IMAP_PORT", "993"))
-    sent_folder = os.getenv("IMAP_SENT_FOLDER", "[Gmail]/Sent Mail")
-
-    if not username or not password:
-        raise ValueError("EMAIL_USER and EMAIL_PASSWORD must be set")
-
-    cutoff = (datetime.utcnow() - timedelta(days=days)).strftime("%d-%b-%Y")
-    sent_emails = []
-    with imaplib.IMAP4_SSL(server, port) as imap:
-        imap.login(username, password)
-        status, _ = imap.select(sent_folder)
-        if status != "OK":
-            return []
-        status, data = imap.search(None, f'(SINCE "{cutoff}")')
-        if status != "OK":
-            return []
-        for num in data[0].split():
-            status, msg_data = imap.fetch(num, "(RFC822)")
-            if status != "OK":
-                continue
-            msg = email.message_from_bytes(msg_data[0][1])
-            recipients = []
-            to_field = msg.get_all("To", [])
-            cc_field = msg.get_all("Cc", [])
-            for addr in email.utils.getaddresses(to_field + cc_field):
-                recipients.append(addr[1])
-            sent_emails.append({
-                "subject": msg.get("Subject", ""),
-                "recipients": recipients,
-                "sent_time": msg.get("Date", "")
-            })
-
-    return sent_emails
+    return mail.fetch_sent(days)
 
 # Backwards compatibility
 def get_sent_emails(days: int = 7):
@@ -175,58 +82,16 @@ def get_sent_emails(days: int = 7):
 
 def read_emails():
     """Read emails from recent_emails.txt and return as a list of dictionaries"""
-    try:
-        with open(RECENT_EMAILS_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        print(f"No {RECENT_EMAILS_FILE} file found. Creating empty file.")
-        with open(RECENT_EMAILS_FILE, "w", encoding="utf-8") as f:
-            f.write("")
-        return []
-    
-    emails = []
-    current_email = {}
-    current_body_lines = []
-    
-    for line in lines:
-        line = line.rstrip()  # Remove trailing whitespace but keep leading whitespace
-        
-        if line.startswith("Subject: "):
-            if current_email:  # Save previous email
-                # Join body lines and clean up excessive whitespace
-                current_email["body"] = "\n".join(
-                    line for line in current_body_lines if line.strip()
-                )
-                emails.append(current_email)
-                current_body_lines = []
-            current_email = {"subject": line[9:], "from": "unknown"}  # Default 'from' to 'unknown'
-        elif line.startswith("From: "):
-            current_email["from"] = line[6:]
-        elif line.startswith("Received: "):
-            current_email["received"] = line[10:]
-        elif line.startswith("Body: "):
-            current_body_lines = [line[6:]]
-        elif line.startswith("-" * 50):
-            continue
-        else:
-            # Append non-marker lines to body
-            if current_body_lines is not None:
-                current_body_lines.append(line)
-            
-    # Don't forget to add the last email
-    if current_email:
-        current_email["body"] = "\n".join(
-            line for line in current_body_lines if line.strip()
-        )
-        emails.append(current_email)
-        
-    return emails
+    return mail.read_emails(RECENT_EMAILS_FILE)
+
+def analyze_email_importance(llm, email, tier=FULL_TIER):
+    """Analyze a single email's importance using the configured LLM backend"""
+    from email_agents.models import MAX_TOPICS, OMIT_LOW_REASONS, REASON_MAX_CHARS, EmailImportance, response_format
 
-def analyze_email_importance(client, email):
-    """Analyze a single email's importance using OpenAI API"""
     # Clean up the body text while preserving meaningful whitespace
     body = email['body'].strip()
-    
+    reason_note = "; null when importance is low" if OMIT_LOW_REASONS else ""
+
     prompt = f"""
     You are an email importance analyzer for a busy professional.
     Your task is to determine which emails CRITICALLY NEED a response and which can be ignored.
@@ -243,6 +108,7 @@ def analyze_email_importance(client, email):
     Subject: {email['subject']}
     From: {email['from']}
     Received: {email.get('received', 'unknown')}
+    Messages in thread: {email.get('thread_size', 1)}
     Body:
     {body[:4000]}  # Limiting to 4000 chars to stay within token limits
     
@@ -256,16 +122,17 @@ def analyze_email_importance(client, email):
     Respond with a JSON object that MUST include:
     {{
         "importance": "high" | "medium" | "low",
-        "reason": <brief explanation for the importance rating>,
+        "reason": <brief explanation for the importance rating, at most {REASON_MAX_CHARS} characters{reason_note}>,
         "needs_response": <boolean - true ONLY if email absolutely requires a response>,
         "time_sensitive": <boolean - true if matter is time-sensitive>,
-        "topics": [<list of 1-3 key topics in the email>]
+        "topics": [<list of 1-{MAX_TOPICS} key topics in the email>],
+        "confidence": <number between 0 and 1 - how sure you are of this rating>
     }}
     """
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1",  # Use appropriate OpenAI model
+        response = llm.chat(
+            "importance",
             messages=[
                 {
                     "role": "system", 
@@ -273,128 +140,203 @@ def analyze_email_importance(client, email):
                 },
                 {"role": "user", "content": prompt}
             ],
-            response_format={"type": "json_object"}
+            email=email,
+            tier=tier,
+            response_format=response_format(EmailImportance, nullable=("reason",) if OMIT_LOW_REASONS else ())
         )
         
         content = response.choices[0].message.content
         if content:
-            analysis = json.loads(content)
             # Print for debugging
-            print(f"\nAnalyzing: {email['subject']}")
-            print(f"Analysis result: {json.dumps(analysis, indent=2)}")
-            return EmailImportance(**analysis)
+            metrics.debug(f"\nAnalyzing: {email['subject']}")
+            metrics.debug(f"Analysis result: {content}")
+            try:
+                return EmailImportance.model_validate_json(content)
+            except ValueError as e:
+                metrics.count("parse_failures_importance")
+                print(f"Reply does not match the schema for email: {email['subject']} ({e.__class__.__name__})")
+                return None
         else:
             print(f"Empty response for email: {email['subject']}")
             return None
             
+    except CassetteMiss:
+        raise
     except Exception as e:
         print(f"Error analyzing email: {e}")
         print(f"Failed email subject: {email['subject']}")
         return None
 
-def find_important_emails():
-    """Main function to identify important emails"""
-    # First fetch new emails from the last 24 hours
-    print("Fetching emails from the last 24 hours...")
-    get_emails(hours=24)
+def response_priority(email):
+    """Sort key: not responded first, then time sensitive, then by importance"""
+    return (
+        email["already_responded"],  # Not responded first
+        not email['analysis']['time_sensitive'],  # Time sensitive first
+        0 if email['analysis']['importance'] == 'high' else
+        1 if email['analysis']['importance'] == 'medium' else 2  # Order by importance
+    )
+
+def write_needs_response(needs_response_emails, complete=True, progress="", deferred=0):
+    """Atomically write the JSON results and the readable report.
+
+    While a run is still going the files are written with complete=False so
+    the responder can already work through the emails found so far. Emails
+    deferred by the schedule's deadline or budget are counted in both.
+    """
+    output_data = {
+        "last_updated": datetime.now().isoformat(),
+        "complete": complete,
+        "deferred": deferred,
+        "needs_response_emails": needs_response_emails
+    }
+    atomic_write_json(NEEDS_RESPONSE_JSON, output_data)
     
-    # Get sent emails from the past week to check for responses
-    print("Checking sent folder for previous responses...")
-    sent_emails = get_sent_emails(days=7)
+    lines = [
+        "==================================================",
+        "EMAILS REQUIRING RESPONSE",
+        f"Generated on: {datetime.now().isoformat()}",
+    ]
+    if not complete:
+        lines.append(f"RUN IN PROGRESS: {progress}")
+    if deferred:
+        lines.append(f"DEFERRED TO NEXT RUN: {deferred} lower-priority emails")
+    lines += ["==================================================", ""]
     
-    # Initialize OpenAI client
-    client = OpenAI()
+    if needs_response_emails:
+        for email in needs_response_emails:
+            lines.append(f"Subject: {email['subject']}")
+            lines.append(f"From: {email['from']}")
+            lines.append(f"Received: {email['received']}")
+            if email.get("thread_size", 1) > 1:
+                lines.append(f"Thread: {email['thread_size']} messages")
+            lines.append(f"Importance: {email['analysis']['importance'].upper()}")
+            lines.append(f"Time Sensitive: {'YES' if email['analysis']['time_sensitive'] else 'No'}")
+            lines.append(f"Topics: {', '.join(email['analysis']['topics'])}")
+            lines.append(f"Reason: {email['analysis']['reason']}")
+            if email["already_responded"]:
+                lines.append(f"STATUS: ✅ ALREADY RESPONDED")
+            lines.append(f"Preview: {email['body'][:300]}...\n")
+            lines.append("-" * 50 + "\n")
+    else:
+        lines.append("No emails requiring immediate response were found.\n")
+    atomic_write(NEEDS_RESPONSE_REPORT, "\n".join(lines) + "\n")
+
+def triage(llm, emails, sent_emails, checkpoint, keep_checkpoint=False):
+    """Analyze emails for importance and write the needs-response outputs.
+
+    Every analysis is journaled to the checkpoint as it completes, and analyses
+    already in it are reused. The journal is removed at the end unless
+    ``keep_checkpoint``, for callers with later stages that may still fail.
+    Returns (emails, needs_response_emails, failed_emails).
+    """
+    from email_agents.models import EmailImportance
+
+    # Put back the emails whose analysis failed last run
+    retry_queue = RetryQueue()
+    emails = retry_queue.merge("importance", emails)
+    # Classify each conversation once, from what its latest message adds
+    emails = latest_per_thread(emails)
+    # Most important first, so a run cut short by its deadline or budget has seen those
+    scheduler = Scheduler.from_env("importance", sent_emails)
+    emails = scheduler.order(emails)
     
-    # Read emails
-    emails = read_emails()
+    # Reuse analyses that finished before an interruption
+    analyses = {key: EmailImportance(**result) for key, result in checkpoint.results.items()}
+    pending = [email for email in emails if email_key(email) not in analyses]
+    metrics.count("checkpoint_reused", len(emails) - len(pending))
     
-    # Prepare to store only emails that need a response
-    needs_response_emails = []
+    # Settle clear-cut emails locally with a model trained on earlier verdicts. It starts cold:
+    # NEEDS_RESPONSE_JSON only lists emails that needed a response, so it has no low verdicts to learn from
+    preclassifier = PreClassifier.load("importance")
+    with metrics.span("preclassify"):
+        settled, pending = preclassifier.settle(pending)
     
-    # Analyze each email
-    for email in emails:
-        # Check if we've already responded to this email by looking at sent items
-        already_responded = is_previously_responded(email, sent_emails)
-        
-        analysis = analyze_email_importance(client, email)
-        if analysis and analysis.needs_response:
-            email_data = {
+    responded = {}
+    
+    def collect():
+        """Emails that need a response among the analyses finished so far, most urgent first"""
+        needs_response_emails = []
+        for email in emails:
+            key = email_key(email)
+            analysis = analyses.get(key)
+            if not (analysis and analysis.needs_response):
+                continue
+            # Check if we've already responded to this email by looking at sent items
+            if key not in responded:
+                responded[key] = is_previously_responded(email, sent_emails)
+            needs_response_emails.append({
                 "subject": email["subject"],
                 "from": email["from"],
                 "received": email.get("received", datetime.now().isoformat()),
                 "body": email["body"][:1000] + ("..." if len(email["body"]) > 1000 else ""),  # Truncate for readability
+                "thread_size": email.get("thread_size", 1),
                 "analysis": analysis.model_dump(),
-                "already_responded": already_responded
-            }
-            
-            needs_response_emails.append(email_data)
+                "already_responded": responded[key]
+            })
+        # Sorted once here for the JSON, the report, the console and the responder
+        needs_response_emails.sort(key=response_priority)
+        return needs_response_emails
     
-    # Save results to JSON file
-    output_data = {
-        "last_updated": datetime.now().isoformat(),
-        "needs_response_emails": needs_response_emails
-    }
+    throttle = Throttle()
+    
+    def on_result(email, analysis):
+        if analysis is None:
+            return
+        key = email_key(email)
+        analyses[key] = analysis
+        checkpoint.record(key, analysis.model_dump())
+        if throttle.ready():
+            write_needs_response(collect(), complete=False,
+                                 progress=f"{len(analyses)} of {len(emails)} emails analyzed")
+    
+    for email, analysis in settled:
+        on_result(email, analysis)
     
-    with open(NEEDS_RESPONSE_JSON, "w", encoding="utf-8") as f:
-        json.dump(output_data, f, indent=2)
+    # Analyze emails concurrently, each backend within its own concurrency limit
+    with metrics.span("classify"):
+        # A fast first pass when a cascade is configured, escalating only uncertain results
+        classify = lambda email: cascade.classify(llm, "importance", email, analyze_email_importance, cascade.importance_uncertain)
+        deferred = scheduler.map(llm, classify, pending, on_result=on_result)
+    if deferred:
+        print(f"Importance {scheduler.stopped} reached: {len(deferred)} lower-priority emails deferred to the next run")
     
-    # Print summary
-    print(f"\nProcessed {len(emails)} emails from the last 24 hours")
+    # Keep failed and deferred emails for the next run instead of dropping them
+    deferred_keys = {email_key(email) for email in deferred}
+    failed = [email for email in emails if email_key(email) not in analyses and email_key(email) not in deferred_keys]
+    failed_emails = retry_queue.replace("importance", failed, deferred)
+    
+    # Learn from this run's model verdicts
+    preclassifier.learn((email, analyses[email_key(email)]) for email in pending if email_key(email) in analyses)
+    preclassifier.save()
+    
+    # Prepare to store only emails that need a response
+    needs_response_emails = collect()
+    
+    # Save results to JSON file and generate a readable report
+    with metrics.span("report"):
+        write_needs_response(needs_response_emails, deferred=len(deferred))
+    if not keep_checkpoint:
+        checkpoint.clear()
+    return emails, needs_response_emails, failed_emails
+
+def print_triage_summary(emails, needs_response_emails, failed_emails):
+    """Print counts and the emails requiring a response"""
+    print(f"\nProcessed {len(emails)} threads from the last 24 hours")
     print(f"Emails requiring response: {len(needs_response_emails)}")
     already_responded_count = sum(1 for email in needs_response_emails if email["already_responded"])
     print(f"Previously responded to: {already_responded_count}")
     print(f"New emails requiring response: {len(needs_response_emails) - already_responded_count}")
+    deferred = sum(1 for entry in failed_emails if entry.get("deferred"))
+    if len(failed_emails) > deferred:
+        print(f"Emails that could not be analyzed (retried next run): {len(failed_emails) - deferred}")
+    if deferred:
+        print(f"Emails deferred to the next run: {deferred}")
     print(f"\nDetailed results saved to: {NEEDS_RESPONSE_JSON}")
     
-    # Generate a readable report
-    with open(NEEDS_RESPONSE_REPORT, "w", encoding="utf-8") as f:
-        f.write("==================================================\n")
-        f.write("EMAILS REQUIRING RESPONSE\n")
-        f.write(f"Generated on: {datetime.now().isoformat()}\n")
-        f.write("==================================================\n\n")
-        
-        if needs_response_emails:
-            # Sort by already_responded (not responded first), then time sensitivity, then importance
-            sorted_emails = sorted(
-                needs_response_emails, 
-                key=lambda x: (
-                    x["already_responded"],  # Not responded first
-                    not x['analysis']['time_sensitive'],  # Time sensitive first
-                    0 if x['analysis']['importance'] == 'high' else 
-                    1 if x['analysis']['importance'] == 'medium' else 2  # Order by importance
-                )
-            )
-            
-            for email in sorted_emails:
-                f.write(f"Subject: {email['subject']}\n")
-                f.write(f"From: {email['from']}\n")
-                f.write(f"Received: {email['received']}\n")
-                f.write(f"Importance: {email['analysis']['importance'].upper()}\n")
-                f.write(f"Time Sensitive: {'YES' if email['analysis']['time_sensitive'] else 'No'}\n")
-                f.write(f"Topics: {', '.join(email['analysis']['topics'])}\n")
-                f.write(f"Reason: {email['analysis']['reason']}\n")
-                if email["already_responded"]:
-                    f.write(f"STATUS: ✅ ALREADY RESPONDED\n")
-                f.write(f"Preview: {email['body'][:300]}...\n\n")
-                f.write("-" * 50 + "\n\n")
-        else:
-            f.write("No emails requiring immediate response were found.\n\n")
-    
     # Print emails requiring response to console
     if needs_response_emails:
         print("\nEMAILS REQUIRING RESPONSE:\n" + "="*50)
-        # Sort by already_responded (not responded first), then time sensitivity, then importance
-        sorted_emails = sorted(
-            needs_response_emails, 
-            key=lambda x: (
-                x["already_responded"],  # Not responded first
-                not x['analysis']['time_sensitive'],  # Time sensitive first
-                0 if x['analysis']['importance'] == 'high' else 
-                1 if x['analysis']['importance'] == 'medium' else 2  # Order by importance
-            )
-        )
-        
-        for email in sorted_emails:
+        for email in needs_response_emails:
             print(f"\nSubject: {email['subject']}")
             print(f"From: {email['from']}")
             print(f"Importance: {email['analysis']['importance'].upper()}")
@@ -409,5 +351,41 @@ def find_important_emails():
     
     print(f"\nFull report available in {NEEDS_RESPONSE_REPORT}")
 
+def find_important_emails(resume=False):
+    """Main function to identify important emails.
+
+    Every analysis is journaled to IMPORTANCE_CHECKPOINT as it completes; with
+    resume=True an interrupted run continues without fetching or paying again.
+    """
+    run = metrics.start_run("find_important_emails")
+    checkpoint = Checkpoint(IMPORTANCE_CHECKPOINT)
+    
+    if resume and checkpoint.fetched:
+        print(f"Resuming previous run ({len(checkpoint.results)} emails already analyzed)...")
+    else:
+        checkpoint.reset()
+        # First fetch new emails from the last 24 hours
+        print("Fetching emails from the last 24 hours...")
+        get_emails(hours=24)
+        checkpoint.mark_fetched()
+    
+    # Get sent emails from the past week to check for responses
+    print("Checking sent folder for previous responses...")
+    sent_emails = get_sent_emails(days=7)
+    
+    # Initialize the LLM backends
+    llm = LLMRouter.from_env()
+    
+    print_triage_summary(*triage(llm, read_emails(), sent_emails, checkpoint))
+    
+    paths = run.write()
+    print(run.summary())
+    print(f"Run metrics saved to: {paths['json']}")
+
 if __name__ == "__main__":
-    find_important_emails() 
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Find emails that need a response")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its checkpoint instead of starting over")
+    find_important_emails(resume=parser.parse_args().resume)
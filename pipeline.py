@@ -0,0 +1,124 @@
+"""Run the whole daily workflow in one process, or one stage of it.
+
+    python pipeline.py run          # fetch once, triage, categorize, rank opportunities, respond
+    python pipeline.py run --mailbox export.mbox   # the same from a local mbox file or Maildir
+    python pipeline.py triage       # same as important_email2.py
+    python pipeline.py categorize   # same as send_mail2.py without the opportunity report
+    python pipeline.py report       # opportunity report from categorized_emails.json
+    python pipeline.py respond      # same as email_responder2.py
+    python pipeline.py serve        # long-running HTTP API, see service.py
+"""
+import os
+
+import email_responder2
+import important_email2
+import send_mail2
+from email_agents import mail, metrics
+from email_agents.checkpoint import Checkpoint
+from email_agents.llm_backend import LLMRouter
+
+# Inbox window for importance triage and for categorization (hours), sent mail window (days)
+TRIAGE_HOURS = 24
+CATEGORIZE_HOURS = 72
+SENT_DAYS = 7
+
+
+def run_pipeline(resume=False, respond=True):
+    """Fetch the largest window once and run every stage on the parsed emails in memory"""
+    run = metrics.start_run("pipeline")
+    triage_checkpoint = Checkpoint(important_email2.IMPORTANCE_CHECKPOINT)
+    categorize_checkpoint = Checkpoint(send_mail2.CATEGORIZE_CHECKPOINT)
+
+    if resume and triage_checkpoint.fetched and categorize_checkpoint.fetched:
+        print("Resuming previous run...")
+        recent_emails = important_email2.read_emails()
+        inbox = send_mail2.read_emails()
+        sent_emails = important_email2.get_sent_emails(days=SENT_DAYS)
+    else:
+        triage_checkpoint.reset()
+        categorize_checkpoint.reset()
+        print(f"Fetching emails from the last {CATEGORIZE_HOURS} hours and sent mail from the last {SENT_DAYS} days...")
+        inbox, sent_emails = mail.fetch_mailboxes(max(TRIAGE_HOURS, CATEGORIZE_HOURS), SENT_DAYS,
+                                                  send_mail2.EMAILS_FILE)
+        recent_emails = mail.within_hours(inbox, TRIAGE_HOURS)
+        # Keep the triage file too, so the stages can still be resumed or run alone
+        with open(important_email2.RECENT_EMAILS_FILE, "w", encoding="utf-8") as f:
+            for email in recent_emails:
+                mail.write_email(f, email)
+        triage_checkpoint.mark_fetched()
+        categorize_checkpoint.mark_fetched()
+
+    # Initialize the LLM backends
+    llm = LLMRouter.from_env()
+
+    # Both journals stay until the whole run is done, so --resume after a crash in a later
+    # stage replays the finished stages from them instead of fetching and classifying again
+    print(f"\nTriaging {len(recent_emails)} emails from the last {TRIAGE_HOURS} hours...")
+    triage_results = important_email2.triage(llm, recent_emails, sent_emails, triage_checkpoint,
+                                             keep_checkpoint=True)
+    important_email2.print_triage_summary(*triage_results)
+
+    print(f"\nCategorizing {len(inbox)} emails from the last {CATEGORIZE_HOURS} hours...")
+    categorize_results = send_mail2.categorize(llm, inbox, categorize_checkpoint, sent_emails,
+                                               keep_checkpoint=True)
+    send_mail2.print_category_summary(*categorize_results)
+
+    sponsorship_emails, business_emails, _ = categorize_results[1]
+    send_mail2.rank_opportunities(llm, business_emails, sponsorship_emails)
+
+    if respond:
+        email_responder2.respond(llm, email_responder2.emails_from_results(triage_results[1]))
+
+    triage_checkpoint.clear()
+    categorize_checkpoint.clear()
+    paths = run.write()
+    print(f"\n{run.summary()}")
+    print(f"Run metrics saved to: {paths['json']}")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_command = commands.add_parser("run", help="fetch once and run every stage")
+    run_command.add_argument("--resume", action="store_true",
+                             help="continue an interrupted run from its checkpoints instead of fetching again")
+    run_command.add_argument("--no-respond", action="store_true", help="stop before drafting responses")
+    run_command.add_argument("--mailbox", help="read the inbox from this mbox file or Maildir instead of IMAP")
+    run_command.add_argument("--sent-mailbox", help="mbox file or Maildir of sent mail, used with --mailbox")
+    for name, help_text in (("triage", "find emails that need a response"),
+                            ("categorize", "categorize business and sponsorship emails")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--resume", action="store_true",
+                             help="continue an interrupted run from its checkpoint instead of starting over")
+    commands.add_parser("report", help="rank opportunities from categorized_emails.json")
+    commands.add_parser("respond", help="draft and send responses from needs_response_report.txt")
+    serve_command = commands.add_parser("serve", help="keep the sessions warm and serve the HTTP API in service.py")
+    serve_command.add_argument("--host", default=None, help="address to listen on (default SERVICE_HOST)")
+    serve_command.add_argument("--port", type=int, default=None, help="port to listen on (default SERVICE_PORT)")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        # The same settings the fetch functions read, so every stage sees one source
+        if args.mailbox:
+            os.environ["LOCAL_MAILBOX"] = args.mailbox
+        if args.sent_mailbox:
+            os.environ["LOCAL_SENT_MAILBOX"] = args.sent_mailbox
+        run_pipeline(resume=args.resume, respond=not args.no_respond)
+    elif args.command == "triage":
+        important_email2.find_important_emails(resume=args.resume)
+    elif args.command == "categorize":
+        send_mail2.sort_emails(resume=args.resume)
+    elif args.command == "report":
+        send_mail2.generate_opportunity_report()
+    elif args.command == "respond":
+        email_responder2.process_responses()
+    elif args.command == "serve":
+        import service
+
+        service.serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
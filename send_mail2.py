@@ -1,51 +1,23 @@
-import os
-from dotenv import load_dotenv
 import json
-from datetime import datetime, timedelta
-from openai import OpenAI
-from pydantic import BaseModel
-from typing import Optional, Literal
-import imaplib
-import email
-import smtplib
-from email.message import EmailMessage
-
-# Load environment variables
-load_dotenv(override=True)
-
-class EmailAnalysis(BaseModel):
-    category: Literal["sponsorship", "business_inquiry", "other"]
-    confidence: float
-    reason: str
-    company_name: Optional[str] = None
-    topic: Optional[str] = None
+from datetime import datetime
+from email_agents import cascade, mail, metrics
+from email_agents.cassette import CassetteMiss
+from email_agents.checkpoint import Checkpoint, Throttle, atomic_write, atomic_write_json, email_key
+from email_agents.llm_backend import FULL_TIER, LLMRouter
+from email_agents.llm_retry import RetryQueue
+from email_agents.preclassifier import PreClassifier
+from email_agents.scheduler import Scheduler
+from email_agents.threads import latest_per_thread
 
 # File paths
 EMAILS_FILE = "emails.txt"
 CATEGORIZED_EMAILS_JSON = "categorized_emails.json"
 OPPORTUNITY_REPORT = "opportunity_report.txt"
+CATEGORIZE_CHECKPOINT = "checkpoint_categorize.jsonl"
 
 # Function that actually sends an email via SMTP
 def send_email_via_smtp(subject: str, body: str, recipient_email: str) -> bool:
-    username = os.getenv("EMAIL_USER")
-    password = os.getenv("EMAIL_PASSWORD")
-    server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-    port = int(os.getenv("SMTP_PORT", "465"))
-
-    if not username or not password:
-        raise ValueError("EMAIL_USER and EMAIL_PASSWORD must be set")
-
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = username
-    msg["To"] = recipient_email
-    msg.set_content(body)
-
-    with smtplib.SMTP_SSL(server, port) as smtp:
-        smtp.login(username, password)
-        smtp.send_message(msg)
-
-    return True
+    return mail.send_email(subject, body, recipient_email)
 
 # Backwards compatibility
 def send_email(subject: str, body: str, recipient_email: str) -> bool:
@@ -54,54 +26,7 @@ def send_email(subject: str, body: str, recipient_email: str) -> bool:
 # Function that should be implemented by the user
 def fetch_recent_inbox_emails(hours: int = 72):
     """Fetch emails from the inbox using IMAP."""
-    username = os.getenv("EMAIL_USER")
-    password = os.getenv("EMAIL_PASSWORD")
-    server = os.getenv("IMAP_SERVER", "imap.gmail.com")
-    port = int(os.getenv("IMAP_PORT", "993"))
-
-    if not username or not password:
-        raise ValueError("EMAIL_USER and EMAIL_PASSWORD must be set")
-
-    cutoff = (datetime.utcnow() - timedelta(hours=hours)).strftime("%d-%b-%Y")
-    emails = []
-    with imaplib.IMAP4_SSL(server, port) as imap:
-        imap.login(username, password)
-        imap.select("INBOX")
-        status, data = imap.search(None, f'(SINCE "{cutoff}")')
-        if status != "OK":
-            return []
-        for num in data[0].split():
-            status, msg_data = imap.fetch(num, "(RFC822)")
-            if status != "OK":
-                continue
-            msg = email.message_from_bytes(msg_data[0][1])
-            body = ""
-            if msg.is_multipart():
-                for part in msg.walk():
-                    if part.get_content_type() == "text/plain" and not part.get("Content-Disposition"):
-                        charset = part.get_content_charset() or "utf-8"
-                        body = part.get_payload(decode=True).decode(charset, errors="replace")
-                        break
-            else:
-                charset = msg.get_content_charset() or "utf-8"
-                body = msg.get_payload(decode=True).decode(charset, errors="replace")
-
-            emails.append({
-                "subject": msg.get("Subject", ""),
-                "from": msg.get("From", ""),
-                "received": msg.get("Date", ""),
-                "body": body.strip()
-            })
-
-    with open(EMAILS_FILE, "w", encoding="utf-8") as f:
-        for email_item in emails:
-            f.write(f"Subject: {email_item['subject']}\n")
-            f.write(f"From: {email_item['from']}\n")
-            f.write(f"Received: {email_item['received']}\n")
-            f.write(f"Body: {email_item['body']}\n")
-            f.write("-" * 50 + "\n")
-
-    return emails
+    return mail.fetch_inbox(hours, EMAILS_FILE)
 
 # Backwards compatibility
 def get_emails(hours: int = 72):
@@ -109,58 +34,16 @@ def get_emails(hours: int = 72):
 
 def read_emails():
     """Read emails from emails.txt and return as a list of dictionaries"""
-    try:
-        with open(EMAILS_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        print(f"No {EMAILS_FILE} file found. Creating empty file.")
-        with open(EMAILS_FILE, "w", encoding="utf-8") as f:
-            f.write("")
-        return []
-    
-    emails = []
-    current_email = {}
-    current_body_lines = []
-    
-    for line in lines:
-        line = line.rstrip()  # Remove trailing whitespace but keep leading whitespace
-        
-        if line.startswith("Subject: "):
-            if current_email:  # Save previous email
-                # Join body lines and clean up excessive whitespace
-                current_email["body"] = "\n".join(
-                    line for line in current_body_lines if line.strip()
-                )
-                emails.append(current_email)
-                current_body_lines = []
-            current_email = {"subject": line[9:], "from": "unknown"}  # Default 'from' to 'unknown'
-        elif line.startswith("From: "):
-            current_email["from"] = line[6:]
-        elif line.startswith("Received: "):
-            current_email["received"] = line[10:]
-        elif line.startswith("Body: "):
-            current_body_lines = [line[6:]]
-        elif line.startswith("-" * 50):
-            continue
-        else:
-            # Append non-marker lines to body
-            if current_body_lines is not None:
-                current_body_lines.append(line)
-            
-    # Don't forget to add the last email
-    if current_email:
-        current_email["body"] = "\n".join(
-            line for line in current_body_lines if line.strip()
-        )
-        emails.append(current_email)
-        
-    return emails
+    return mail.read_emails(EMAILS_FILE)
+
+def analyze_email(llm, email, tier=FULL_TIER):
+    """Analyze a single email using the configured LLM backend with Structured Outputs"""
+    from email_agents.models import OMIT_LOW_REASONS, REASON_MAX_CHARS, EmailAnalysis, response_format
 
-def analyze_email(client, email):
-    """Analyze a single email using OpenAI API with Structured Outputs"""
     # Clean up the body text while preserving meaningful whitespace
     body = email['body'].strip()
-    
+    reason_note = '; null when the category is "other"' if OMIT_LOW_REASONS else ""
+
     prompt = f"""
     You are an email categorizer for a professional. Your task is to categorize incoming emails
     and identify important information.
@@ -168,6 +51,7 @@ def analyze_email(client, email):
     Email to analyze:
     Subject: {email['subject']}
     From: {email['from']}
+    Messages in thread: {email.get('thread_size', 1)}
     Body:
     {body[:4000]}  # Limiting to 4000 chars to stay within token limits
 
@@ -182,15 +66,15 @@ def analyze_email(client, email):
     {{
         "category": "sponsorship" | "business_inquiry" | "other",
         "confidence": <number between 0 and 1>,
-        "reason": <explanation string>,
+        "reason": <explanation string, at most {REASON_MAX_CHARS} characters{reason_note}>,
         "company_name": <extracted company name or null>,
         "topic": <main topic/product or null>
     }}
     """
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1",  # Use appropriate OpenAI model
+        response = llm.chat(
+            "categorize",
             messages=[
                 {
                     "role": "system", 
@@ -198,51 +82,48 @@ def analyze_email(client, email):
                 },
                 {"role": "user", "content": prompt}
             ],
-            response_format={"type": "json_object"}
+            email=email,
+            tier=tier,
+            response_format=response_format(EmailAnalysis, nullable=("reason",) if OMIT_LOW_REASONS else ())
         )
         
         content = response.choices[0].message.content
         if content:
-            analysis = json.loads(content)
             # Print for debugging
-            print(f"\nAnalyzing: {email['subject']}")
-            print(f"Analysis result: {json.dumps(analysis, indent=2)}")
-            return EmailAnalysis(**analysis)
+            metrics.debug(f"\nAnalyzing: {email['subject']}")
+            metrics.debug(f"Analysis result: {content}")
+            try:
+                return EmailAnalysis.model_validate_json(content)
+            except ValueError as e:
+                metrics.count("parse_failures_categorize")
+                print(f"Reply does not match the schema for email: {email['subject']} ({e.__class__.__name__})")
+                return None
         else:
             print(f"Empty response for email: {email['subject']}")
             return None
             
+    except CassetteMiss:
+        raise
     except Exception as e:
         print(f"Error analyzing email: {e}")
         print(f"Failed email subject: {email['subject']}")
         return None
 
-def sort_emails():
-    """Main function to sort emails"""
-    # First fetch new emails
-    print("Fetching new emails...")
-    get_emails(hours=72)
-    
-    # Initialize OpenAI client
-    client = OpenAI()
-    
-    # Read emails
-    emails = read_emails()
-    
-    # Categorize emails
+def categorize_results(emails, analyses, complete=True, progress="", deferred=0):
+    """Group finished analyses by category and atomically write CATEGORIZED_EMAILS_JSON"""
     sponsorship_emails = []
     business_emails = []
     other_emails = []
     
-    # Analyze each email
     for email in emails:
-        analysis = analyze_email(client, email)
+        analysis = analyses.get(email_key(email))
         if analysis:
             email_data = {
                 "subject": email["subject"],
                 "from": email["from"],
                 "received": email.get("received", datetime.now().isoformat()),
                 "body": email["body"],
+                "thread_size": email.get("thread_size", 1),
                 "analysis": analysis.model_dump()
             }
             
@@ -253,22 +134,99 @@ def sort_emails():
             else:
                 other_emails.append(email_data)
     
-    # Save results to JSON files
     output_data = {
         "last_updated": datetime.now().isoformat(),
+        "complete": complete,
+        "deferred": deferred,
         "sponsorship_emails": sponsorship_emails,
         "business_emails": business_emails,
         "other_emails": other_emails
     }
+    if not complete:
+        output_data["progress"] = progress
+    atomic_write_json(CATEGORIZED_EMAILS_JSON, output_data)
+    return sponsorship_emails, business_emails, other_emails
+
+def categorize(llm, emails, checkpoint, sent_emails=(), keep_checkpoint=False):
+    """Categorize emails and write CATEGORIZED_EMAILS_JSON.
+
+    Every analysis is journaled to the checkpoint as it completes, and analyses
+    already in it are reused. Emails are classified in priority order, with
+    people in sent_emails counted as known correspondents. The journal is
+    removed at the end unless ``keep_checkpoint``. Returns
+    (emails, (sponsorship, business, other), failed_emails).
+    """
+    from email_agents.models import EmailAnalysis
+
+    # Put back the emails whose analysis failed last run
+    retry_queue = RetryQueue()
+    emails = retry_queue.merge("categorize", emails)
+    # Classify each conversation once, from what its latest message adds
+    emails = latest_per_thread(emails)
+    # Most important first, so a run cut short by its deadline or budget has seen those
+    scheduler = Scheduler.from_env("categorize", sent_emails)
+    emails = scheduler.order(emails)
+    
+    # Reuse analyses that finished before an interruption
+    analyses = {key: EmailAnalysis(**result) for key, result in checkpoint.results.items()}
+    pending = [email for email in emails if email_key(email) not in analyses]
+    metrics.count("checkpoint_reused", len(emails) - len(pending))
+    
+    # Settle clear-cut emails locally with a model trained on earlier verdicts
+    preclassifier = PreClassifier.load("categorize", history=[CATEGORIZED_EMAILS_JSON])
+    with metrics.span("preclassify"):
+        settled, pending = preclassifier.settle(pending)
+    
+    throttle = Throttle()
+    
+    def on_result(email, analysis):
+        if analysis is None:
+            return
+        key = email_key(email)
+        analyses[key] = analysis
+        checkpoint.record(key, analysis.model_dump())
+        if throttle.ready():
+            categorize_results(emails, analyses, complete=False,
+                               progress=f"{len(analyses)} of {len(emails)} emails analyzed")
     
-    with open(CATEGORIZED_EMAILS_JSON, "w", encoding="utf-8") as f:
-        json.dump(output_data, f, indent=2)
+    for email, analysis in settled:
+        on_result(email, analysis)
     
-    # Print summary
-    print(f"\nProcessed {len(emails)} emails")
+    # Analyze emails concurrently, each backend within its own concurrency limit
+    with metrics.span("classify"):
+        # A fast first pass when a cascade is configured, escalating only uncertain results
+        classify = lambda email: cascade.classify(llm, "categorize", email, analyze_email, cascade.category_uncertain)
+        deferred = scheduler.map(llm, classify, pending, on_result=on_result)
+    if deferred:
+        print(f"Categorize {scheduler.stopped} reached: {len(deferred)} lower-priority emails deferred to the next run")
+    
+    # Keep failed and deferred emails for the next run instead of dropping them
+    deferred_keys = {email_key(email) for email in deferred}
+    failed = [email for email in emails if email_key(email) not in analyses and email_key(email) not in deferred_keys]
+    failed_emails = retry_queue.replace("categorize", failed, deferred)
+    
+    # Learn from this run's model verdicts
+    preclassifier.learn((email, analyses[email_key(email)]) for email in pending if email_key(email) in analyses)
+    preclassifier.save()
+    
+    # Categorize emails and save results to JSON files
+    groups = categorize_results(emails, analyses, deferred=len(deferred))
+    if not keep_checkpoint:
+        checkpoint.clear()
+    return emails, groups, failed_emails
+
+def print_category_summary(emails, groups, failed_emails):
+    """Print counts and the high-confidence business and sponsorship emails"""
+    sponsorship_emails, business_emails, other_emails = groups
+    print(f"\nProcessed {len(emails)} threads")
     print(f"Sponsorship requests: {len(sponsorship_emails)}")
     print(f"Business inquiries: {len(business_emails)}")
     print(f"Other emails: {len(other_emails)}")
+    deferred = sum(1 for entry in failed_emails if entry.get("deferred"))
+    if len(failed_emails) > deferred:
+        print(f"Emails that could not be analyzed (retried next run): {len(failed_emails) - deferred}")
+    if deferred:
+        print(f"Emails deferred to the next run: {deferred}")
     print(f"\nDetailed results saved to: {CATEGORIZED_EMAILS_JSON}")
     
     # Print high-confidence business and sponsorship emails
@@ -285,96 +243,136 @@ def sort_emails():
             print(f"Reason: {email['analysis']['reason']}")
             print("-" * 50)
 
-def generate_opportunity_report(categorized_emails_path=CATEGORIZED_EMAILS_JSON):
-    """Generate a structured report highlighting valuable business opportunities"""
-    try:
-        # Load categorized emails
-        with open(categorized_emails_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        # Extract business and sponsorship emails
-        business_emails = data.get("business_emails", [])
-        sponsorship_emails = data.get("sponsorship_emails", [])
-        
-        all_relevant_emails = business_emails + sponsorship_emails
-        
-        if not all_relevant_emails:
-            print("No business or sponsorship emails found to analyze.")
-            return
-            
-        # Initialize OpenAI client
-        client = OpenAI()
-        
-        # Analyze emails to identify quality opportunities
-        print("\nAnalyzing business and sponsorship emails for quality opportunities...")
-        
-        # Create a report with AI analysis
-        prompt = f"""
-        You are an executive assistant tasked with filtering through business and sponsorship emails to identify the highest quality opportunities.
-        
-        Please analyze these {len(all_relevant_emails)} business and sponsorship emails and create a structured report that:
-        
-        1. Categorizes them as "High Value" or "Mass Marketing/Generic"
-        2. Ranks the high-value opportunities in order of priority
-        3. Provides brief reasoning for your assessments
-        
-        Here are the emails to analyze:
-        
-        {json.dumps([{
-            "category": email["analysis"]["category"],
-            "from": email["from"],
-            "subject": email["subject"],
-            "company": email["analysis"]["company_name"],
-            "topic": email["analysis"]["topic"],
-            "confidence": email["analysis"]["confidence"],
-            "snippet": email["body"][:500] + "..." if len(email["body"]) > 500 else email["body"]
-        } for email in all_relevant_emails], indent=2)}
-        
-        Consider the following criteria to evaluate opportunities:
-        1. Personalization (specifically addressed to the user, mentions specific work)
-        2. Authenticity (not mass-marketing, personal tone, unique request)
-        3. Relevance (aligns with user's work, interesting topic, reasonable offer)
-        4. Reputation (known company, established person, verifiable identity)
-        5. Specificity (clear request/opportunity with details, not vague)
-        
-        Format your report with clear sections and prioritize opportunities that seem unique, personalized, and valuable.
-        """
-        
-        response = client.chat.completions.create(
-            model="gpt-4",  # Use appropriate OpenAI model
+def sort_emails(resume=False):
+    """Main function to sort emails.
+
+    Every analysis is journaled to CATEGORIZE_CHECKPOINT as it completes; with
+    resume=True an interrupted run continues without fetching or paying again.
+    """
+    run = metrics.start_run("sort_emails")
+    checkpoint = Checkpoint(CATEGORIZE_CHECKPOINT)
+    
+    if resume and checkpoint.fetched:
+        print(f"Resuming previous run ({len(checkpoint.results)} emails already analyzed)...")
+        sent_emails = mail.fetch_sent(7)
+    else:
+        checkpoint.reset()
+        # First fetch new emails, and the past week's sent mail over the same connection
+        # so known correspondents are categorized first
+        print("Fetching new emails...")
+        _, sent_emails = mail.fetch_mailboxes(72, 7, EMAILS_FILE)
+        checkpoint.mark_fetched()
+    
+    # Initialize the LLM backends
+    llm = LLMRouter.from_env()
+    
+    print_category_summary(*categorize(llm, read_emails(), checkpoint, sent_emails))
+    
+    paths = run.write()
+    print(f"\n{run.summary()}")
+    print(f"Run metrics saved to: {paths['json']}")
+
+def rank_opportunities(llm, business_emails, sponsorship_emails):
+    """Rank business and sponsorship emails by quality and write OPPORTUNITY_REPORT"""
+    all_relevant_emails = business_emails + sponsorship_emails
+    
+    if not all_relevant_emails:
+        print("No business or sponsorship emails found to analyze.")
+        return None
+    
+    # Analyze emails to identify quality opportunities
+    print("\nAnalyzing business and sponsorship emails for quality opportunities...")
+    
+    # Create a report with AI analysis
+    prompt = f"""
+    You are an executive assistant tasked with filtering through business and sponsorship emails to identify the highest quality opportunities.
+    
+    Please analyze these {len(all_relevant_emails)} business and sponsorship emails and create a structured report that:
+    
+    1. Categorizes them as "High Value" or "Mass Marketing/Generic"
+    2. Ranks the high-value opportunities in order of priority
+    3. Provides brief reasoning for your assessments
+    
+    Here are the emails to analyze:
+    
+    {json.dumps([{
+        "category": email["analysis"]["category"],
+        "from": email["from"],
+        "subject": email["subject"],
+        "company": email["analysis"]["company_name"],
+        "topic": email["analysis"]["topic"],
+        "confidence": email["analysis"]["confidence"],
+        "snippet": email["body"][:500] + "..." if len(email["body"]) > 500 else email["body"]
+    } for email in all_relevant_emails], indent=2)}
+    
+    Consider the following criteria to evaluate opportunities:
+    1. Personalization (specifically addressed to the user, mentions specific work)
+    2. Authenticity (not mass-marketing, personal tone, unique request)
+    3. Relevance (aligns with user's work, interesting topic, reasonable offer)
+    4. Reputation (known company, established person, verifiable identity)
+    5. Specificity (clear request/opportunity with details, not vague)
+    
+    Format your report with clear sections and prioritize opportunities that seem unique, personalized, and valuable.
+    """
+    
+    with metrics.span("report"):
+        response = llm.chat(
+            "report",
             messages=[
                 {
                     "role": "system", 
                     "content": "You are an executive assistant who helps identify high-quality opportunities from business emails. You excel at distinguishing personalized offers from mass marketing campaigns."
                 },
                 {"role": "user", "content": prompt}
-            ]
+            ],
+            email=all_relevant_emails
         )
+    
+    report = response.choices[0].message.content
+    
+    # Print the report
+    print("\n" + "="*50)
+    print("BUSINESS AND SPONSORSHIP OPPORTUNITY REPORT")
+    print("="*50 + "\n")
+    print(report)
+    
+    # Save the report to a file
+    atomic_write(OPPORTUNITY_REPORT, "BUSINESS AND SPONSORSHIP OPPORTUNITY REPORT\n" + "="*50 + "\n\n" + report)
+    
+    print(f"\nReport saved to {OPPORTUNITY_REPORT}")
+    return report
+
+def generate_opportunity_report(categorized_emails_path=CATEGORIZED_EMAILS_JSON):
+    """Generate a structured report highlighting valuable business opportunities"""
+    run = metrics.start_run("opportunity_report")
+    try:
+        # Load categorized emails
+        with open(categorized_emails_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
         
-        report = response.choices[0].message.content
-        
-        # Print the report
-        print("\n" + "="*50)
-        print("BUSINESS AND SPONSORSHIP OPPORTUNITY REPORT")
-        print("="*50 + "\n")
-        print(report)
+        # Initialize the LLM backends
+        llm = LLMRouter.from_env()
         
-        # Save the report to a file
-        with open(OPPORTUNITY_REPORT, "w", encoding="utf-8") as f:
-            f.write("BUSINESS AND SPONSORSHIP OPPORTUNITY REPORT\n")
-            f.write("="*50 + "\n\n")
-            f.write(report)
-            
-        print(f"\nReport saved to {OPPORTUNITY_REPORT}")
+        if rank_opportunities(llm, data.get("business_emails", []), data.get("sponsorship_emails", [])) is not None:
+            run.write()
             
     except FileNotFoundError:
         print(f"Error: File {categorized_emails_path} not found. Please run sort_emails() first.")
+    except CassetteMiss:
+        raise
     except Exception as e:
         print(f"Error generating opportunity report: {e}")
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Categorize emails and report business opportunities")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its checkpoint instead of starting over")
+    args = parser.parse_args()
+    
     # First sort the emails
-    sort_emails()
+    sort_emails(resume=args.resume)
     
     # Then generate the opportunity report
     generate_opportunity_report() 
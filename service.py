@@ -0,0 +1,412 @@
+"""Keep the agents running behind a small HTTP API for an internal UI.
+
+    python pipeline.py serve --port 8080
+
+One process holds the IMAP and SMTP sessions and the LLM clients open
+between requests. Syncs, drafts and sends run as jobs on a bounded worker
+pool; when SERVICE_MAX_QUEUED jobs are already waiting, new ones are turned
+away with 503 instead of piling up.
+
+    GET  /health                        workers and queued jobs
+    GET  /stats                         p50/p99 latency per endpoint
+    POST /sync                          fetch and triage in the background, returns a job
+    GET  /jobs/<id>                     state and result of a job
+    GET  /needs-response                emails that need a response, most urgent first
+    GET  /needs-response/<id>           one of them with its body and current draft
+    GET  /needs-response/<id>/draft     its current draft
+    POST /needs-response/<id>/draft     write the draft, or edit it with {"instructions": "..."}
+    POST /needs-response/<id>/send      send the current draft
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import email_responder2
+import important_email2
+import pipeline
+from email_agents import mail, metrics
+from email_agents.checkpoint import Checkpoint, email_key
+from email_agents.llm_backend import LLMRouter
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+# Jobs running at once, and jobs that may wait or run before new ones are refused
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "4"))
+SERVICE_MAX_QUEUED = int(os.getenv("SERVICE_MAX_QUEUED", "32"))
+# Seconds a request waits for its draft or send job before answering 504
+SERVICE_JOB_TIMEOUT = float(os.getenv("SERVICE_JOB_TIMEOUT", "120"))
+
+# Finished jobs kept for /jobs, and latency samples kept per endpoint
+MAX_JOBS = 200
+LATENCY_SAMPLES = 10_000
+
+
+class Busy(Exception):
+    """The worker pool already has SERVICE_MAX_QUEUED jobs"""
+
+
+class Conflict(Exception):
+    """The request does not fit the draft's current state, e.g. sending with no draft (409)"""
+
+
+class Unprocessable(Exception):
+    """The email cannot be acted on as it is, e.g. no address to reply to (422)"""
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class TriageService:
+    """Warm sessions, the latest triage results and the drafts being worked on"""
+
+    def __init__(self, llm, session, workers=None, max_queued=None):
+        self.llm = llm
+        self.session = session
+        self.rejected = 0
+        self.workers = workers or SERVICE_WORKERS
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="service-job")
+        # Syncs run one at a time on their own thread, so drafts and sends never wait behind a long one
+        self._sync_pool = ThreadPoolExecutor(1, thread_name_prefix="service-sync")
+        self.max_queued = max_queued or SERVICE_MAX_QUEUED
+        self._slots = threading.BoundedSemaphore(self.max_queued)
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._sync_lock = threading.Lock()
+        self._sync_job = None
+        self.last_sync = None
+        # Needs-response emails by id, in report order, and the draft being worked on for each
+        self.items = OrderedDict()
+        self.drafts = {}
+
+    @classmethod
+    def from_env(cls, workers=None, max_queued=None):
+        """Service with the LLM backends and mail servers configured in the environment"""
+        return cls(LLMRouter.from_env(), mail.MailSession(), workers, max_queued)
+
+    def close(self):
+        self._sync_pool.shutdown(wait=True, cancel_futures=True)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+    def queued(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job["status"] in ("queued", "running"))
+
+    def submit(self, kind, fn, *args):
+        """Run ``fn`` on the worker pool (syncs on their own thread); returns (job, future) or raises Busy"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise Busy(f"{self.max_queued} jobs already queued")
+        job = {"id": f"{kind}-{time.time_ns():x}", "kind": kind, "status": "queued",
+               "submitted": datetime.now().isoformat(), "result": None, "error": None}
+
+        def run():
+            job["status"] = "running"
+            start = time.perf_counter()
+            # Every job collects into its own run, written as service_<kind> when it ends, so the
+            # service holds no metrics between jobs and other jobs' runs are never swapped out
+            job_run = metrics.RunMetrics(f"service_{kind}")
+            try:
+                with metrics.bound_run(job_run):
+                    job["result"] = fn(*args)
+                job["status"] = "done"
+                return job["result"]
+            except Exception as e:
+                job["status"], job["error"] = "failed", str(e)
+                raise
+            finally:
+                job["seconds"] = round(time.perf_counter() - start, 3)
+                job_run.write()
+                self._slots.release()
+
+        with self._lock:
+            self._jobs[job["id"]] = job
+            while len(self._jobs) > MAX_JOBS:
+                self._jobs.popitem(last=False)
+        return job, (self._sync_pool if kind == "sync" else self._pool).submit(run)
+
+    def job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def start_sync(self):
+        """The running sync job, or a new one"""
+        with self._sync_lock:
+            if self._sync_job is None or self._sync_job["status"] not in ("queued", "running"):
+                self._sync_job = self.submit("sync", self.sync)[0]
+            return self._sync_job
+
+    def sync(self):
+        """Fetch the triage window and sent mail over the warm sessions and triage it"""
+        checkpoint = Checkpoint(important_email2.IMPORTANCE_CHECKPOINT)
+        checkpoint.reset()
+        emails, sent_emails = self.session.fetch_mailboxes(pipeline.TRIAGE_HOURS, pipeline.SENT_DAYS,
+                                                           important_email2.RECENT_EMAILS_FILE)
+        checkpoint.mark_fetched()
+        threads, needs_response_emails, queued = important_email2.triage(self.llm, emails, sent_emails, checkpoint)
+        with self._lock:
+            self.items = OrderedDict((email_key(email), email) for email in needs_response_emails)
+            # Drafts of emails that still need a response carry over to the new results
+            self.drafts = {key: draft for key, draft in self.drafts.items() if key in self.items}
+            self.last_sync = datetime.now().isoformat()
+        return {"emails": len(emails), "threads": len(threads), "needs_response": len(needs_response_emails),
+                "retried_next_run": len(queued)}
+
+    def summary(self):
+        with self._lock:
+            return {"last_sync": self.last_sync, "items": [
+                {"id": key, "subject": email["subject"], "from": email["from"], "received": email["received"],
+                 "importance": email["analysis"]["importance"], "time_sensitive": email["analysis"]["time_sensitive"],
+                 "reason": email["analysis"]["reason"], "already_responded": email["already_responded"],
+                 "has_draft": key in self.drafts}
+                for key, email in self.items.items()]}
+
+    def item(self, key):
+        with self._lock:
+            email = self.items.get(key)
+            draft = self.drafts.get(key)
+        if email is None:
+            return None
+        return dict(email, id=key, draft=self._draft_view(key, draft))
+
+    def _draft_view(self, key, draft):
+        if not draft or not draft["text"]:
+            return None
+        subject, body = email_responder2.split_draft(draft["text"])
+        return {"id": key, "subject": subject, "body": body, "edit_rounds": draft["edit_rounds"]}
+
+    def draft(self, key):
+        with self._lock:
+            return self._draft_view(key, self.drafts.get(key))
+
+    def _draft_state(self, key):
+        with self._lock:
+            return self.drafts.setdefault(key, {"conversation": [], "text": None, "edit_rounds": 0,
+                                                "lock": threading.Lock()})
+
+    def write_draft(self, key, instructions=None):
+        """Job: write the first draft, or apply ``instructions`` to the current one"""
+        email_data = email_responder2.emails_from_results([self.items[key]])[0]
+        state = self._draft_state(key)
+        # Edits of one email build on each other, so they run one at a time
+        with state["lock"]:
+            if state.get("sent"):
+                raise Conflict("The draft was sent while this job waited")
+            if state["text"] and not instructions:
+                return self._draft_view(key, state)
+            start = time.perf_counter()
+            editing = bool(state["text"])
+            text = email_responder2.generate_response(self.llm, email_data, instructions, state["conversation"])
+            if not text:
+                raise RuntimeError("The model returned no draft")
+            if editing:
+                metrics.observe("edit_round", time.perf_counter() - start)
+                metrics.count("edit_rounds")
+                state["edit_rounds"] += 1
+            state["text"] = text
+            return self._draft_view(key, state)
+
+    def send(self, key):
+        """Job: send the current draft over the warm SMTP session"""
+        email_data = email_responder2.emails_from_results([self.items[key]])[0]
+        state = self._draft_state(key)
+        with state["lock"]:
+            if not state["text"]:
+                raise Conflict("There is no draft to send")
+            if not email_data["email_address"]:
+                raise Unprocessable("No email address found for the recipient")
+            subject, body = email_responder2.split_draft(state["text"])
+            email_responder2.send_response(email_data, subject, body, state["edit_rounds"], self.session.send_email)
+            # Jobs waiting on this draft's lock must find it gone, or they send it again
+            state["text"] = None
+            state["sent"] = True
+            with self._lock:
+                if key in self.items:
+                    self.items[key] = dict(self.items[key], already_responded=True)
+                if self.drafts.get(key) is state:
+                    del self.drafts[key]
+        return {"sent": True, "to": email_data["email_address"], "subject": subject}
+
+
+class LatencyStats:
+    """Recent request latencies per endpoint"""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self._lock = threading.Lock()
+        self._samples = samples
+        self._latencies = {}
+        self._counts = {}
+
+    def record(self, route, status, seconds):
+        with self._lock:
+            self._latencies.setdefault(route, deque(maxlen=self._samples)).append(seconds)
+            counts = self._counts.setdefault(route, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def to_dict(self):
+        with self._lock:
+            return {route: {"requests": sum(self._counts[route].values()),
+                            "status": {str(status): count for status, count in sorted(self._counts[route].items())},
+                            "p50_ms": round(_percentile(values, 0.5) * 1000, 2),
+                            "p99_ms": round(_percentile(values, 0.99) * 1000, 2),
+                            "max_ms": round(max(values) * 1000, 2)}
+                    for route, values in self._latencies.items()}
+
+
+# (method, path template, handler name); latencies are reported per "METHOD template"
+_ROUTES = [(method, template, re.compile("^" + template.replace("{id}", r"(?P<id>[\w-]+)") + "$"), name)
+           for method, template, name in (
+               ("GET", "/health", "health"),
+               ("GET", "/stats", "stats"),
+               ("POST", "/sync", "sync"),
+               ("GET", "/jobs/{id}", "job"),
+               ("GET", "/needs-response", "list"),
+               ("GET", "/needs-response/{id}", "item"),
+               ("GET", "/needs-response/{id}/draft", "get_draft"),
+               ("POST", "/needs-response/{id}/draft", "write_draft"),
+               ("POST", "/needs-response/{id}/send", "send"),
+           )]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; with Nagle the body waits for a delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _wait(self, future):
+        try:
+            return 200, future.result(timeout=SERVICE_JOB_TIMEOUT)
+        except FutureTimeout:
+            return 504, {"error": f"Still running after {SERVICE_JOB_TIMEOUT:g}s"}
+        except Conflict as e:
+            return 409, {"error": str(e)}
+        except Unprocessable as e:
+            return 422, {"error": str(e)}
+        except Exception as e:
+            # Model, mail server, replay and configuration faults are the service's, not the client's
+            return 500, {"error": str(e)}
+
+    def _dispatch(self, name, params):
+        service = self.server.service
+        if name == "health":
+            return 200, {"status": "ok", "workers": service.workers, "queued": service.queued(),
+                         "rejected": service.rejected,
+                         "last_sync": service.last_sync}
+        if name == "stats":
+            return 200, self.server.stats.to_dict()
+        if name == "sync":
+            return 202, service.start_sync()
+        if name == "job":
+            job = service.job(params["id"])
+            return (200, job) if job else (404, {"error": "No such job"})
+        if name == "list":
+            return 200, service.summary()
+        key = params["id"]
+        if key not in service.items:
+            return 404, {"error": "No such email; run a sync first"}
+        if name == "item":
+            return 200, service.item(key)
+        if name == "get_draft":
+            draft = service.draft(key)
+            return (200, draft) if draft else (404, {"error": "No draft yet"})
+        if name == "write_draft":
+            instructions = self._read_json().get("instructions")
+            return self._wait(service.submit("draft", service.write_draft, key, instructions)[1])
+        if name == "send":
+            return self._wait(service.submit("send", service.send, key)[1])
+        return 404, {"error": "Not found"}
+
+    def _handle(self, method):
+        start = time.perf_counter()
+        path = self.path.split("?", 1)[0]
+        route = f"{method} (unknown)"
+        try:
+            for route_method, template, pattern, name in _ROUTES:
+                match = pattern.match(path)
+                if route_method == method and match:
+                    route = f"{method} {template}"
+                    status, payload = self._dispatch(name, match.groupdict())
+                    break
+            else:
+                status, payload = 404, {"error": "Not found"}
+        except Busy as e:
+            status, payload = 503, {"error": str(e)}
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            # A request body that is not JSON
+            status, payload = 400, {"error": str(e)}
+        except Exception as e:
+            status, payload = 500, {"error": str(e)}
+        # Recorded before the reply goes out, so a client that asks /stats next already sees it
+        self.server.stats.record(route, status, time.perf_counter() - start)
+        self._reply(status, payload)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def log_message(self, format, *args):
+        if os.getenv("SERVICE_ACCESS_LOG") == "1":
+            super().log_message(format, *args)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for a UI's burst of new connections; the default backlog of 5 drops SYNs that retry after 1 s
+    request_queue_size = 128
+
+
+def make_server(service, host=None, port=None):
+    """HTTP server for ``service``; port 0 picks a free port"""
+    server = _Server((host or SERVICE_HOST, SERVICE_PORT if port is None else port), _Handler)
+    server.service = service
+    server.stats = LatencyStats()
+    return server
+
+
+def serve(host=None, port=None):
+    """Run the service until interrupted"""
+    service = TriageService.from_env()
+    server = make_server(service, host, port)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]} "
+          f"({service.workers} workers)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,73 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import email
+import imaplib
+import json
+import smtplib
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+from benchmarks.fake_imap import FakeIMAPServer
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.fake_smtp import FakeSMTPServer
+from benchmarks.run import compare, run_scenario
+from benchmarks.synthetic_mailbox import generate_mailbox
+
+
+def test_synthetic_mailbox_is_realistic_and_deterministic():
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    inbox = generate_mailbox(60, seed=3, attachment_ratio=0.5, attachment_size=1000, now=now)
+    parsed = [email.message_from_bytes(m["data"]) for m in inbox]
+    assert any(msg.is_multipart() and msg.get_content_type() == "multipart/alternative" for msg in parsed)
+    assert any(part.get_filename() for msg in parsed for part in msg.walk())
+    assert any(msg.get("In-Reply-To") for msg in parsed)
+    assert [m["internaldate"] for m in inbox] == sorted(m["internaldate"] for m in inbox)
+    again = generate_mailbox(60, seed=3, attachment_ratio=0.5, attachment_size=1000, now=now)
+    assert [m["data"] for m in again] == [m["data"] for m in inbox]
+
+
+def test_fake_imap_and_smtp_round_trip():
+    inbox = generate_mailbox(5, seed=1)
+    with FakeIMAPServer({"INBOX": inbox}) as server:
+        with imaplib.IMAP4(server.host, server.port) as imap:
+            imap.login("user", "pass")
+            assert imap.select("INBOX")[0] == "OK"
+            status, data = imap.search(None, "ALL")
+            assert data[0].split() == [b"1", b"2", b"3", b"4", b"5"]
+            status, data = imap.fetch(b"2", "(RFC822)")
+            assert status == "OK" and data[0][1] == inbox[1]["data"]
+        assert server.stats["messages_fetched"] == 1
+
+    with FakeSMTPServer() as server:
+        with smtplib.SMTP(server.host, server.port) as smtp:
+            smtp.login("user", "pass")
+            smtp.sendmail("me@example.com", ["you@example.com"], b"Subject: hi\r\n\r\nbody\r\n")
+        assert server.messages[0]["to"] == ["<you@example.com>"]
+
+
+def test_fake_llm_enforces_rate_limit():
+    with FakeLLMServer(rpm=1) as server:
+        body = json.dumps({"model": "m", "messages": [{"role": "user", "content": "hi"}]}).encode()
+
+        def post():
+            request = urllib.request.Request(server.base_url + "/chat/completions", data=body,
+                                             headers={"Content-Type": "application/json"})
+            return urllib.request.urlopen(request)
+
+        assert json.load(post())["choices"][0]["message"]["content"]
+        try:
+            post()
+            assert False, "expected a 429"
+        except urllib.error.HTTPError as e:
+            assert e.code == 429 and float(e.headers["Retry-After"]) > 0
+
+
+def test_scenario_produces_machine_readable_result():
+    result = run_scenario("find_important_emails", 10)
+    assert 0 < result["llm"]["requests"] <= 10  # one request per thread
+    assert result["imap"]["messages_fetched"] >= 10
+    json.dumps(result)
+    assert compare({"results": [result]}, {"results": [result]})
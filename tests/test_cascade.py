@@ -0,0 +1,100 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.cascade_eval import sweep
+from benchmarks.run import run_scenario
+from email_agents import cascade, metrics
+from email_agents.llm_backend import FAST_TIER, FULL_TIER, Backend, LLMRouter
+from email_agents.models import EmailImportance
+
+
+def _importance(importance="low", needs_response=False, confidence=0.9):
+    return EmailImportance(importance=importance, reason="r", needs_response=needs_response,
+                           time_sensitive=False, topics=["t"], confidence=confidence)
+
+
+def _router(**kwargs):
+    backends = {"openai": Backend("openai"), "local": Backend("local", model="llama")}
+    return LLMRouter(backends, **kwargs)
+
+
+def test_fast_tier_routes_to_the_first_pass_model():
+    router = _router(fast_models={"importance": "gpt-4.1-nano"}, fast_backends={"categorize": "local"},
+                     local_domains={"lawfirm.com"})
+    assert router.has_cascade("importance") and not router.has_cascade("report")
+    assert router.route("importance", tier=FAST_TIER)[1] == "gpt-4.1-nano"
+    assert router.route("importance", tier=FULL_TIER)[1] == "gpt-4.1"
+    assert router.route("categorize", tier=FAST_TIER) == (router.backends["local"], "llama")
+    # Without a cascade the fast tier is the main model
+    assert router.route("report", tier=FAST_TIER)[1] == "gpt-4"
+
+
+def test_uncertain_importance_reasons():
+    person = {"from": "Ann <ann@example.com>", "body": "Could you send the slides?"}
+    newsletter = {"from": "Shop <no-reply@shop.com>", "body": "Deals. Unsubscribe"}
+    assert cascade.importance_uncertain(person, _importance("high", True)) is None
+    assert cascade.importance_uncertain(newsletter, _importance()) is None
+    assert cascade.importance_uncertain(person, None) == "failed"
+    assert cascade.importance_uncertain(person, _importance("high", True, 0.4)) == "low_confidence"
+    assert cascade.importance_uncertain(person, _importance("medium", True)) == "medium"
+    assert cascade.importance_uncertain(person, _importance("medium", True), escalate_medium=False) is None
+    assert cascade.importance_uncertain(newsletter, _importance("high", True)) == "heuristic_disagrees"
+
+
+def test_classify_escalates_only_uncertain_emails():
+    router = _router(fast_models={"importance": "gpt-4.1-nano"}, local_domains={"lawfirm.com"})
+    calls = []
+
+    def analyze(llm, email, tier=FULL_TIER):
+        calls.append((email["id"], tier))
+        return _importance("medium" if email["id"] == "unsure" and tier == FAST_TIER else "low")
+
+    for email_id, sender in (("sure", "a@shop.com"), ("unsure", "b@shop.com"), ("local", "c@lawfirm.com")):
+        cascade.classify(router, "importance", {"id": email_id, "from": sender, "body": ""}, analyze,
+                         cascade.importance_uncertain)
+    assert calls == [("sure", FAST_TIER), ("unsure", FAST_TIER), ("unsure", FULL_TIER), ("local", FAST_TIER)]
+
+
+def test_run_record_reports_each_tier_and_escalation_rate():
+    run = metrics.RunMetrics("unit")
+    for _ in range(4):
+        run.record_llm_call("importance", "openai", "gpt-4.1-nano", 0.1,
+                            {"prompt_tokens": 1000, "completion_tokens": 100}, tier=FAST_TIER)
+    run.record_llm_call("importance", "openai", "gpt-4.1", 0.5, {"prompt_tokens": 1000, "completion_tokens": 100})
+    llm = run.to_dict()["llm"]
+    assert llm["cascade"] == {"importance": {"first_pass": 4, "escalated": 1, "escalation_rate": 0.25}}
+    assert llm["by_tier"]["fast"]["calls"] == 4 and llm["by_tier"]["full"]["latency_seconds"]["p50"] == 0.5
+    assert 'email_agents_llm_escalation_rate{run="unit",task="importance"} 0.25' in run.to_prometheus()
+    assert "importance escalated 1/4 (25%)" in run.summary()
+
+
+def test_sweep_trades_escalations_for_accuracy():
+    samples = [
+        {"from": "a@x.com", "body": "Can we meet?", "label": {"needs_response": True}},
+        {"from": "b@x.com", "body": "Can we talk?", "label": {"needs_response": True}},
+        {"from": "c@x.com", "body": "FYI only.", "label": {"needs_response": False}},
+    ]
+    wrong = _importance("high", False, confidence=0.6).model_dump()
+    right = _importance("high", True, confidence=0.95).model_dump()
+    results = {
+        "task": "importance",
+        "answers": [{"fast": right, "full": right}, {"fast": wrong, "full": right},
+                    {"fast": _importance().model_dump(), "full": _importance().model_dump()}],
+        "tiers": {"fast": {"cost_usd": 0.003}, "full": {"cost_usd": 0.03}},
+    }
+    report = sweep("importance", samples, results, thresholds=[0.5, 0.7])
+    assert report["fast_only_accuracy"] == round(2 / 3, 4) and report["full_only_accuracy"] == 1.0
+    loose, strict = report["thresholds"][0], report["thresholds"][2]
+    # The wrong answer disagrees with the heuristics either way; 0.7 also flags its low confidence
+    assert loose["accuracy"] == strict["accuracy"] == 1.0
+    assert loose["escalation_rate"] == round(1 / 3, 4)
+    assert loose["cost_per_email"] < report["full_only_cost_per_email"]
+
+
+def test_cascade_scenario_escalates_a_minority():
+    result = run_scenario("find_important_emails", 40, cascade_model="gpt-4.1-nano")
+    summary = result["llm_usage"]["cascade"]["importance"]
+    assert 0 < summary["escalated"] < summary["first_pass"]
+    assert result["llm"]["requests"] == summary["first_pass"] + summary["escalated"]
+    assert set(result["llm_usage"]["by_tier"]) == {"fast", "full"}
@@ -0,0 +1,60 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+import email_responder2
+import important_email2
+import send_mail2
+from benchmarks.fake_llm import FakeLLMServer
+from email_agents import metrics
+from email_agents.cassette import Cassette, CassetteMiss
+from email_agents.llm_backend import Backend, LLMRouter
+
+EMAIL = {"subject": "Partnership proposal", "from": "Bo <bo@acme.com>", "received": "Mon, 05 Jan 2026 09:00:00 +0000",
+         "body": "Could you send us your rates for a partnership before Friday?"}
+
+
+def _router(base_url, cassette):
+    return LLMRouter({"openai": Backend("openai", base_url=base_url, api_key="test", max_concurrency=1)},
+                     cassette=cassette)
+
+
+def _calls(llm):
+    importance = important_email2.analyze_email_importance(llm, EMAIL)
+    category = send_mail2.analyze_email(llm, EMAIL)
+    report = send_mail2.rank_opportunities(llm, [dict(EMAIL, analysis=category.model_dump())], [])
+    reply = email_responder2.generate_response(llm, dict(EMAIL, preview=EMAIL["body"]))
+    return importance, category, report, reply
+
+
+def test_replay_answers_offline_with_the_recorded_responses(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "cassette.jsonl")
+    with FakeLLMServer() as server:
+        recorded = _calls(_router(server.base_url, Cassette(path, "record")))
+        assert server.stats["requests"] == 4
+
+    # The server is gone: every answer must come from the cassette
+    run = metrics.start_run("test")
+    replayed = _calls(_router("http://127.0.0.1:9/v1", Cassette(path, "replay", latency=0)))
+    assert replayed == recorded
+    assert run.counters["llm_replayed"] == 4 and run.to_dict()["llm"]["completion_tokens"] > 0
+
+
+def test_replay_fails_clearly_without_a_recording(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    received = r"^\s*Received: .*$"
+    with FakeLLMServer() as server:
+        important_email2.analyze_email_importance(_router(server.base_url, Cassette(path, "record")), EMAIL)
+        # Timestamps can be left out of the fingerprint, when recording and replaying
+        timeless = str(tmp_path / "timeless.jsonl")
+        important_email2.analyze_email_importance(
+            _router(server.base_url, Cassette(timeless, "record", ignore=received)), EMAIL)
+
+    changed = dict(EMAIL, received="Tue, 06 Jan 2026 09:00:00 +0000")
+    with pytest.raises(CassetteMiss, match="No recorded importance call for model gpt-4.1"):
+        important_email2.analyze_email_importance(_router("http://127.0.0.1:9/v1", Cassette(path, "replay")), changed)
+    cassette = Cassette(timeless, "replay", latency=0, ignore=received)
+    assert important_email2.analyze_email_importance(_router("http://127.0.0.1:9/v1", cassette), changed)
@@ -0,0 +1,79 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+
+import pytest
+
+import important_email2
+from email_agents.checkpoint import Checkpoint, atomic_write, email_key
+from email_agents.llm_backend import Backend, LLMRouter
+from email_agents.models import EmailImportance
+
+
+def test_journal_survives_a_torn_last_record(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = Checkpoint(path)
+    checkpoint.mark_fetched()
+    checkpoint.record("a", {"importance": "high"})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"key": "b", "res')  # crash in the middle of a write
+
+    resumed = Checkpoint(path)
+    assert resumed.fetched
+    assert resumed.results == {"a": {"importance": "high"}}
+    resumed.record("c", {"importance": "low"})
+    assert set(Checkpoint(path).results) == {"a", "c"}
+
+    resumed.reset()
+    assert not os.path.exists(path) and not Checkpoint(path).fetched
+
+
+def test_atomic_write_replaces_whole_file(tmp_path):
+    path = str(tmp_path / "out.json")
+    atomic_write(path, "old")
+    atomic_write(path, "new")
+    assert open(path).read() == "new"
+    assert os.listdir(tmp_path) == ["out.json"]
+
+
+def test_resume_only_analyzes_pending_emails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    emails = [{"subject": f"Email {i}", "from": f"person{i}@example.com", "received": "now", "body": "Hi"}
+              for i in range(5)]
+    fetches = []
+    analyzed = []
+    crash = {"subject": "Email 2"}
+
+    monkeypatch.setattr(important_email2, "get_emails", lambda hours: fetches.append(hours))
+    monkeypatch.setattr(important_email2, "get_sent_emails", lambda days: [])
+    monkeypatch.setattr(important_email2, "read_emails", lambda: list(emails))
+    monkeypatch.setattr(important_email2.LLMRouter, "from_env",
+                        classmethod(lambda cls: LLMRouter({"openai": Backend("openai", max_concurrency=1)})))
+
+    def analyze(llm, email):
+        if email["subject"] == crash["subject"]:
+            raise RuntimeError("killed")
+        analyzed.append(email["subject"])
+        return EmailImportance(importance="high", reason="r", needs_response=True,
+                               time_sensitive=False, topics=["t"])
+
+    monkeypatch.setattr(important_email2, "analyze_email_importance", analyze)
+
+    with pytest.raises(RuntimeError):
+        important_email2.find_important_emails()
+    assert fetches == [24]
+    done = set(Checkpoint(important_email2.IMPORTANCE_CHECKPOINT).results)
+    assert {email_key(emails[0]), email_key(emails[1])} <= done
+
+    crash["subject"] = None
+    analyzed.clear()
+    important_email2.find_important_emails(resume=True)
+
+    assert fetches == [24]
+    assert "Email 0" not in analyzed and "Email 2" in analyzed
+    data = json.load(open(important_email2.NEEDS_RESPONSE_JSON))
+    assert data["complete"] is True
+    assert [email["subject"] for email in data["needs_response_emails"]] == [f"Email {i}" for i in range(5)]
+    assert not os.path.exists(important_email2.IMPORTANCE_CHECKPOINT)
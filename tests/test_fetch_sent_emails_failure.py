@@ -26,7 +26,7 @@ def fail_select_imap(server, port):
     return FailSelectIMAP(server, port)
 
 def test_fetch_recent_sent_emails_handles_select_failure(monkeypatch):
-    monkeypatch.setattr(important_email2.imaplib, 'IMAP4_SSL', fail_select_imap)
+    monkeypatch.setattr(imaplib, 'IMAP4_SSL', fail_select_imap)
     monkeypatch.setenv('EMAIL_USER', 'user')
     monkeypatch.setenv('EMAIL_PASSWORD', 'pass')
     result = important_email2.fetch_recent_sent_emails(days=1)
@@ -0,0 +1,53 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import imaplib
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fake_imap import FakeIMAPServer
+from benchmarks.synthetic_mailbox import generate_mailbox
+from email_agents.imap_search import parse_internaldates, search_criteria, search_window, sequence_set
+
+
+def test_criteria_and_sequence_sets():
+    cutoff = datetime(2026, 3, 2, 10, tzinfo=timezone.utc)
+    assert search_criteria(cutoff) == '(SINCE "01-Mar-2026")'
+    assert search_criteria(cutoff, unseen=True, exclude_from=["news@x.com"], gmail_raw="-from:a") == \
+        '(SINCE "01-Mar-2026" UNSEEN NOT FROM "news@x.com" X-GM-RAW "-from:a")'
+    assert sequence_set([9, 1, 2, 3, 4, 7]) == "1:4,7,9"
+    dates = parse_internaldates([b'12 (INTERNALDATE " 1-Mar-2026 09:15:00 +0100")', b")"])
+    assert dates == {12: datetime(2026, 3, 1, 8, 15, tzinfo=timezone.utc)}
+
+
+def test_window_is_exact_to_the_hour(monkeypatch):
+    monkeypatch.delenv("IMAP_UNSEEN_ONLY", raising=False)
+    monkeypatch.delenv("IMAP_EXCLUDE_FROM", raising=False)
+    now = datetime.now(timezone.utc)
+    inbox = generate_mailbox(120, hours=60, seed=5, now=now)
+    expected = [(str(seq).encode(), m["internaldate"].replace(microsecond=0))
+                for seq, m in enumerate(inbox, 1) if m["internaldate"] >= now - timedelta(hours=24)]
+    with FakeIMAPServer({"INBOX": inbox}) as server:
+        with imaplib.IMAP4(server.host, server.port) as imap:
+            imap.login("user", "pass")
+            imap.select("INBOX")
+            assert search_window(imap, 24, now=now) == expected
+
+            monkeypatch.setenv("IMAP_UNSEEN_ONLY", "1")
+            unseen = search_window(imap, 24, now=now)
+        assert server.stats.get("body_bytes", 0) == 0
+    assert unseen == [item for item in expected if "\\Seen" not in inbox[int(item[0]) - 1]["flags"]]
+
+
+def test_gmail_raw_is_only_sent_to_gmail(monkeypatch):
+    monkeypatch.setenv("IMAP_GMAIL_RAW", "is:unread")
+    now = datetime.now(timezone.utc)
+    inbox = generate_mailbox(30, hours=10, seed=2, now=now)
+    for gmail in (False, True):
+        with FakeIMAPServer({"INBOX": inbox}, gmail=gmail) as server:
+            with imaplib.IMAP4(server.host, server.port) as imap:
+                imap.login("user", "pass")
+                imap.select("INBOX")
+                found = search_window(imap, 24, now=now)
+        unread = sum(1 for m in inbox if "\\Seen" not in m["flags"])
+        assert len(found) == (unread if gmail else len(inbox))
@@ -0,0 +1,74 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import threading
+import time
+import pytest
+
+from email_agents.llm_backend import Backend, LLMRouter
+
+
+class RecordingBackend(Backend):
+    def __init__(self, name, model=None, max_concurrency=4, delay=0.0):
+        super().__init__(name, model=model, max_concurrency=max_concurrency)
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+        self._count_lock = threading.Lock()
+
+    def chat(self, model, messages, **kwargs):
+        with self._slots:
+            with self._count_lock:
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+            time.sleep(self.delay)
+            self.calls.append(model)
+            with self._count_lock:
+                self.active -= 1
+        return model
+
+
+def make_router(**kwargs):
+    backends = {
+        "openai": RecordingBackend("openai", max_concurrency=4),
+        "local": RecordingBackend("local", model="llama", max_concurrency=1, delay=0.05),
+    }
+    return LLMRouter(backends, **kwargs)
+
+
+def test_routes_sensitive_senders_and_domains_to_local():
+    router = make_router(local_senders={"ceo@corp.com"}, local_domains={"lawfirm.com"})
+    assert router.route("importance", {"from": "CEO <CEO@corp.com>"})[0].name == "local"
+    assert router.route("importance", {"from": "a@lawfirm.com"})[1] == "llama"
+    backend, model = router.route("importance", {"from": "News <news@shop.com>"})
+    assert backend.name == "openai" and model == "gpt-4.1"
+    # Any sensitive email in a batch keeps the whole batch local
+    assert router.route("report", [{"from": "x@shop.com"}, {"from": "b@lawfirm.com"}])[0].name == "local"
+
+
+def test_per_task_model_and_backend():
+    router = make_router(task_models={"report": "gpt-4.1-mini"}, task_backends={"respond": "local"})
+    assert router.route("report") == (router.backends["openai"], "gpt-4.1-mini")
+    assert router.route("respond")[0].name == "local"
+    with pytest.raises(ValueError):
+        LLMRouter({"openai": Backend("openai")}, local_domains={"x.com"}).route("importance", {"from": "a@x.com"})
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("LOCAL_LLM_BASE_URL", "http://localhost:8080/v1")
+    monkeypatch.setenv("LOCAL_LLM_DOMAINS", "Corp.com, lawfirm.com")
+    monkeypatch.setenv("LLM_CATEGORIZE_MODEL", "gpt-4.1-nano")
+    router = LLMRouter.from_env()
+    assert router.local_domains == {"corp.com", "lawfirm.com"}
+    assert router.backends["local"].max_concurrency == 1
+    assert router.route("categorize")[1] == "gpt-4.1-nano"
+
+
+def test_map_keeps_order_and_isolates_backends():
+    router = make_router(local_domains={"slow.com"})
+    emails = [{"from": f"user{i}@{'slow.com' if i % 3 == 0 else 'fast.com'}"} for i in range(9)]
+    results = router.map("importance", lambda email: router.chat("importance", [], email=email), emails)
+    assert results == ["llama" if i % 3 == 0 else "gpt-4.1" for i in range(9)]
+    assert router.backends["local"].peak == 1
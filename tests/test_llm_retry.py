@@ -0,0 +1,128 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import types
+
+import pytest
+
+from benchmarks.fake_llm import FakeLLMServer
+from email_agents.llm_backend import Backend
+from email_agents.llm_retry import (CircuitBreaker, CircuitOpenError, RateLimiter, RetryPolicy, RetryQueue,
+                       call_with_retry, parse_duration, retry_after)
+
+
+class FakeStatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = types.SimpleNamespace(headers=headers or {})
+
+
+def test_parse_durations_and_retry_after():
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1.5") == 1.5
+    assert retry_after({"retry-after-ms": "250", "retry-after": "9"}) == 0.25
+    assert retry_after({"retry-after": "2"}) == 2
+
+
+def test_retries_transient_errors_and_honors_retry_after():
+    calls = []
+
+    def flaky():
+        calls.append(time.monotonic())
+        if len(calls) < 3:
+            raise FakeStatusError(429, {"retry-after-ms": "50"})
+        return "ok"
+
+    assert call_with_retry(flaky, RetryPolicy(max_retries=3, base_delay=0.001)) == "ok"
+    assert len(calls) == 3
+    assert calls[1] - calls[0] >= 0.05
+
+
+def test_non_retryable_errors_and_exhausted_retries_raise():
+    with pytest.raises(FakeStatusError):
+        call_with_retry(lambda: (_ for _ in ()).throw(FakeStatusError(400)), RetryPolicy(base_delay=0))
+    attempts = []
+
+    def always_down():
+        attempts.append(1)
+        raise FakeStatusError(503)
+
+    with pytest.raises(FakeStatusError):
+        call_with_retry(always_down, RetryPolicy(max_retries=2, base_delay=0))
+    assert len(attempts) == 3
+
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    policy = RetryPolicy(max_retries=0, base_delay=0)
+    for _ in range(2):
+        with pytest.raises(FakeStatusError):
+            call_with_retry(lambda: (_ for _ in ()).throw(FakeStatusError(500)), policy, breaker=breaker)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(lambda: "ok", policy, breaker=breaker)
+    time.sleep(0.06)
+    assert call_with_retry(lambda: "ok", policy, breaker=breaker) == "ok"
+    assert breaker.state == "closed"
+
+
+
+def test_non_retryable_errors_leave_the_breaker_alone():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.05)
+    policy = RetryPolicy(max_retries=0, base_delay=0)
+    down = lambda: (_ for _ in ()).throw(FakeStatusError(500))
+    bad_request = lambda: (_ for _ in ()).throw(FakeStatusError(400))
+    for _ in range(2):
+        with pytest.raises(FakeStatusError):
+            call_with_retry(down, policy, breaker=breaker)
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    # The probe hits a 400: no verdict on the backend, and the next call may probe again
+    with pytest.raises(FakeStatusError):
+        call_with_retry(bad_request, policy, breaker=breaker)
+    assert breaker.state == "half-open"
+    with pytest.raises(FakeStatusError):
+        call_with_retry(down, policy, breaker=breaker)
+    assert breaker.state == "open"
+
+    # Nor does a 400 reset the failure count of a closed breaker
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    for call in (down, bad_request, down):
+        with pytest.raises(FakeStatusError):
+            call_with_retry(call, policy, breaker=breaker)
+    assert breaker.state == "open"
+
+def test_rate_limiter_follows_headers():
+    limiter = RateLimiter()
+    limiter.acquire(100)  # unlimited until the server reports limits
+    limiter.update({"x-ratelimit-limit-requests": "600", "x-ratelimit-remaining-requests": "0"})
+    start = time.monotonic()
+    limiter.acquire()
+    # 600 rpm refills one request every 0.1s
+    assert time.monotonic() - start >= 0.05
+
+
+def test_backend_survives_rate_limits_and_server_errors():
+    with FakeLLMServer(rpm=600, error_rate=0.3, seed=1) as server:
+        backend = Backend("openai", base_url=server.base_url, api_key="x", max_concurrency=2,
+                          retry_policy=RetryPolicy(max_retries=10, base_delay=0.01, max_delay=0.2))
+        for _ in range(5):
+            response = backend.chat("gpt-4.1", [{"role": "user", "content": "Subject: hi"}])
+            assert response.choices[0].message.content
+        assert server.stats["requests"] == 5
+
+
+def test_retry_queue_round_trip(tmp_path):
+    queue = RetryQueue(str(tmp_path / "queue.json"), max_attempts=2)
+    first = {"subject": "A", "from": "a@x.com", "received": "1", "body": "x"}
+    second = {"subject": "B", "from": "b@x.com", "received": "2", "body": "y"}
+    assert queue.replace("importance", [first]) == [{"email": first, "attempts": 1}]
+    assert queue.merge("importance", [second, first]) == [first, second]
+    queue.replace("importance", [first])
+    assert queue.pending("importance")[0]["attempts"] == 2
+    assert queue.replace("importance", [first]) == []
+    assert queue.pending("importance") == []
@@ -0,0 +1,64 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.synthetic_mailbox import generate_mailbox, write_maildir, write_mbox
+from email_agents import local_mail, mail, metrics
+from email_agents.mime_parse import parse_message
+
+NOW = datetime.now(timezone.utc)
+
+
+def _expected(messages, hours):
+    cutoff = NOW - timedelta(hours=hours)
+    return [parse_message(message["data"]).subject for message in messages if message["internaldate"] >= cutoff]
+
+
+def test_mbox_and_maildir_read_the_window_like_imap(tmp_path, monkeypatch):
+    messages = generate_mailbox(60, hours=96, seed=4, now=NOW)
+    write_mbox(messages, str(tmp_path / "inbox.mbox"))
+    write_maildir(messages, str(tmp_path / "Maildir"))
+
+    for source in ("inbox.mbox", "Maildir"):
+        monkeypatch.setenv("LOCAL_MAILBOX", str(tmp_path / source))
+        run = metrics.start_run("test")
+        emails = mail.fetch_inbox(24, str(tmp_path / "emails.txt"))
+        assert [email["subject"] for email in emails] == _expected(messages, 24)
+        assert all(datetime.fromisoformat(email["internaldate"]) >= NOW - timedelta(hours=24, seconds=1)
+                   for email in emails)
+        assert [email["subject"] for email in mail.read_emails(str(tmp_path / "emails.txt"))] == _expected(messages, 24)
+        assert run.counters["search_candidates"] == 60 and run.counters["outside_window"] == 60 - len(emails)
+    # No IMAP account is needed, and sent mail only comes from LOCAL_SENT_MAILBOX
+    assert mail.fetch_sent(7) == []
+
+
+def test_mbox_separators_dates_and_quoted_from_lines(tmp_path):
+    path = tmp_path / "export.mbox"
+    path.write_bytes(
+        b"From alice@example.com Mon Jan  5 09:00:00 2026\n"
+        b"Subject: One\nFrom: alice@example.com\n\nFirst line\n>From the quoted part\n\n"
+        b"From 1797@xxx Tue Jan 06 18:20:11 +0100 2026\n"
+        b"Subject: Two\nFrom: bob@example.com\n\nSecond\n\n"
+        b"From nobody\n"
+        b"Subject: Three\nDate: Wed, 07 Jan 2026 10:00:00 +0000\n\nThird\n")
+
+    scanned = list(local_mail.scan_mbox(str(path)))
+    assert [date.isoformat() for date, _ in scanned] == [
+        "2026-01-05T09:00:00+00:00", "2026-01-06T17:20:11+00:00", "2026-01-07T10:00:00+00:00"]
+    assert [parse_message(raw).body for _, raw in scanned] == ["First line\n>From the quoted part", "Second", "Third"]
+    since = datetime(2026, 1, 6, tzinfo=timezone.utc)
+    assert [parse_message(raw).subject for _, raw in local_mail.scan_mbox(str(path), since)] == ["Two", "Three"]
+
+
+def test_maildir_names_with_impossible_times_fall_back_to_the_file_time(tmp_path):
+    cur = tmp_path / "Maildir" / "cur"
+    cur.mkdir(parents=True)
+    for name in ("999999999999999999.M1P1.host:2,S", "1767600000.M2P1.host:2,S"):
+        (cur / name).write_bytes(b"Subject: Hi\n\nBody\n")
+    os.utime(cur / "999999999999999999.M1P1.host:2,S", (1767000000, 1767000000))
+
+    dates = {os.path.basename(path): date for date, path in local_mail.maildir_files(str(tmp_path / "Maildir"))}
+    assert dates["999999999999999999.M1P1.host:2,S"] == datetime.fromtimestamp(1767000000, timezone.utc)
+    assert dates["1767600000.M2P1.host:2,S"] == datetime.fromtimestamp(1767600000, timezone.utc)
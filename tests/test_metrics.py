@@ -0,0 +1,60 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import types
+
+from email_agents import metrics
+from email_agents.llm_backend import Backend, LLMRouter
+
+
+def test_estimate_cost_uses_price_table():
+    # 1M uncached prompt tokens + 1M completion tokens of gpt-4.1
+    assert metrics.estimate_cost("gpt-4.1", 1_000_000, 1_000_000) == 10.0
+    # Cached tokens are billed at the cached rate, dated snapshots at the base price
+    assert metrics.estimate_cost("gpt-4.1-2025-04-14", 1_000_000, 0, cached_tokens=1_000_000) == 0.5
+    assert metrics.estimate_cost("gpt-4.1", 1000, 1000, backend="local") == 0.0
+    assert metrics.estimate_cost("some-local-model", 1000, 1000) == 0.0
+
+
+def test_run_record_and_prometheus_export(tmp_path):
+    run = metrics.RunMetrics("unit")
+    with run.span("fetch"):
+        pass
+    with run.span("fetch"):
+        pass
+    run.count("llm_retries", 2)
+    run.record_llm_call("importance", "openai", "gpt-4.1", 0.25,
+                        {"prompt_tokens": 100, "completion_tokens": 20, "prompt_tokens_details": {"cached_tokens": 50}})
+
+    record = run.to_dict()
+    assert record["stages"]["fetch"]["calls"] == 2
+    assert record["llm"]["calls"] == 1
+    assert record["llm"]["cached_tokens"] == 50
+    assert record["llm"]["by_task"]["importance"]["prompt_tokens"] == 100
+    assert record["counters"] == {"llm_retries": 2, "prompt_cache_hits": 1}
+
+    prom = run.to_prometheus()
+    assert 'email_agents_llm_tokens{run="unit",task="importance",backend="openai",model="gpt-4.1",kind="cached"} 50' in prom
+    assert 'email_agents_events{run="unit",event="llm_retries"} 2' in prom
+
+    paths = run.write(str(tmp_path))
+    assert json.load(open(paths["json"]))["run"] == "unit"
+    assert 'email_agents_stage_calls{run="unit",stage="fetch"} 2' in open(paths["prom"]).read()
+
+
+class UsageBackend(Backend):
+    def chat(self, model, messages, **kwargs):
+        usage = types.SimpleNamespace(prompt_tokens=10, completion_tokens=5, prompt_tokens_details=None)
+        return types.SimpleNamespace(usage=usage)
+
+
+def test_router_records_every_call():
+    run = metrics.start_run("router")
+    router = LLMRouter({"openai": UsageBackend("openai")})
+    router.chat("categorize", [])
+    router.chat("report", [])
+    calls = run.to_dict()["llm"]["by_model"]
+    assert calls["openai/gpt-4.1"]["calls"] == 1
+    assert calls["openai/gpt-4"]["completion_tokens"] == 5
@@ -0,0 +1,65 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from email.message import EmailMessage
+
+from email_agents.mime_parse import fetch_spec, parse_message, parse_sent_headers
+
+
+def make_message(text=None, html=None, attachment=None, charset="utf-8"):
+    msg = EmailMessage()
+    msg["Subject"] = "Deck"
+    msg["From"] = "Anna <anna@example.com>"
+    msg["Date"] = "Thu, 1 Jan 2026 10:00:00 +0000"
+    if text is not None:
+        msg.set_content(text, charset=charset)
+    if html is not None:
+        if text is None:
+            msg.set_content(html, subtype="html")
+        else:
+            msg.add_alternative(html, subtype="html")
+    if attachment is not None:
+        msg.add_attachment(attachment, maintype="application", subtype="pdf", filename="deck.pdf")
+    return msg.as_bytes()
+
+
+def test_extracts_plain_text_and_skips_attachments():
+    raw = make_message(text="Can we meet on Friday?", attachment=b"\x00" * 200_000)
+    record = parse_message(raw, max_bytes=0)
+    assert record.to_dict() == {
+        "subject": "Deck",
+        "from": "Anna <anna@example.com>",
+        "received": "Thu, 01 Jan 2026 10:00:00 +0000",
+        "body": "Can we meet on Friday?",
+        "message_id": "",
+        "in_reply_to": "",
+        "references": "",
+        "to": "",
+    }
+
+
+def test_size_cap_keeps_leading_text_body():
+    raw = make_message(text="Budget attached.", attachment=b"\x01" * 500_000)
+    assert parse_message(raw, max_bytes=4096)["body"] == "Budget attached."
+
+
+def test_html_only_and_unknown_charset():
+    html = "<html><body><p>Hello&nbsp;there</p><script>x()</script><p>Bye</p></body></html>"
+    assert parse_message(make_message(html=html))["body"] == "Hello there\nBye"
+    raw = make_message(text="café").replace(b'charset="utf-8"', b'charset="x-unknown"')
+    assert parse_message(raw)["body"]
+
+
+def test_sent_headers_and_fetch_spec():
+    msg = EmailMessage()
+    msg["Subject"] = "Re: Deck"
+    msg["To"] = "Anna <anna@example.com>"
+    msg["Cc"] = "bob@example.com"
+    msg["Date"] = "Thu, 1 Jan 2026 11:00:00 +0000"
+    msg.set_content("ok")
+    record = parse_sent_headers(msg.as_bytes())
+    assert record["recipients"] == ["anna@example.com", "bob@example.com"]
+    assert fetch_spec(1024) == "(BODY.PEEK[]<0.1024>)"
+    assert fetch_spec(0) == "(BODY.PEEK[])"
+    assert fetch_spec(0, thread_id=True) == "(X-GM-THRID BODY.PEEK[])"
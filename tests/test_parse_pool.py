@@ -0,0 +1,18 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic_mailbox import generate_mailbox
+from email_agents import metrics
+from email_agents.parse_pool import parse_stream
+
+
+def test_pool_returns_the_same_records_in_order():
+    raws = [message["data"] for message in generate_mailbox(25, seed=3)]
+    local = [(tag, record.to_dict()) for tag, record in parse_stream(enumerate(raws), workers=0)]
+
+    run = metrics.start_run("test")
+    pooled = list(parse_stream(enumerate(raws), workers=2, batch=4))
+    assert [(tag, record.to_dict()) for tag, record in pooled] == local
+    assert all(record.body_decoded for _, record in pooled)
+    assert run.counters["parse_batches"] == 7 and run.stages["parse"]["calls"] == 7
@@ -0,0 +1,72 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import pipeline
+import send_mail2
+from benchmarks.fake_imap import FakeIMAPServer
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.fake_smtp import FakeSMTPServer
+from benchmarks.run import patched_transports, run_scenario
+from benchmarks.synthetic_mailbox import generate_mailbox, generate_sent_mailbox
+from email_agents import metrics
+from email_agents.mail import within_hours
+
+
+def test_within_hours_keeps_emails_without_a_date():
+    now = datetime(2026, 1, 3, 12, tzinfo=timezone.utc)
+    emails = [{"internaldate": (now - timedelta(hours=hours)).isoformat()} for hours in (1, 23, 25, 71)]
+    emails.append({"internaldate": ""})
+    assert within_hours(emails, 24, now=now) == [emails[0], emails[1], emails[4]]
+
+
+def test_pipeline_fetches_once_for_every_stage():
+    scripts = run_scenario("daily_scripts", 40, mailbox_hours=72)
+    pipeline = run_scenario("pipeline", 40, mailbox_hours=72)
+
+    assert pipeline["imap"]["logins"] == 1 and scripts["imap"]["logins"] == 3
+    assert pipeline["imap"]["commands"] < scripts["imap"]["commands"]
+    assert pipeline["imap"]["body_bytes"] < scripts["imap"]["body_bytes"]
+    # Same model work: triage of the last 24 hours, categorization of all 72, one report
+    assert pipeline["llm"]["requests"] == scripts["llm"]["requests"]
+    assert pipeline["llm_usage"]["calls"] == scripts["llm_usage"]["calls"]
+
+
+def test_resume_after_a_crash_in_categorize_keeps_every_verdict(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    inbox = generate_mailbox(30, hours=72, seed=3)
+    mailboxes = {"INBOX": inbox, "Sent": generate_sent_mailbox(inbox, seed=3)}
+    with FakeIMAPServer(mailboxes) as imap, FakeSMTPServer() as smtp, FakeLLMServer() as llm, patched_transports():
+        for key, value in {"EMAIL_USER": "me@example.com", "EMAIL_PASSWORD": "test", "IMAP_SERVER": imap.host,
+                           "IMAP_PORT": str(imap.port), "IMAP_SENT_FOLDER": "Sent", "SMTP_SERVER": smtp.host,
+                           "SMTP_PORT": str(smtp.port), "OPENAI_API_KEY": "test", "OPENAI_BASE_URL": llm.base_url,
+                           "LOCAL_LLM_BASE_URL": ""}.items():
+            monkeypatch.setenv(key, value)
+
+        # Every email is categorized and journaled, then the run dies writing the results
+        write_results = send_mail2.categorize_results
+
+        def crash(emails, analyses, complete=True, **kwargs):
+            if complete:
+                raise RuntimeError("crashed")
+            return write_results(emails, analyses, complete, **kwargs)
+
+        monkeypatch.setattr(send_mail2, "categorize_results", crash)
+        with pytest.raises(RuntimeError):
+            pipeline.run_pipeline(respond=False)
+        paid = {task: sum(1 for call in metrics.current().llm_calls if call["task"] == task)
+                for task in ("importance", "categorize")}
+        assert paid["importance"] and paid["categorize"]
+
+        monkeypatch.setattr(send_mail2, "categorize_results", write_results)
+        capsys.readouterr()
+        pipeline.run_pipeline(resume=True, respond=False)
+        # The inbox is read back from the last fetch and neither stage asks the model again
+        assert "Resuming previous run" in capsys.readouterr().out
+        assert not [call for call in metrics.current().llm_calls if call["task"] in paid]
+        assert os.path.exists(send_mail2.CATEGORIZED_EMAILS_JSON)
+        assert not os.path.exists(send_mail2.CATEGORIZE_CHECKPOINT)
@@ -2,6 +2,8 @@ import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import imaplib
+import smtplib
 import types
 import important_email2
 import send_mail2
@@ -48,7 +50,7 @@ def dummy_smtp(server, port):
 
 
 def test_placeholder_get_emails(monkeypatch):
-    monkeypatch.setattr(important_email2.imaplib, 'IMAP4_SSL', dummy_imap)
+    monkeypatch.setattr(imaplib, 'IMAP4_SSL', dummy_imap)
     monkeypatch.setenv('EMAIL_USER', 'user')
     monkeypatch.setenv('EMAIL_PASSWORD', 'pass')
     emails = important_email2.get_emails(hours=1)
@@ -56,7 +58,7 @@ def test_placeholder_get_emails(monkeypatch):
 
 
 def test_placeholder_send_email(monkeypatch):
-    monkeypatch.setattr(send_mail2.smtplib, 'SMTP_SSL', dummy_smtp)
+    monkeypatch.setattr(smtplib, 'SMTP_SSL', dummy_smtp)
     monkeypatch.setenv('EMAIL_USER', 'user')
     monkeypatch.setenv('EMAIL_PASSWORD', 'pass')
     result = send_mail2.send_email('Test', 'body', 'test@example.com')
@@ -0,0 +1,93 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+
+import important_email2
+from benchmarks.fake_llm import classify_importance
+from benchmarks.synthetic_mailbox import generate_mailbox
+from email_agents import metrics
+from email_agents.checkpoint import Checkpoint
+from email_agents.llm_backend import Backend, LLMRouter
+from email_agents.mime_parse import parse_message
+from email_agents.models import EmailImportance
+from email_agents.preclassifier import PreClassifier, features
+
+
+def _verdict(email):
+    """What the fake model answers for an email"""
+    section = f"subject: {email['subject']}\nfrom: {email['from']}\nbody:\n{email['body']}".lower()
+    return EmailImportance(**classify_importance(section))
+
+
+def _inbox(size, seed):
+    return [parse_message(message["data"]) for message in generate_mailbox(size, seed=seed)]
+
+
+def test_features_are_stable_hashes():
+    email = {"subject": "Weekly digest", "from": "News <news@shop.com>", "body": "Deals deals"}
+    assert features(email) == features(dict(email))
+    assert sum(features(email).values()) == 4 + 3 + 2  # words, bigrams, sender and domain
+
+
+def test_sender_reputation_settles_only_consistent_senders_the_words_agree_with():
+    model = PreClassifier("importance", min_samples=0, sender_min=3)
+    low = EmailImportance(importance="low", reason="r", needs_response=False, time_sensitive=False, topics=[])
+    respond = EmailImportance(importance="high", reason="r", needs_response=True, time_sensitive=False, topics=[])
+    model.learn([({"from": "no-reply@shop.com", "subject": f"Deal {i}", "body": "weekly deals"}, low)
+                 for i in range(3)])
+    model.learn([({"from": "ann@x.com", "subject": "FYI", "body": ""}, low)] * 4
+                + [({"from": "ann@x.com", "subject": "Contract", "body": ""}, respond)])
+    model.learn([({"from": f"client{i}@corp.com", "subject": "Urgent: invoice overdue",
+                   "body": "please confirm payment today"}, respond) for i in range(3)])
+
+    settled, remaining = model.settle([
+        {"from": "Shop <no-reply@shop.com>", "subject": "New deal", "body": "weekly deals"},
+        {"from": "ann@x.com", "subject": "FYI again", "body": ""},
+        # Always low before, but reads like the emails that needed a response
+        {"from": "no-reply@shop.com", "subject": "Urgent: invoice overdue", "body": "please confirm payment today"}])
+    [(email, analysis)] = settled
+    assert email["subject"] == "New deal" and analysis.importance == "low" and not analysis.needs_response
+    assert [email["subject"] for email in remaining] == ["FYI again", "Urgent: invoice overdue"]
+
+
+def test_naive_bayes_settles_confident_low_importance_emails_quickly():
+    model = PreClassifier("importance", sender_min=10_000)
+    model.learn((email, _verdict(email)) for email in _inbox(600, seed=1))
+
+    inbox = _inbox(300, seed=2)
+    start = time.perf_counter()
+    settled, remaining = model.settle(inbox)
+    per_email = (time.perf_counter() - start) / len(inbox)
+
+    assert len(settled) > len(inbox) / 3
+    assert all(_verdict(email).importance == "low" and not _verdict(email).needs_response for email, _ in settled)
+    assert per_email < 0.002
+
+
+def test_triage_learns_each_run_and_reports_calls_avoided(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("email_agents.preclassifier.PRECLASSIFIER_MIN_SAMPLES", 100)
+    llm = LLMRouter({"openai": Backend("openai", max_concurrency=1)})
+    calls = []
+    learned = 0
+
+    def analyze(llm, email):
+        calls.append(email["subject"])
+        return _verdict(email)
+
+    monkeypatch.setattr(important_email2, "analyze_email_importance", analyze)
+
+    for seed in (1, 2):
+        run = metrics.start_run("triage")
+        calls.clear()
+        important_email2.triage(llm, _inbox(300, seed=seed), [], Checkpoint("checkpoint.jsonl"))
+        summary = run.to_dict()["llm"]["preclassifier"]["importance"]
+        assert summary["seen"] - summary["settled"] == len(calls)
+        learned += len(calls)
+
+    assert summary["calls_avoided_rate"] > 0.3
+    assert "settled locally" in run.summary()
+    # Only the model's verdicts are learned, never the local ones
+    assert PreClassifier.load("importance").samples == learned
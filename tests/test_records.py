@@ -0,0 +1,67 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+from email.message import EmailMessage
+
+from email_agents import mail
+from email_agents.llm_retry import RetryQueue
+from email_agents.mime_parse import parse_message
+from email_agents.records import EmailRecord
+from email_agents.threads import latest_per_thread
+
+
+def _raw(subject="Plan", body="Shall we meet?", html=False, **headers):
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = "Ann <ann@example.com>"
+    msg["To"] = "me@example.com"
+    msg["Date"] = "Mon, 05 Jan 2026 09:00:00 +0000"
+    for name, value in headers.items():
+        msg[name.replace("_", "-")] = value
+    msg.set_content(body, subtype="html" if html else "plain")
+    return msg.as_bytes()
+
+
+def test_body_is_decoded_on_first_access():
+    record = parse_message(_raw(body="<p>Hello&nbsp;there</p>", html=True))
+    assert not record.body_decoded
+    assert record["subject"] == "Plan" and record.get("from") == "Ann <ann@example.com>"
+    assert not record.body_decoded
+    assert record["body"] == "Hello there"
+    assert record.body_decoded
+
+
+def test_records_behave_like_the_email_dicts():
+    record = parse_message(_raw())
+    assert "thread_size" not in record and record.get("thread_size", 1) == 1
+    record["internaldate"] = "2026-01-05T09:00:00+00:00"
+    assert record.to_dict()["internaldate"] == "2026-01-05T09:00:00+00:00"
+    assert dict(record)["to"] == "me@example.com"
+    assert not hasattr(record, "__dict__")
+
+
+def test_replace_and_threads_keep_older_bodies_undecoded():
+    first = parse_message(_raw(Message_ID="<a@x>"))
+    second = parse_message(_raw("Re: Plan", "Yes.\n\nOn Mon Ann wrote:\n> Shall we meet?",
+                                Message_ID="<b@x>", In_Reply_To="<a@x>"))
+    [latest] = latest_per_thread([first, second])
+    assert isinstance(latest, EmailRecord) and latest["body"] == "Yes." and latest["thread_size"] == 2
+    assert not first.body_decoded
+    copy = first.replace(thread_size=3)
+    assert not copy.body_decoded and copy["body"] == "Shall we meet?"
+
+
+def test_records_round_trip_through_the_text_file_and_retry_queue(tmp_path):
+    record = parse_message(_raw(Message_ID="<a@x>"))
+    path = str(tmp_path / "emails.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        mail.write_email(f, record)
+    [read] = mail.read_emails(path)
+    assert read.to_dict() == record.to_dict()
+
+    queue = RetryQueue(str(tmp_path / "queue.json"))
+    queue.replace("importance", [record])
+    with open(queue.path, encoding="utf-8") as f:
+        assert json.load(f)["importance"][0]["email"]["message_id"] == "<a@x>"
@@ -0,0 +1,44 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import email_responder2
+from benchmarks.fake_llm import FakeLLMServer
+from email_agents import metrics
+from email_agents.llm_backend import Backend, LLMRouter
+
+EMAIL = {"subject": "Contract question", "from": "Ann <ann@example.com>", "email_address": "ann@example.com",
+         "preview": "Could you confirm the contract terms before Friday? " * 20, "already_responded": False}
+
+
+def test_edits_build_on_the_current_draft_and_reuse_the_cached_prefix(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    answers = iter(["edit", "make it shorter", "edit", "mention Friday", "y"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    sent = []
+    monkeypatch.setattr(email_responder2, "send_email", lambda subject, body, to: sent.append(body) or True)
+
+    with FakeLLMServer(cache_min_tokens=0) as server:
+        llm = LLMRouter({"openai": Backend("openai", base_url=server.base_url, api_key="test", max_concurrency=1)})
+        run = metrics.start_run("test")
+        email_responder2.respond(llm, [EMAIL])
+        record = run.to_dict()
+
+    # Both edits survive: the second round edited the first round's draft
+    [body] = sent
+    assert "(Edited: make it shorter)" in body and "(Edited: mention Friday)" in body
+    assert record["responder"] == {"sent": 1, "edit_rounds": 2, "rounds_per_sent_email": 2.0}
+    assert record["timings"]["edit_round"]["count"] == 2
+    assert record["llm"]["calls"] == 3 and record["llm"]["cached_tokens"] > 0
+    assert record["counters"]["prompt_cache_hits"] == 2
+    assert "edit p50" in run.summary()
+
+
+def test_conversation_is_unchanged_when_an_edit_fails():
+    class Failing:
+        def chat(self, *args, **kwargs):
+            raise RuntimeError("down")
+
+    conversation = [{"role": "assistant", "content": "Subject: Re: Hi\n\nDraft"}]
+    assert email_responder2.generate_response(Failing(), EMAIL, "shorter", conversation) is None
+    assert len(conversation) == 1
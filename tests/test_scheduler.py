@@ -0,0 +1,101 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import time
+from datetime import datetime, timezone
+
+import important_email2
+import send_mail2
+from email_agents import mail, metrics
+from email_agents.checkpoint import Checkpoint
+from email_agents.llm_backend import Backend, LLMRouter
+from email_agents.llm_retry import RetryQueue
+from email_agents.models import EmailImportance
+from email_agents.scheduler import Budget, Scheduler
+
+NOW = datetime.now(timezone.utc)
+
+
+def _email(subject, sender, to="me@example.com", hours_ago=1, **fields):
+    received = NOW.timestamp() - hours_ago * 3600
+    return dict({"subject": subject, "from": sender, "to": to, "body": "Can we talk?",
+                 "internaldate": datetime.fromtimestamp(received, timezone.utc).isoformat()}, **fields)
+
+
+INBOX = [
+    _email("Newsletter", "News <noreply@shop.com>", to="list@shop.com"),
+    _email("Team update", "Cy <cy@corp.com>", to="me@example.com, a@corp.com, b@corp.com"),
+    _email("Old question", "Di <di@corp.com>", hours_ago=60),
+    _email("Contract", "Bo <bo@client.com>", hours_ago=30),
+    _email("Busy thread", "Ed <ed@corp.com>", hours_ago=20, thread_size=4),
+    _email("Quick question", "Al <al@corp.com>"),
+]
+
+
+def test_known_direct_recent_and_busy_mail_comes_first():
+    scheduler = Scheduler("importance", "me@example.com", {"bo@client.com"}, now=NOW)
+    assert [email["subject"] for email in scheduler.order(INBOX)] == [
+        "Contract", "Busy thread", "Quick question", "Old question", "Team update", "Newsletter"]
+
+
+def test_budget_reports_the_limit_reached():
+    run = metrics.start_run("test")
+    assert Budget("importance").exhausted() is None
+    budget = Budget("importance", max_tokens=100, max_cost=1.0)
+    run.record_llm_call("categorize", "openai", "gpt-4.1", 0.1, {"prompt_tokens": 500, "completion_tokens": 0})
+    assert budget.exhausted() is None
+    run.record_llm_call("importance", "openai", "gpt-4.1", 0.1, {"prompt_tokens": 90, "completion_tokens": 10})
+    assert budget.exhausted() == "tokens"
+    deadline = Budget("importance", deadline=0.01)
+    time.sleep(0.02)
+    assert deadline.exhausted() == "deadline"
+
+
+def test_triage_defers_the_least_important_mail_when_the_budget_runs_out(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("EMAIL_USER", "me@example.com")
+    monkeypatch.setenv("SCHEDULE_MAX_TOKENS", "250")
+    llm = LLMRouter({"openai": Backend("openai", max_concurrency=1)})
+    calls = []
+
+    def analyze(llm, email):
+        calls.append(email["subject"])
+        metrics.current().record_llm_call("importance", "openai", "gpt-4.1", 0.1,
+                                          {"prompt_tokens": 100, "completion_tokens": 20})
+        return EmailImportance(importance="high", reason="r", needs_response=True, time_sensitive=False, topics=[])
+
+    monkeypatch.setattr(important_email2, "analyze_email_importance", analyze)
+    sent = [{"recipients": ["bo@client.com"]}]
+    inbox = [dict(email, received=email["internaldate"]) for email in INBOX]
+    run = metrics.start_run("triage")
+    _, needs_response, queued = important_email2.triage(llm, inbox, sent, Checkpoint("checkpoint.jsonl"))
+
+    # The first three calls use up the 250 tokens; the rest wait for the next run.
+    # Triage counts the thread itself, so the lone "Busy thread" message ranks by recency only
+    assert calls == ["Contract", "Quick question", "Busy thread"]
+    # Mail from someone we wrote to counts as answered, which the report lists last
+    assert [email["subject"] for email in needs_response] == ["Quick question", "Busy thread", "Contract"]
+    assert [(entry["email"]["subject"], entry["attempts"], entry["deferred"]) for entry in queued] == [
+        ("Old question", 0, True), ("Team update", 0, True), ("Newsletter", 0, True)]
+    assert RetryQueue().pending("importance") == queued
+    with open(important_email2.NEEDS_RESPONSE_JSON, encoding="utf-8") as f:
+        assert json.load(f)["deferred"] == 3
+    assert run.counters["deferred_importance"] == 3 and run.counters["deferred_importance_tokens"] == 1
+    assert "importance deferred 3 to the next run" in run.summary()
+
+
+def test_sort_emails_ranks_with_sent_mail_fresh_and_resumed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sent = [{"to": "bo@client.com", "subject": "Contract"}]
+    seen = []
+    monkeypatch.setattr(mail, "fetch_mailboxes", lambda hours, days, path: (open(path, "w").close(), sent))
+    monkeypatch.setattr(mail, "fetch_sent", lambda days: sent)
+    monkeypatch.setattr(send_mail2, "categorize",
+                        lambda llm, emails, checkpoint, sent_emails=(): seen.append(sent_emails) or ([], ([], [], []), []))
+    monkeypatch.setattr(send_mail2, "print_category_summary", lambda *results: None)
+
+    send_mail2.sort_emails()
+    send_mail2.sort_emails(resume=True)
+    assert seen == [sent, sent]
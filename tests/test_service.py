@@ -0,0 +1,170 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import service
+from benchmarks.fake_imap import FakeIMAPServer
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.fake_smtp import FakeSMTPServer
+from benchmarks.run import patched_transports
+from benchmarks.synthetic_mailbox import generate_mailbox, generate_sent_mailbox
+from email_agents import metrics
+
+
+def _call(base, method, path, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(base + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def _sync(base):
+    status, job = _call(base, "POST", "/sync")
+    assert status == 202
+    while job["status"] in ("queued", "running"):
+        time.sleep(0.05)
+        job = _call(base, "GET", f"/jobs/{job['id']}")[1]
+    assert job["status"] == "done", job
+    return job["result"]
+
+
+def test_service_drafts_edits_and_sends_over_warm_sessions(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    inbox = generate_mailbox(40, seed=5)
+    mailboxes = {"INBOX": inbox, "Sent": generate_sent_mailbox(inbox, seed=5)}
+    with FakeIMAPServer(mailboxes) as imap, FakeSMTPServer() as smtp, FakeLLMServer() as llm, patched_transports():
+        for key, value in {"EMAIL_USER": "me@example.com", "EMAIL_PASSWORD": "test", "IMAP_SERVER": imap.host,
+                           "IMAP_PORT": str(imap.port), "IMAP_SENT_FOLDER": "Sent", "SMTP_SERVER": smtp.host,
+                           "SMTP_PORT": str(smtp.port), "OPENAI_API_KEY": "test", "OPENAI_BASE_URL": llm.base_url,
+                           "LOCAL_LLM_BASE_URL": ""}.items():
+            monkeypatch.setenv(key, value)
+        process_run = metrics.current()
+        triage = service.TriageService.from_env()
+        server = service.make_server(triage, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            assert _sync(base)["needs_response"] > 0
+            items = _call(base, "GET", "/needs-response")[1]["items"]
+            key = next(item["id"] for item in items if "<" in item["from"] and not item["already_responded"])
+            assert _call(base, "GET", f"/needs-response/{key}/draft")[0] == 404
+
+            status, draft = _call(base, "POST", f"/needs-response/{key}/draft", {})
+            assert status == 200 and draft["subject"] and draft["edit_rounds"] == 0
+            status, edited = _call(base, "POST", f"/needs-response/{key}/draft", {"instructions": "Mention Friday"})
+            assert status == 200 and edited["edit_rounds"] == 1 and edited["body"] != draft["body"]
+            assert _call(base, "GET", f"/needs-response/{key}")[1]["draft"] == edited
+
+            status, sent = _call(base, "POST", f"/needs-response/{key}/send")
+            assert status == 200 and sent["sent"] and smtp.stats["messages"] == 1
+            assert _call(base, "POST", f"/needs-response/{key}/send")[0] == 409
+
+            # A second sync and send reuse the open IMAP and SMTP connections
+            _sync(base)
+            other = next(item["id"] for item in _call(base, "GET", "/needs-response")[1]["items"]
+                         if "<" in item["from"] and item["id"] != key)
+            _call(base, "POST", f"/needs-response/{other}/draft")
+            assert _call(base, "POST", f"/needs-response/{other}/send")[0] == 200
+            assert imap.stats["logins"] == 1 and smtp.stats["logins"] == 1
+
+            # Every job writes a run of its own, model calls from the pool threads included,
+            # and the process-wide run is never swapped
+            assert metrics.current() is process_run
+
+            def record(kind):
+                with open(tmp_path / "metrics" / f"service_{kind}.json", encoding="utf-8") as f:
+                    return json.load(f)
+
+            assert record("sync")["llm"]["by_task"]["importance"]["calls"] > 0
+            assert record("draft")["llm"]["calls"] == 1
+            assert record("send")["responder"]["sent"] == 1 and record("send")["llm"]["calls"] == 0
+
+            stats = _call(base, "GET", "/stats")[1]
+            assert stats["POST /needs-response/{id}/draft"]["requests"] == 3
+            assert stats["POST /needs-response/{id}/send"]["status"] == {"200": 2, "409": 1}
+            assert _call(base, "GET", "/needs-response/unknown")[0] == 404
+        finally:
+            server.shutdown()
+            server.server_close()
+            triage.close()
+
+
+def test_jobs_beyond_the_queue_bound_are_refused(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    triage = service.TriageService(llm=None, session=None, workers=1, max_queued=2)
+    release = threading.Event()
+    try:
+        futures = [triage.submit("wait", release.wait)[1] for _ in range(2)]
+        with pytest.raises(service.Busy):
+            triage.submit("wait", release.wait)
+        assert triage.queued() == 2 and triage.rejected == 1
+    finally:
+        release.set()
+    assert all(future.result(timeout=5) for future in futures)
+    assert triage.submit("wait", release.wait)[1].result(timeout=5)
+    triage._pool.shutdown()
+    triage._sync_pool.shutdown()
+
+
+class _SlowSession:
+    def __init__(self):
+        self.sent = []
+
+    def send_email(self, subject, body, recipient_email):
+        time.sleep(0.2)
+        self.sent.append(recipient_email)
+        return True
+
+    def close(self):
+        pass
+
+
+def test_concurrent_sends_of_one_draft_send_it_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    session = _SlowSession()
+    triage = service.TriageService(llm=None, session=session, workers=2)
+    triage.items["k"] = {"subject": "Contract", "from": "Alice <alice@example.com>", "body": "Can you sign?",
+                         "already_responded": False}
+    triage._draft_state("k")["text"] = "Subject: Re: Contract\n\nSigned, thanks."
+    try:
+        futures = [triage.submit("send", triage.send, "k")[1] for _ in range(2)]
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result(timeout=5)["sent"])
+            except service.Conflict:
+                outcomes.append("409")
+        assert sorted(outcomes, key=str) == ["409", True] and session.sent == ["alice@example.com"]
+        assert triage.draft("k") is None and triage.items["k"]["already_responded"]
+    finally:
+        triage.close()
+
+
+def test_only_draft_state_conflicts_answer_409():
+    from concurrent.futures import Future
+
+    from email_agents.cassette import CassetteMiss
+
+    def failed(error):
+        future = Future()
+        future.set_exception(error)
+        return future
+
+    wait = service._Handler._wait
+    assert wait(None, failed(service.Conflict("There is no draft to send")))[0] == 409
+    assert wait(None, failed(service.Unprocessable("No email address found")))[0] == 422
+    # A replay miss or a bad reply is the service's fault, not a conflict
+    assert wait(None, failed(CassetteMiss("no recorded call")))[0] == 500
+    assert wait(None, failed(ValueError("reply does not match the schema")))[0] == 500
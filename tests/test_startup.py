@@ -0,0 +1,12 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.startup import STARTUP_BUDGET_MS, check
+
+
+def test_entry_points_start_fast_without_heavy_imports():
+    report = check(repeat=3)
+    for module, entry in report.items():
+        assert entry["heavy_modules"] == [], f"{module} imports {entry['heavy_modules']} at startup"
+        assert entry["import_ms"] < STARTUP_BUDGET_MS, f"{module} took {entry['import_ms']} ms to import"
@@ -0,0 +1,53 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import important_email2
+import send_mail2
+from benchmarks.fake_llm import FakeLLMServer
+from email_agents import metrics, models
+from email_agents.llm_backend import Backend, LLMRouter
+from email_agents.models import EmailAnalysis, EmailImportance, response_format, strict_schema
+
+EMAIL = {"subject": "Weekly digest", "from": "News <news@shop.com>", "received": "today",
+         "body": "Top deals this week. Unsubscribe at any time."}
+
+
+def _router(server):
+    return LLMRouter({"openai": Backend("openai", base_url=server.base_url, api_key="test", max_concurrency=1)})
+
+
+def test_strict_schema_requires_every_field_and_caps_topics():
+    schema = strict_schema(EmailImportance)
+    assert schema["required"] == list(schema["properties"]) and schema["additionalProperties"] is False
+    assert schema["properties"]["topics"]["maxItems"] == models.MAX_TOPICS
+    assert "maxLength" not in str(schema) and "default" not in str(schema)
+    assert strict_schema(EmailAnalysis, nullable=("reason",))["properties"]["reason"] == {
+        "anyOf": [{"type": "string"}, {"type": "null"}]}
+    assert response_format(EmailAnalysis)["json_schema"]["strict"] is True
+
+
+def test_long_reasons_and_topics_are_clipped_not_rejected():
+    analysis = EmailImportance(importance="low", reason="x" * 1000, needs_response=False, time_sensitive=False,
+                               topics=["a", "b", "c", "d", "e"])
+    assert len(analysis.reason) == models.REASON_MAX_CHARS and len(analysis.topics) == models.MAX_TOPICS
+    assert EmailAnalysis.model_validate_json('{"category":"other","confidence":0.7,"reason":null}').reason == ""
+
+
+def test_strict_replies_always_parse_and_are_shorter(monkeypatch):
+    monkeypatch.setattr(models, "OMIT_LOW_REASONS", True)
+    with FakeLLMServer(off_schema_rate=1.0) as server:
+        run = metrics.start_run("test")
+        analysis = important_email2.analyze_email_importance(_router(server), EMAIL)
+        assert analysis.importance == "low" and analysis.reason == "" and len(analysis.topics) <= models.MAX_TOPICS
+        strict_tokens = run.to_dict()["llm"]["completion_tokens"]
+
+        monkeypatch.setattr(models, "STRICT_SCHEMA", False)
+        monkeypatch.setattr(models, "OMIT_LOW_REASONS", False)
+        run = metrics.start_run("test")
+        assert send_mail2.analyze_email(_router(server), EMAIL) is None
+        assert important_email2.analyze_email_importance(_router(server), EMAIL) is None
+        record = run.to_dict()["llm"]
+    assert record["parse_failures"]["importance"] == {"replies": 1, "failures": 1, "failure_rate": 1.0}
+    assert record["parse_failures"]["categorize"]["failures"] == 1
+    assert strict_tokens < record["by_task"]["importance"]["completion_tokens"]
@@ -0,0 +1,68 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.run import run_scenario
+from benchmarks.synthetic_mailbox import generate_mailbox
+from email_agents.mime_parse import parse_message
+from email_agents.threads import group_threads, latest_per_thread, new_content, normalize_subject
+
+
+def _email(subject, sender="Ann <ann@example.com>", received="", **headers):
+    return {"subject": subject, "from": sender, "to": "me@example.com", "received": received,
+            "body": "", **headers}
+
+
+def test_normalize_subject_strips_reply_and_forward_prefixes():
+    assert normalize_subject("RE: Fwd:  Re[2]: Quarterly   Plan") == "quarterly plan"
+    assert normalize_subject("Quarterly plan") == "quarterly plan"
+
+
+def test_new_content_drops_quoted_history():
+    body = "Sounds good, see you then.\n\nOn Mon, 5 Jan 2026 Ann wrote:\n> Shall we meet?\n> Thanks"
+    assert new_content(body) == "Sounds good, see you then."
+    assert new_content("Top\n-----Original Message-----\nFrom: Ann") == "Top"
+    # Nothing but quotes: keep the message rather than send an empty body
+    assert new_content("> only a quote") == "> only a quote"
+
+
+def test_groups_by_references_thread_id_and_subject_fallback():
+    root = _email("Plan", message_id="<a@x>", received="Mon, 05 Jan 2026 09:00:00 +0000")
+    reply = _email("Re: Plan", message_id="<b@x>", in_reply_to="<a@x>", references="<a@x>",
+                   received="Mon, 05 Jan 2026 10:00:00 +0000")
+    # A later reply whose parent we never received still joins through References
+    late = _email("Re: Plan", message_id="<d@x>", references="<a@x> <c@x>",
+                  received="Mon, 05 Jan 2026 12:00:00 +0000")
+    gmail_a = _email("Invoice", message_id="<e@x>", thread_id="77")
+    gmail_b = _email("Your invoice", message_id="<f@x>", thread_id="77")
+    no_headers = _email("fw: Lunch")
+    no_headers_again = _email("Lunch")
+    other_sender = _email("Lunch", sender="Bob <bob@example.com>")
+
+    threads = group_threads([late, gmail_a, root, no_headers, reply, gmail_b, no_headers_again, other_sender])
+
+    assert [root, reply, late] in threads
+    assert [gmail_a, gmail_b] in threads
+    assert [no_headers, no_headers_again] in threads
+    assert [other_sender] in threads
+    assert len(threads) == 4
+
+
+def test_latest_per_thread_keeps_the_newest_message():
+    first = _email("Plan", message_id="<a@x>", internaldate="2026-01-05T09:00:00+00:00", body="Shall we meet?")
+    second = _email("Re: Plan", message_id="<b@x>", in_reply_to="<a@x>",
+                    internaldate="2026-01-05T10:00:00+00:00",
+                    body="Yes, Friday.\n\nOn Mon Ann wrote:\n> Shall we meet?")
+    [latest] = latest_per_thread([second, first])
+    assert latest["message_id"] == "<b@x>"
+    assert latest["body"] == "Yes, Friday."
+    assert latest["thread_size"] == 2
+
+
+def test_triage_classifies_each_thread_once():
+    mailbox = generate_mailbox(40)
+    threads = latest_per_thread([parse_message(message["data"]) for message in mailbox])
+    assert len(threads) < 40
+
+    result = run_scenario("find_important_emails", 40)
+    assert result["llm"]["requests"] == len(threads)